@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Baseline computation benchmarks, for parameters commonly used in the GUI.
+"""
+import numpy as np
+
+from skued import baseline_dt
+
+from dtgui.baseline import baseline, baseline_stack
+from dtgui.indexing import background_regions
+from dtgui.reconstruction import approx_rec, reconstruction_operator
+
+from .common import synthetic_spectrum
+
+
+class TimeBaseline:
+    """ Baseline of a single spectrum, as computed by the controller """
+
+    params = (
+        [2 ** 10, 2 ** 14, 2 ** 18],
+        ["qshift1", "qshift3"],
+        [1, 4],
+        [10, 100],
+    )
+    param_names = ["points", "wavelet", "level", "max_iter"]
+    timeout = 600
+
+    def setup(self, points, wavelet, level, max_iter):
+        _, self.y = synthetic_spectrum(points)
+        self.kwargs = dict(
+            first_stage="sym6",
+            wavelet=wavelet,
+            level=level,
+            max_iter=max_iter,
+            mode="constant",
+        )
+
+    def time_baseline(self, points, wavelet, level, max_iter):
+        baseline(self.y, **self.kwargs)
+
+    def time_baseline_converged(self, points, wavelet, level, max_iter):
+        baseline(self.y, tol=0, **self.kwargs)
+
+    def time_skued_baseline_dt(self, points, wavelet, level, max_iter):
+        baseline_dt(self.y, **self.kwargs)
+
+    def peakmem_baseline(self, points, wavelet, level, max_iter):
+        baseline(self.y, **self.kwargs)
+
+
+class TimeReconstruction:
+    """ Approximate reconstructions, which are the bulk of baseline computations """
+
+    params = ([2 ** 10, 2 ** 14, 2 ** 18], [1, 4])
+    param_names = ["points", "level"]
+
+    def setup(self, points, level):
+        _, self.y = synthetic_spectrum(points)
+        self.kwargs = dict(
+            first_stage="sym6", wavelet="qshift3", mode="constant", level=level
+        )
+        self.operator = reconstruction_operator(points, **self.kwargs)
+
+    def time_approx_rec(self, points, level):
+        approx_rec(self.y, **self.kwargs)
+
+    def time_operator(self, points, level):
+        # Operators are only available for low decomposition levels
+        if self.operator is None:
+            raise NotImplementedError
+        self.operator(self.y)
+
+    def track_deviation_from_skued(self, points, level):
+        # Largest difference with scikit-ued, relative to the largest baseline value
+        params = dict(self.kwargs, wavelet="qshift1", max_iter=100)
+        expected = baseline_dt(self.y, **params)
+        return np.max(np.abs(baseline(self.y, **params) - expected)) / np.max(
+            np.abs(expected)
+        )
+
+    track_deviation_from_skued.unit = "relative"
+
+
+class TimePrecision:
+    """ Baselines computed in single and double precision """
+
+    params = ([2 ** 14, 2 ** 18], [1, 4], ["double", "single"])
+    param_names = ["points", "level", "precision"]
+    timeout = 600
+
+    def setup(self, points, level, precision):
+        _, self.y = synthetic_spectrum(points)
+        self.kwargs = dict(
+            first_stage="sym6",
+            wavelet="qshift3",
+            level=level,
+            max_iter=100,
+            precision=precision,
+        )
+
+    def time_baseline(self, points, level, precision):
+        baseline(self.y, **self.kwargs)
+
+    def peakmem_baseline(self, points, level, precision):
+        baseline(self.y, **self.kwargs)
+
+    def track_deviation_from_double(self, points, level, precision):
+        # Largest difference with double precision, relative to the largest data value
+        expected = baseline(self.y, **dict(self.kwargs, precision="double"))
+        deviation = np.abs(baseline(self.y, **self.kwargs) - expected)
+        return np.max(deviation) / np.max(np.abs(self.y))
+
+    track_deviation_from_double.unit = "relative"
+
+
+class TimeBaselineStack:
+    """ Baselines of a stack of spectra sharing the same abscissa """
+
+    params = ([16, 256], [2 ** 8, 2 ** 12])
+    param_names = ["spectra", "points"]
+    timeout = 600
+
+    def setup(self, spectra, points):
+        _, y = synthetic_spectrum(points)
+        self.stack = np.outer(np.linspace(1, 2, spectra), y)
+        self.kwargs = dict(
+            first_stage="sym6", wavelet="qshift3", level=1, max_iter=100
+        )
+
+    def time_baseline_stack(self, spectra, points):
+        baseline_stack(self.stack, **self.kwargs)
+
+    def time_one_by_one(self, spectra, points):
+        for row in self.stack:
+            baseline(row, **self.kwargs)
+
+    def peakmem_baseline_stack(self, spectra, points):
+        baseline_stack(self.stack, **self.kwargs)
+
+
+class TimeBackgroundMarkers:
+    """ Resolution of background markers into indices, and their use in baselines """
+
+    params = ([10 ** 4, 10 ** 6], [10, 100])
+    param_names = ["points", "markers"]
+
+    def setup(self, points, markers):
+        self.x, self.y = synthetic_spectrum(points)
+        self.points = list(np.linspace(self.x[0], self.x[-1], markers))
+        width = (self.x[-1] - self.x[0]) / (10 * markers)
+        self.regions = [(p, p + width) for p in self.points]
+
+    def time_resolve_points(self, points, markers):
+        background_regions(self.x, self.points)
+
+    def time_resolve_regions(self, points, markers):
+        background_regions(self.x, self.regions)
+
+    def time_resolve_argmin(self, points, markers):
+        # Linear search, for reference
+        sorted(int(np.argmin(np.abs(m - self.x))) for m in self.points)
+
+    def time_baseline_with_regions(self, points, markers):
+        baseline(
+            self.y,
+            max_iter=10,
+            level=1,
+            wavelet="qshift3",
+            background_regions=background_regions(self.x, self.regions),
+        )
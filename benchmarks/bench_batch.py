@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Batch baseline-removal benchmarks. Processes are spawned for every run,
+as is the case when batch processing from the GUI.
+"""
+import os.path
+import tempfile
+
+from dtgui.cli import DEFAULT_PARAMETERS, block_gui_imports
+from dtgui.engine import BatchProcessor, process_files
+
+from .common import write_spectra
+
+
+class TimeBatch:
+    """ Baseline-removal of many files, from reading to writing """
+
+    params = ([64], [2 ** 10, 2 ** 14])
+    param_names = ["files", "points"]
+    timeout = 600
+
+    def setup(self, files, points):
+        self.tempdir = tempfile.TemporaryDirectory()
+        inputs = os.path.join(self.tempdir.name, "inputs")
+        os.mkdir(inputs)
+        self.files = write_spectra(inputs, files, points)
+        self.output = os.path.join(self.tempdir.name, "outputs")
+        os.mkdir(self.output)
+
+    def teardown(self, files, points):
+        self.tempdir.cleanup()
+
+    def time_process_files_serial(self, files, points):
+        process_files(self.files, self.output, DEFAULT_PARAMETERS)
+
+    def time_batch_processor(self, files, points):
+        processor = BatchProcessor(
+            DEFAULT_PARAMETERS, self.output, initializer=block_gui_imports
+        )
+        for _ in processor.run(self.files):
+            pass
+
+    def time_batch_processor_stacked(self, files, points):
+        processor = BatchProcessor(
+            DEFAULT_PARAMETERS, self.output, initializer=block_gui_imports
+        )
+        fname = os.path.join(self.output, "stack.npy")
+        for _ in processor.run_stacked(self.files, fname):
+            pass
+
+    def time_batch_worker(self, files, points):
+        # Batch loop of the batch-processing dialog, run synchronously
+        from dtgui.batch import BatchWorker
+
+        processor = BatchProcessor(
+            DEFAULT_PARAMETERS, self.output, initializer=block_gui_imports
+        )
+        BatchWorker(processor, self.files).run()
+
+    def peakmem_process_files_serial(self, files, points):
+        process_files(self.files, self.output, DEFAULT_PARAMETERS)
+
+
+class TimeIncrementalBatch:
+    """ Batch runs over files which were already processed, as in nightly reruns """
+
+    params = ([64, 1024], [2 ** 10])
+    param_names = ["files", "points"]
+    timeout = 600
+
+    def setup(self, files, points):
+        self.tempdir = tempfile.TemporaryDirectory()
+        inputs = os.path.join(self.tempdir.name, "inputs")
+        os.mkdir(inputs)
+        self.files = write_spectra(inputs, files, points)
+        self.output = os.path.join(self.tempdir.name, "outputs")
+        os.mkdir(self.output)
+        for _ in BatchProcessor(
+            DEFAULT_PARAMETERS, self.output, initializer=block_gui_imports
+        ).run(self.files):
+            pass
+
+    def teardown(self, files, points):
+        self.tempdir.cleanup()
+
+    def time_up_to_date(self, files, points):
+        for _ in BatchProcessor(DEFAULT_PARAMETERS, self.output).run(self.files):
+            pass
+
+    def time_touched(self, files, points):
+        # Modification times differ, so contents are hashed
+        for fname in self.files:
+            os.utime(fname)
+        for _ in BatchProcessor(DEFAULT_PARAMETERS, self.output).run(self.files):
+            pass
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the load -> baseline -> export pipeline of the GUI,
+without displaying anything.
+"""
+import os.path
+import tempfile
+
+from dtgui.cli import DEFAULT_PARAMETERS
+from dtgui.controller import Controller
+
+from .common import synthetic_spectrum, write_csv
+
+
+class TimeController:
+    """ Operations of the controller, in the order in which they are used in the GUI """
+
+    params = [2 ** 12, 2 ** 16, 2 ** 20]
+    param_names = ["points"]
+    timeout = 600
+
+    def setup(self, points):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.fname = os.path.join(self.tempdir.name, "spectrum.csv")
+        self.exported = os.path.join(self.tempdir.name, "exported.csv")
+        self.x, y = synthetic_spectrum(points)
+        write_csv(self.fname, self.x, y)
+
+        self.controller = Controller()
+        # Baselines are computed, rather than read from the on-disk cache
+        # of previous runs. See bench_project.py
+        self.controller.cache.disk = None
+        self.controller.load_raw_data(self.fname)
+
+        # Markers are placed at every tenth of the spectrum
+        span = self.x[-1] - self.x[0]
+        self.controller.update_background_markers(
+            [self.x[0] + span * i / 10 for i in range(11)]
+        )
+
+    def teardown(self, points):
+        self.tempdir.cleanup()
+
+    def time_load(self, points):
+        self.controller.load_raw_data(self.fname)
+
+    def time_compute_baseline(self, points):
+        self.controller.cache.clear()
+        self.controller.compute_baseline(dict(DEFAULT_PARAMETERS))
+
+    def time_compute_baseline_cached(self, points):
+        self.controller.compute_baseline(dict(DEFAULT_PARAMETERS))
+
+    def time_trim(self, points):
+        span = self.x[-1] - self.x[0]
+        self.controller.trim_data_bounds(self.x[0] + span / 4, self.x[-1] - span / 4)
+        self.controller.undo_trim()
+
+    def time_export(self, points):
+        self.controller.export_data(self.exported)
+
+    def time_pipeline(self, points):
+        self.controller.cache.clear()
+        self.controller.load_raw_data(self.fname)
+        self.controller.compute_baseline(dict(DEFAULT_PARAMETERS))
+        self.controller.export_data(self.exported)
+
+    def peakmem_pipeline(self, points):
+        self.controller.cache.clear()
+        self.controller.load_raw_data(self.fname)
+        self.controller.compute_baseline(dict(DEFAULT_PARAMETERS))
+        self.controller.export_data(self.exported)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import os.path
+import tempfile
+
+import numpy as np
+
+from dtgui.fileio import _read_csv_chunked, read_csv, save_columns
+
+from .common import synthetic_spectrum, write_csv
+
+
+class TimeReadCSV:
+    """ Reading two-column CSV files, as done when loading data """
+
+    params = [10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7]
+    param_names = ["rows"]
+    timeout = 600
+
+    def setup(self, rows):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.fname = os.path.join(self.tempdir.name, "spectrum.csv")
+        write_csv(self.fname, *synthetic_spectrum(rows))
+
+    def teardown(self, rows):
+        self.tempdir.cleanup()
+
+    def time_read_csv(self, rows):
+        read_csv(self.fname)
+
+    def time_read_csv_chunked(self, rows):
+        _read_csv_chunked(self.fname)
+
+    def time_loadtxt(self, rows):
+        np.loadtxt(self.fname, delimiter=",", unpack=True)
+
+    def peakmem_read_csv(self, rows):
+        read_csv(self.fname)
+
+
+class TimeExport:
+    """ Exporting baseline-corrected data, in every supported file format """
+
+    params = ([10 ** 4, 10 ** 6], [".csv", ".npy", ".npz", ".h5"])
+    param_names = ["rows", "format"]
+    timeout = 600
+
+    def setup(self, rows, format):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.fname = os.path.join(self.tempdir.name, "exported" + format)
+        x, y = synthetic_spectrum(rows)
+        self.arrays = (x, y, y / 2)
+
+    def teardown(self, rows, format):
+        self.tempdir.cleanup()
+
+    def time_export(self, rows, format):
+        save_columns(
+            self.fname, names=("abscissa", "processed", "baseline"), arrays=self.arrays
+        )
+
+    def peakmem_export(self, rows, format):
+        save_columns(
+            self.fname, names=("abscissa", "processed", "baseline"), arrays=self.arrays
+        )
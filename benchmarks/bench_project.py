@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of project files and of the on-disk baseline cache, compared with reading
+text files and computing baselines again.
+"""
+import os.path
+import tempfile
+
+from dtgui.cache import DiskCache
+from dtgui.cli import DEFAULT_PARAMETERS
+from dtgui.controller import Controller
+
+from .common import synthetic_spectrum, write_csv
+
+
+class TimeProject:
+    """ Saving and reopening the work of a session """
+
+    params = [2 ** 12, 2 ** 16, 2 ** 20]
+    param_names = ["points"]
+    timeout = 600
+
+    def setup(self, points):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.csv = os.path.join(self.tempdir.name, "spectrum.csv")
+        self.fname = os.path.join(self.tempdir.name, "project.dtgui")
+        self.x, y = synthetic_spectrum(points)
+        write_csv(self.csv, self.x, y)
+
+        self.controller = Controller()
+        self.controller.cache.disk = DiskCache(
+            os.path.join(self.tempdir.name, "cache")
+        )
+        self.controller.load_raw_data(self.csv)
+
+        # Markers are placed at every tenth of the spectrum
+        span = self.x[-1] - self.x[0]
+        self.controller.update_background_markers(
+            [self.x[0] + span * i / 10 for i in range(11)]
+        )
+        self.controller.compute_baseline(dict(DEFAULT_PARAMETERS))
+        self.controller.cache.disk.flush()
+        self.project = self.controller._project(dict(DEFAULT_PARAMETERS))
+        self.project.save(self.fname)
+
+    def teardown(self, points):
+        self.tempdir.cleanup()
+
+    def time_save(self, points):
+        self.project.save(self.fname)
+
+    def time_open(self, points):
+        self.controller.set_project(self.project.load(self.fname))
+
+    def time_reload_csv(self, points):
+        # Reference: reading the spectrum again and computing its baseline
+        self.controller.cache.clear()
+        self.controller.cache.disk.clear()
+        self.controller.load_raw_data(self.csv)
+        self.controller.compute_baseline(dict(DEFAULT_PARAMETERS))
+
+    def time_compute_baseline_from_disk(self, points):
+        # Baselines of previous sessions are read from the on-disk cache
+        self.controller.cache.clear()
+        self.controller.compute_baseline(dict(DEFAULT_PARAMETERS))
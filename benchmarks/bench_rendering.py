@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Rendering benchmarks. Plots are rendered off-screen, so that these benchmarks
+can run without a display.
+"""
+import os
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5 import QtWidgets
+
+from dtgui.dataviewer import DataViewer
+
+from .common import synthetic_spectrum
+
+# There can only be one QApplication per process
+APP = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+class TimeRenderFrame:
+    """ Time to draw a frame of the data viewer, as a function of the dataset size """
+
+    params = [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7]
+    param_names = ["points"]
+    timeout = 600
+
+    def setup(self, points):
+        self.x, self.y = synthetic_spectrum(points)
+        self.viewer = DataViewer()
+        self.viewer.resize(1280, 720)
+        self.viewer.show()
+        self.viewer.plot_raw_data(self.x, self.y)
+        self.viewer.plot_baseline(self.x, self.y / 2)
+        self.viewbox = self.viewer.plot_widget.getPlotItem().getViewBox()
+        self.render()
+
+    def teardown(self, points):
+        self.viewer.close()
+        self.viewer.deleteLater()
+        APP.processEvents()
+
+    def render(self):
+        """ Process pending events (e.g. range changes) and paint a frame """
+        APP.processEvents()
+        self.viewer.plot_widget.grab()
+
+    def time_plot(self, points):
+        self.viewer.plot_raw_data(self.x, self.y)
+        self.render()
+
+    def time_full_view(self, points):
+        self.viewbox.autoRange()
+        self.render()
+
+    def time_zoom(self, points):
+        # Zoom into the central tenth of the spectrum, then back out
+        span = self.x[-1] - self.x[0]
+        center = self.x[0] + span / 2
+        self.viewbox.setXRange(center - span / 20, center + span / 20, padding=0)
+        self.render()
+        self.viewbox.autoRange()
+        self.render()
+
+    def time_pan(self, points):
+        span = (self.x[-1] - self.x[0]) / 10
+        for step in range(10):
+            start = self.x[0] + step * span
+            self.viewbox.setXRange(start, start + span, padding=0)
+            self.render()
+
+    def peakmem_plot(self, points):
+        self.viewer.plot_raw_data(self.x, self.y)
+        self.render()
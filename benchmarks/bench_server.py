@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Compute server benchmarks. The server runs on the same machine, so that
+the overhead of transferring spectra and baselines can be compared to
+computing baselines locally, and transfers via shared memory can be compared
+to pickling.
+"""
+import threading
+
+from dtgui.baseline import baseline
+from dtgui.cli import block_gui_imports
+from dtgui.server import ComputeClient, ComputeServer
+
+from .common import synthetic_spectrum
+
+AUTHKEY = b"benchmarks"
+
+
+class TimeComputeServer:
+    """ Baselines computed by a compute server, as requested by the GUI """
+
+    params = ([2 ** 10, 2 ** 14, 2 ** 18],)
+    param_names = ["points"]
+    timeout = 600
+
+    def setup(self, points):
+        _, self.y = synthetic_spectrum(points)
+        self.kwargs = dict(
+            first_stage="sym6", wavelet="qshift3", level=1, max_iter=100
+        )
+        self.server = ComputeServer(
+            ("localhost", 0), authkey=AUTHKEY, workers=1, initializer=block_gui_imports
+        )
+        self.thread = threading.Thread(target=self.server.run)
+        self.thread.start()
+        self.client = ComputeClient(self.server.address, authkey=AUTHKEY)
+        self.client.ping()
+        # Spectra and baselines are pickled, as they are for servers on other machines
+        self.pickling_client = ComputeClient(
+            self.server.address, authkey=AUTHKEY, shared_memory=False
+        )
+
+    def teardown(self, points):
+        self.client.close()
+        self.pickling_client.close()
+        self.server.stop()
+        self.thread.join()
+
+    def time_local_baseline(self, points):
+        baseline(self.y, **self.kwargs)
+
+    def time_remote_baseline(self, points):
+        self.client.baseline(self.y, **self.kwargs)
+
+    def time_round_trip(self, points):
+        # Transfer of a spectrum and of its baseline, without iterations
+        self.client.baseline(self.y, **dict(self.kwargs, max_iter=0))
+
+    def time_round_trip_pickled(self, points):
+        self.pickling_client.baseline(self.y, **dict(self.kwargs, max_iter=0))
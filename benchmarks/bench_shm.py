@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Shared-memory benchmarks. Arrays are sent to a worker process and back, either
+pickled or via shared memory, as baselines are by compute servers and parameter
+sweeps. Allocating shared memory and copying arrays in and out of it is included.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from dtgui.shm import SharedArrays
+
+
+def _echo(array):
+    return array
+
+
+def _shared_echo(array, out):
+    with array.attach() as data, out.attach() as result:
+        result[...] = data
+
+
+class TimeTransport:
+    """ Round trip of an array to a worker process """
+
+    params = ([2 ** 10, 2 ** 14, 2 ** 18, 2 ** 22],)
+    param_names = ["points"]
+    timeout = 600
+
+    def setup(self, points):
+        self.array = np.random.default_rng(0).random(points)
+        self.executor = ProcessPoolExecutor(max_workers=1)
+        # The worker process is started beforehand
+        self.executor.submit(int).result()
+
+    def teardown(self, points):
+        self.executor.shutdown()
+
+    def time_pickled(self, points):
+        self.executor.submit(_echo, self.array).result()
+
+    def time_shared_memory(self, points):
+        with SharedArrays() as arrays:
+            handle = arrays.put(self.array)
+            out, _ = arrays.empty(points)
+            self.executor.submit(_shared_echo, handle, out).result()
+            np.array(arrays.array(out))
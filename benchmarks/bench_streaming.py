@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import os.path
+import tempfile
+
+from dtgui.baseline import baseline
+from dtgui.cli import DEFAULT_PARAMETERS
+from dtgui.fileio import load_spectrum, save_columns
+from dtgui.streaming import stream_baseline
+
+from .common import synthetic_spectrum
+
+
+class TimeStreamBaseline:
+    """ Streaming baseline-removal of large spectra, compared to loading
+    spectra in memory """
+
+    params = ([10 ** 6, 10 ** 7], [2 ** 16, 2 ** 20])
+    param_names = ["points", "window"]
+    timeout = 1200
+
+    def setup(self, points, window):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.fname = os.path.join(self.tempdir.name, "spectrum.npy")
+        self.output = os.path.join(self.tempdir.name, "processed.npy")
+        save_columns(
+            self.fname, names=("abscissa", "ordinates"), arrays=synthetic_spectrum(points)
+        )
+        self.kwargs = dict(DEFAULT_PARAMETERS, max_iter=20)
+
+    def teardown(self, points, window):
+        self.tempdir.cleanup()
+
+    def time_stream(self, points, window):
+        for _ in stream_baseline(self.fname, self.output, self.kwargs, window=window):
+            pass
+
+    def peakmem_stream(self, points, window):
+        for _ in stream_baseline(self.fname, self.output, self.kwargs, window=window):
+            pass
+
+    def peakmem_in_memory(self, points, window):
+        x, y = load_spectrum(self.fname)
+        save_columns(
+            self.output,
+            names=("abscissa", "processed"),
+            arrays=(x, y - baseline(y, **self.kwargs)),
+        )
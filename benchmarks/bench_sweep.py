@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+Parameter sweep benchmarks. Processes are spawned for every run,
+as is the case when sweeping parameters from the GUI.
+"""
+from dtgui.cli import block_gui_imports
+from dtgui.sweep import ParameterSweep, evaluate, parameter_grid
+
+from .common import synthetic_spectrum
+
+VALUES = {
+    "first_stage": ["sym6", "sym4"],
+    "wavelet": ["qshift3", "qshift1"],
+    "level": [1, 2, 3],
+    "max_iter": [10, 50, 100],
+}
+
+
+class TimeSweep:
+    """ Baselines of a spectrum for a grid of 36 combinations of parameters """
+
+    params = [2 ** 12, 2 ** 16]
+    param_names = ["points"]
+    timeout = 600
+
+    def setup(self, points):
+        _, self.data = synthetic_spectrum(points)
+        self.grid = parameter_grid(VALUES, fixed={"mode": "constant"})
+
+    def time_evaluate_serial(self, points):
+        # Baselines for every number of iterations are computed independently
+        for params in self.grid:
+            evaluate(self.data, [params])
+
+    def time_evaluate_shared_iterations(self, points):
+        # Baselines which only differ by the number of iterations share iterations
+        for start in range(0, len(self.grid), len(VALUES["max_iter"])):
+            evaluate(self.data, self.grid[start : start + len(VALUES["max_iter"])])
+
+    def time_parameter_sweep(self, points):
+        sweep = ParameterSweep(
+            self.data, VALUES, params={"mode": "constant"}, initializer=block_gui_imports
+        )
+        for _ in sweep.run():
+            pass
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Watch-folder benchmarks. Processes are spawned for every run, as is the case
+when watching a folder from the command line.
+"""
+import os.path
+import tempfile
+import threading
+import time
+
+from dtgui.cli import DEFAULT_PARAMETERS, block_gui_imports
+from dtgui.watch import WatchFolder
+
+from .common import write_spectra
+
+
+class TimeWatchFolder:
+    """ Baseline-removal of files as they arrive in a watched directory """
+
+    params = ([64], [2 ** 10, 2 ** 14])
+    param_names = ["files", "points"]
+    timeout = 600
+
+    def setup(self, files, points):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.inputs = os.path.join(self.tempdir.name, "inputs")
+        os.mkdir(self.inputs)
+        self.output = os.path.join(self.tempdir.name, "outputs")
+        os.mkdir(self.output)
+
+    def teardown(self, files, points):
+        self.tempdir.cleanup()
+
+    def _folder(self):
+        return WatchFolder(
+            self.inputs, self.output, DEFAULT_PARAMETERS, initializer=block_gui_imports
+        )
+
+    def time_backlog(self, files, points):
+        # Files written while nothing was watching are processed at once
+        write_spectra(self.inputs, files, points)
+        folder = self._folder()
+        completed = 0
+        for done, _ in folder.run():
+            completed += len(done)
+            if completed == files:
+                folder.stop()
+
+    def track_time_per_file(self, files, points):
+        # Time between the start of writing of files and the end of their
+        # processing, once watching has started, divided by the number of files.
+        # This is the inverse of the throughput of files written continuously.
+        folder = self._folder()
+        start, completed = None, 0
+        for done, _ in folder.run():
+            if start is None:
+                start = time.perf_counter()
+                threading.Thread(
+                    target=write_spectra, args=(self.inputs, files, points)
+                ).start()
+            completed += len(done)
+            if completed == files:
+                folder.stop()
+        return (time.perf_counter() - start) / files
+
+    track_time_per_file.unit = "seconds"
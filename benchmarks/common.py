@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic data for benchmarks, generated from the test data shipped with dtgui.
+"""
+import os.path
+
+import numpy as np
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), os.pardir, "test_data.csv")
+
+
+def synthetic_spectrum(size):
+    """
+    Synthetic spectrum of arbitrary size, interpolated from the test data.
+
+    Parameters
+    ----------
+    size : int
+        Number of points.
+
+    Returns
+    -------
+    x, y : `~numpy.ndarray`, ndim 1
+    """
+    x, y = np.loadtxt(TEST_DATA, delimiter=",", unpack=True)
+    new_x = np.linspace(x.min(), x.max(), size)
+    return new_x, np.interp(new_x, x, y)
+
+
+def write_csv(fname, x, y):
+    """ Write a spectrum in the two-column CSV format read by dtgui """
+    np.savetxt(fname, np.column_stack([x, y]), delimiter=",")
+
+
+def write_spectra(directory, count, size):
+    """
+    Write many synthetic spectra sharing the same abscissa, as two-column CSV files.
+
+    Parameters
+    ----------
+    directory : str
+        Directory in which to write files.
+    count : int
+        Number of files.
+    size : int
+        Number of points of every spectrum.
+
+    Returns
+    -------
+    fnames : list of str
+        Paths to the files written.
+    """
+    x, y = synthetic_spectrum(size)
+    fnames = list()
+    for index in range(count):
+        fname = os.path.join(directory, "spectrum_{:04d}.csv".format(index))
+        # Spectra differ slightly, so that nothing is accidentally shared
+        write_csv(fname, x, y * (1 + index / count))
+        fnames.append(fname)
+    return fnames
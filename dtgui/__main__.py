@@ -1,4 +1,6 @@
-from .gui import run
+import sys
+
+from .cli import main
 
 if __name__ == "__main__":
-    run()
+    sys.exit(main())
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Compiled kernels of baseline computations. This module requires numba, and
+is only imported if numba is installed.
+
+Kernels release the GIL, so that baselines can be computed in many threads at once.
+"""
+import numpy as np
+from numba import njit
+
+
+@njit(cache=True, nogil=True)
+def _reconstruct(signal, top, bottom, kernels, out):
+    """ Approximate reconstruction of a single signal, by a linear operator.
+    See :class:`dtgui.reconstruction.ReconstructionOperator`. """
+    size = signal.shape[0]
+    top_rows, top_cols = top.shape
+    bottom_rows, bottom_cols = bottom.shape
+    period, width = kernels.shape
+    radius = (width - 1) // 2
+
+    # Sums are accumulated in the precision of the output, rather than converting
+    # every term of single-precision sums to double precision
+    zero = out.dtype.type(0)
+
+    for row in range(top_rows):
+        value = zero
+        for col in range(top_cols):
+            value += top[row, col] * signal[col]
+        out[row] = value
+
+    offset = size - bottom_cols
+    for row in range(bottom_rows):
+        value = zero
+        for col in range(bottom_cols):
+            value += bottom[row, col] * signal[offset + col]
+        out[size - bottom_rows + row] = value
+
+    for row in range(top_rows, size - bottom_rows):
+        kernel = kernels[(row - top_rows) % period]
+        value = zero
+        for col in range(width):
+            value += kernel[col] * signal[row - radius + col]
+        out[row] = value
+
+
+@njit(cache=True, nogil=True)
+def iterate(array, signal, background, top, bottom, kernels):
+    """
+    Single iteration of the baseline algorithm, for every row of `array`.
+    See :meth:`dtgui.reconstruction.ReconstructionOperator.iterate`.
+    """
+    rows, size = array.shape
+    reconstructed = np.empty(size, dtype=array.dtype)
+    zero = reconstructed.dtype.type(0)
+    change = zero
+    for row in range(rows):
+        data, peakless, baseline = array[row], signal[row], background[row]
+        _reconstruct(peakless, top, bottom, kernels, reconstructed)
+
+        for index in range(size):
+            # The baseline cannot physically be negative, nor larger than the data
+            value = max(reconstructed[index], zero)
+            if value > data[index]:
+                value = peakless[index]
+            change = max(change, abs(value - baseline[index]))
+            baseline[index] = value
+
+        # The signal cannot be more than the baseline
+        for index in range(size):
+            if peakless[index] > baseline[index]:
+                peakless[index] = baseline[index]
+    return change
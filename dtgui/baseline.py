@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""
+Baseline computation. This module does not depend on Qt.
+
+Importing scikit-ued takes a long time, as it imports many heavy dependencies.
+Therefore, scikit-ued is only imported when first needed.
+"""
+import numpy as np
+
+from .reconstruction import (
+    WITH_NUMBA,
+    approx_rec,
+    max_level,
+    reconstruction_operator,
+)
+
+# Stacks of spectra are processed in blocks of rows of approximately this number of
+# elements. Small blocks keep the working set of the wavelet transforms in cache,
+# while amortizing the cost of each transform over many spectra.
+STACK_BLOCK_SIZE = 2 ** 15
+
+# Floating-point precisions in which baselines can be computed. Single precision
+# halves memory usage and memory traffic, and is more than enough for detector data
+# with 16 bits of precision. Baselines then deviate from double precision by about
+# 1e-5 of the largest data value.
+PRECISIONS = {"double": np.float64, "single": np.float32}
+
+
+def precision_dtype(precision):
+    """
+    Data-type of a floating-point precision.
+
+    Parameters
+    ----------
+    precision : str
+        Either 'double' or 'single'.
+
+    Returns
+    -------
+    dtype : `~numpy.dtype`
+
+    Raises
+    ------
+    ValueError : if the precision is not supported.
+    """
+    try:
+        return np.dtype(PRECISIONS[precision])
+    except KeyError:
+        raise ValueError(
+            "Precision must be one of {}, not {}".format(
+                ", ".join(PRECISIONS), precision
+            )
+        )
+
+
+def iter_baseline(
+    array,
+    max_iter,
+    level=None,
+    first_stage="sym6",
+    wavelet="qshift1",
+    background_regions=None,
+    mode="constant",
+    axis=-1,
+    tol=None,
+    precision="double",
+):
+    """
+    Iterative method of baseline-determination based on the dual-tree complex wavelet
+    transform. This is a generator, which yields the baseline after every iteration.
+    This is the same algorithm as scikit-ued's baseline_dt function, with the addition
+    of early termination based on convergence. Approximate reconstructions are
+    computed by :mod:`dtgui.reconstruction`.
+
+    Parameters
+    ----------
+    array : `~numpy.ndarray`
+        Data with background.
+    max_iter : int
+        Maximum number of iterations to perform.
+    level : int or None, optional
+        Decomposition level. If None (default), the maximum level possible is used.
+    first_stage : str, optional
+        Wavelet to use for the first stage.
+    wavelet : str, optional
+        Wavelet to use in stages > 1.
+    background_regions : iterable or None, optional
+        Indices of the array values that are known to be purely background, e.g.
+        ``[0, 7, slice(534, 1000)]``. For 2D arrays, indices are tuples.
+    mode : str, optional
+        Signal extension mode, see pywt.Modes.
+    axis : int, optional
+        Axis over which to compute the wavelet transform. Default is -1.
+    tol : float or None, optional
+        Convergence tolerance. Iterations stop once the largest change in the baseline
+        between two iterations is at most ``tol`` times the largest absolute value of the data.
+        If 0, iterations stop once the baseline does not change at all, which does not
+        affect the result. If None (default), all iterations are performed.
+    precision : str, optional
+        Floating-point precision of computations, either 'double' (default) or 'single'.
+        See :data:`PRECISIONS`.
+
+    Yields
+    ------
+    iteration : int
+        Number of iterations performed so far, starting at 1.
+    baseline : `~numpy.ndarray`
+        Baseline after this iteration. This array is modified in-place by
+        subsequent iterations; copy it to keep it.
+    """
+    # Baselines are computed along the last axis, which is contiguous
+    dtype = precision_dtype(precision)
+    array = np.moveaxis(np.asarray(array, dtype=dtype), axis, -1)
+
+    # Since most wavelet transforms only works on even-length signals, we might have to extend.
+    original_shape = array.shape
+    padding = [(0, 0) for _ in range(array.ndim)]
+    if original_shape[-1] % 2 == 1:
+        padding[-1] = (0, 1)
+    array = np.ascontiguousarray(np.pad(array, tuple(padding), mode="edge"))
+
+    signal = np.array(array, copy=True)
+    background = np.zeros_like(signal)
+    too_large = np.empty_like(background, dtype=bool)
+
+    # Background regions are combined into a single mask, so that many
+    # markers and regions cost a single vectorized copy per iteration.
+    # Indices refer to the original order of axes.
+    is_background = None
+    if background_regions:
+        is_background = np.zeros_like(np.moveaxis(signal, -1, axis), dtype=bool)
+        for index in background_regions:
+            is_background[index] = True
+        is_background = np.moveaxis(is_background, axis, -1)
+    unpadded = np.moveaxis(
+        background[tuple(slice(0, length) for length in original_shape)], -1, axis
+    )
+
+    # For low decomposition levels, reconstructions are computed by a precomputed
+    # linear operator. If numba is installed, whole iterations are compiled.
+    size = array.shape[-1]
+    if level is None:
+        level = max_level(size, first_stage, wavelet)
+    operator = reconstruction_operator(size, first_stage, wavelet, mode, level, dtype)
+    compiled = (operator is not None) and WITH_NUMBA
+
+    if tol is not None:
+        previous = np.empty_like(background)
+        change = np.empty_like(background)
+        threshold = tol * np.max(np.abs(array), initial=0)
+
+    for iteration in range(1, max_iter + 1):
+        # Make sure the background values are equal to the original signal values in the
+        # background regions
+        if is_background is not None:
+            np.copyto(signal, array, where=is_background)
+
+        # The steps below are fused into a single pass over the data
+        if compiled:
+            largest_change = operator.iterate(
+                array.reshape(-1, size),
+                signal.reshape(-1, size),
+                background.reshape(-1, size),
+            )
+            converged = (tol is not None) and (largest_change <= threshold)
+            yield iteration, unpadded
+            if converged:
+                return
+            continue
+
+        if tol is not None:
+            previous[:] = background
+
+        # Wavelet reconstruction using approximation coefficients
+        # Note : the baseline cannot physically be negative
+        if operator is not None:
+            operator(signal, out=background)
+        else:
+            background[:] = approx_rec(
+                signal, first_stage=first_stage, wavelet=wavelet, mode=mode, level=level
+            )
+        np.clip(background, a_min=0, a_max=None, out=background)
+
+        # The baseline cannot physically be larger than the original signal
+        np.greater(background, array, out=too_large)
+        np.copyto(background, signal, where=too_large)
+
+        # Modify the signal so it cannot be more than the background
+        # This reduces the influence of the peaks in the wavelet decomposition
+        np.greater(signal, background, out=too_large)
+        np.copyto(signal, background, where=too_large)
+
+        converged = False
+        if tol is not None:
+            np.subtract(background, previous, out=change)
+            converged = np.max(np.abs(change, out=change), initial=0) <= threshold
+
+        yield iteration, unpadded
+
+        if converged:
+            return
+
+
+def baseline(array, max_iter, tol=None, precision="double", **kwargs):
+    """
+    Iterative method of baseline-determination based on the dual-tree complex wavelet
+    transform. See :func:`iter_baseline` for a description of parameters.
+
+    Returns
+    -------
+    baseline : `~numpy.ndarray`
+        Baseline of the input array, in the precision of computations.
+    """
+    result = np.zeros(np.shape(array), dtype=precision_dtype(precision))
+    for _, result in iter_baseline(
+        array, max_iter, tol=tol, precision=precision, **kwargs
+    ):
+        pass
+    return np.array(result, copy=True)
+
+
+def parameter_choices():
+    """
+    Choices of baseline parameters. This function imports scikit-ued.
+
+    Returns
+    -------
+    choices : dict
+        Names of wavelets available for the first stage ('first_stage') and for
+        other stages ('wavelet'), and of signal extension modes ('mode').
+    """
+    from pywt import Modes
+    from skued.baseline import ALL_COMPLEX_WAV, ALL_FIRST_STAGE
+
+    return {
+        "first_stage": list(ALL_FIRST_STAGE),
+        "wavelet": list(ALL_COMPLEX_WAV),
+        "mode": list(Modes.modes),
+    }
+
+
+def baseline_stack(stack, **kwargs):
+    """
+    Dual-tree complex wavelet baseline of many spectra sharing the same abscissa.
+    Baselines are computed for many spectra at once, which is much faster than
+    computing baselines one spectrum at a time for short spectra.
+
+    Parameters
+    ----------
+    stack : `~numpy.ndarray`, shape (M, N)
+        Stack of M spectra of N points each.
+    kwargs
+        Parameters are passed to :func:`iter_baseline_stack`, e.g. ``max_iter``
+        and ``background_regions``.
+
+    Returns
+    -------
+    baseline : `~numpy.ndarray`, shape (M, N)
+        Baseline of every spectrum, in the precision of computations.
+    """
+    for _, result in iter_baseline_stack(stack, **kwargs):
+        pass
+    return result
+
+
+def iter_baseline_stack(
+    stack,
+    background_regions=None,
+    block_size=STACK_BLOCK_SIZE,
+    precision="double",
+    **kwargs
+):
+    """
+    Dual-tree complex wavelet baseline of many spectra sharing the same abscissa,
+    computed in blocks of spectra. This is a generator, which yields after every
+    iteration of every block, so that computations can be abandoned.
+
+    Parameters
+    ----------
+    stack : `~numpy.ndarray`, shape (M, N)
+        Stack of M spectra of N points each.
+    background_regions : iterable or None, optional
+        Indices of the points of every spectrum which are known to be purely background.
+        This is a list of ints (indices) or slices, e.g. ``[0, 7, slice(534, 1000)]``.
+    block_size : int, optional
+        Approximate number of elements processed at once.
+    precision : str, optional
+        Floating-point precision of computations, either 'double' (default) or 'single'.
+    kwargs
+        Other parameters are passed to :func:`iter_baseline`, e.g. ``max_iter``
+        and ``tol``.
+
+    Yields
+    ------
+    done : int
+        Number of spectra whose baseline is computed. The last item yielded has
+        all baselines computed.
+    baseline : `~numpy.ndarray`, shape (M, N)
+        Baseline of every spectrum, in the precision of computations. Only the
+        first `done` rows are computed. The same array is yielded every time.
+    """
+    stack = np.asarray(stack, dtype=precision_dtype(precision))
+    if stack.ndim != 2:
+        raise ValueError(
+            "Expected a two-dimensional stack, but found shape {}".format(stack.shape)
+        )
+
+    # Background regions are the same for every spectrum in the stack
+    regions = [(slice(None), region) for region in (background_regions or [])]
+    kwargs.pop("axis", None)
+
+    result = np.empty_like(stack)
+    rows = max(1, block_size // max(1, stack.shape[1]))
+    for start in range(0, stack.shape[0], rows):
+        block = slice(start, start + rows)
+        background = np.zeros_like(stack[block])
+        for _, background in iter_baseline(
+            stack[block],
+            background_regions=regions,
+            axis=-1,
+            precision=precision,
+            **kwargs
+        ):
+            yield start, result
+        result[block] = background
+    yield stack.shape[0], result
@@ -1,16 +1,54 @@
 # -*- coding: utf-8 -*-
-import configparser
-import os.path
+import os
 
-import numpy as np
 from PyQt5 import QtCore, QtWidgets
 
-from skued import baseline_dt
+from .engine import BatchProcessor, write_parameters
+from .error_aware import ErrorAware
+from .fileio import FORMAT_NAMES, READERS, WRITERS, StackWriter, dialog_filter
+
+# Name of the stacked file, if all processed spectra are stored in a single file
+STACK_BASENAME = "bs_stack"
+
+
+class BatchWorker(QtCore.QObject, metaclass=ErrorAware):
+    """ Runs a batch process in a separate thread, reporting progress via signals. """
+
+    file_processed_signal = QtCore.pyqtSignal(int)
+    finished_signal = QtCore.pyqtSignal(bool)
+    error_message_signal = QtCore.pyqtSignal(str)
+
+    def __init__(self, processor, files, stack_fname=None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.processor = processor
+        self.files = files
+        self.stack_fname = stack_fname
+
+    @QtCore.pyqtSlot()
+    def run(self):
+        """ Process all files. The signal `finished_signal` is emitted with `True`
+        if all files were processed, and `False` otherwise, e.g. if the run was
+        cancelled. """
+        if self.stack_fname is None:
+            results = self.processor.run(self.files)
+        else:
+            results = self.processor.run_stacked(self.files, self.stack_fname)
+
+        completed = 0
+        try:
+            for _ in results:
+                completed += 1
+                self.file_processed_signal.emit(completed)
+        finally:
+            self.finished_signal.emit(
+                completed == len(self.files) and not self.processor.cancelled
+            )
 
 
 class BatchProcessDialog(QtWidgets.QDialog):
 
     processing_update_signal = QtCore.pyqtSignal(int)
+    error_message_signal = QtCore.pyqtSignal(str)
 
     def __init__(self, baseline_params, *args, **kwargs):
         """
@@ -21,6 +59,11 @@ class BatchProcessDialog(QtWidgets.QDialog):
         """
         self.files = list()
         self.baseline_params = baseline_params
+        self.directory = None
+
+        self._processor = None
+        self._worker = None
+        self._worker_thread = None
 
         super().__init__(**kwargs)
         self.setModal(True)
@@ -45,8 +88,37 @@ class BatchProcessDialog(QtWidgets.QDialog):
         clear_btn = QtWidgets.QPushButton("Clear files", self)
         clear_btn.clicked.connect(self.clear)
 
-        accept_btn = QtWidgets.QPushButton("Process", self)
-        accept_btn.clicked.connect(self.accept)
+        self.workers_widget = QtWidgets.QSpinBox(parent=self)
+        self.workers_widget.setRange(1, os.cpu_count() or 1)
+        self.workers_widget.setValue(os.cpu_count() or 1)
+
+        # Some formats have more than one extension (e.g. HDF5), which are only listed once
+        self.format_cb = QtWidgets.QComboBox(parent=self)
+        for ext in WRITERS:
+            name = FORMAT_NAMES.get(ext, ext)
+            if self.format_cb.findText(name, QtCore.Qt.MatchStartsWith) < 0:
+                self.format_cb.addItem("{} ({})".format(name, ext), ext)
+        self.format_cb.currentIndexChanged.connect(self._update_stack_option)
+
+        self.stack_widget = QtWidgets.QCheckBox(
+            "Store all spectra in a single stacked file", parent=self
+        )
+        self.stack_widget.setToolTip(
+            "All spectra must share the same abscissa. Not available for CSV files."
+        )
+        self._update_stack_option()
+
+        self.skip_current_widget = QtWidgets.QCheckBox(
+            "Skip files which are up-to-date", parent=self
+        )
+        self.skip_current_widget.setToolTip(
+            "Files which were already processed into the selected directory with "
+            "the same parameters, and which have not changed since, are skipped."
+        )
+        self.skip_current_widget.setChecked(True)
+
+        self.accept_btn = QtWidgets.QPushButton("Process", self)
+        self.accept_btn.clicked.connect(self.accept)
 
         reject_btn = QtWidgets.QPushButton("Cancel", self)
         reject_btn.clicked.connect(self.reject)
@@ -56,14 +128,21 @@ class BatchProcessDialog(QtWidgets.QDialog):
         btns.addWidget(file_search_btn)
         btns.addWidget(clear_btn)
 
+        workers_layout = QtWidgets.QFormLayout()
+        workers_layout.addRow("Worker processes: ", self.workers_widget)
+        workers_layout.addRow("Output format: ", self.format_cb)
+        workers_layout.addRow(self.stack_widget)
+        workers_layout.addRow(self.skip_current_widget)
+
         controls = QtWidgets.QHBoxLayout()
-        controls.addWidget(accept_btn)
+        controls.addWidget(self.accept_btn)
         controls.addWidget(reject_btn)
 
         layout = QtWidgets.QVBoxLayout()
         layout.addWidget(explanation)
         layout.addLayout(btns)
         layout.addWidget(self.file_table)
+        layout.addLayout(workers_layout)
         layout.addWidget(self.progress_bar)
         layout.addLayout(controls)
         self.setLayout(layout)
@@ -71,13 +150,20 @@ class BatchProcessDialog(QtWidgets.QDialog):
     @QtCore.pyqtSlot()
     def add_spectra(self):
         paths = QtWidgets.QFileDialog.getOpenFileNames(
-            self, caption="Select one or more spectra", filter="*.csv"
+            self, caption="Select one or more spectra", filter=dialog_filter(READERS)
         )[0]
 
         if paths:
             self.files.extend(paths)
             self.file_table.addItems(paths)
 
+    @QtCore.pyqtSlot()
+    def _update_stack_option(self):
+        can_stack = self.format_cb.currentData() in StackWriter.extensions
+        self.stack_widget.setEnabled(can_stack)
+        if not can_stack:
+            self.stack_widget.setChecked(False)
+
     @QtCore.pyqtSlot()
     def clear(self):
         self.file_table.clear()
@@ -86,36 +172,79 @@ class BatchProcessDialog(QtWidgets.QDialog):
     @QtCore.pyqtSlot()
     def accept(self):
 
+        if (self._worker_thread is not None) or (not self.files):
+            return
+
         directory = QtWidgets.QFileDialog.getExistingDirectory(
             self, "Select a directory in which to save the processed files"
         )
         if not directory:
             return
+        self.directory = directory
 
         self.progress_bar.setRange(0, len(self.files))
+        self.progress_bar.setValue(0)
+        self.progress_bar.resetFormat()
+        self.accept_btn.setEnabled(False)
+        self.workers_widget.setEnabled(False)
+        self.format_cb.setEnabled(False)
+        self.stack_widget.setEnabled(False)
+        self.skip_current_widget.setEnabled(False)
+
+        extension = self.format_cb.currentData()
+        stack_fname = None
+        if self.stack_widget.isChecked():
+            stack_fname = os.path.join(directory, STACK_BASENAME + extension)
+
+        # Processing is done in a separate thread so that the dialog stays responsive
+        # The worker thread itself dispatches the files to a pool of processes
+        self._processor = BatchProcessor(
+            self.baseline_params,
+            directory,
+            workers=self.workers_widget.value(),
+            extension=extension,
+            force=not self.skip_current_widget.isChecked(),
+        )
+        self._worker = BatchWorker(
+            self._processor, list(self.files), stack_fname=stack_fname
+        )
+        self._worker_thread = QtCore.QThread(parent=self)
+        self._worker.moveToThread(self._worker_thread)
 
-        for index, file in enumerate(self.files, start=1):
-            wavenumbers, counts = np.loadtxt(file, delimiter=",", unpack=True)
-            baseline = baseline_dt(counts, **self.baseline_params)
-
-            # Assemble the result into two columns: wavenumbers first, then baseline-corrected counts
-            arr = np.empty(shape=(wavenumbers.size, 2))
-            arr[:, 0] = wavenumbers
-            arr[:, 1] = counts - baseline
-
-            # Determine the location of the processed file
-            base = os.path.basename(file)
-            processed_fname = os.path.join(directory, "bs_" + base)
-            np.savetxt(processed_fname, arr, delimiter=",")
+        self._worker.file_processed_signal.connect(self.processing_update_signal)
+        self._worker.error_message_signal.connect(self.error_message_signal)
+        self._worker.finished_signal.connect(self._processing_finished)
+        self._worker_thread.started.connect(self._worker.run)
+        self._worker_thread.start()
 
-            self.processing_update_signal.emit(index)
+    @QtCore.pyqtSlot()
+    def reject(self):
+        # If processing is underway, the first click on 'Cancel' stops processing.
+        if self._processor is not None:
+            self._processor.cancel()
+            return
+        super().reject()
+
+    @QtCore.pyqtSlot(bool)
+    def _processing_finished(self, completed):
+        self._worker_thread.quit()
+        self._worker_thread.wait()
+        self._worker_thread = None
+        self._worker = None
+        self._processor = None
+
+        self.accept_btn.setEnabled(True)
+        self.workers_widget.setEnabled(True)
+        self.format_cb.setEnabled(True)
+        self.skip_current_widget.setEnabled(True)
+        self._update_stack_option()
+
+        if not completed:
+            # Runs are incomplete if cancelled, and stacked files are then not written
+            self.progress_bar.setFormat("Incomplete: %v of %m files processed")
+            return
 
         # Write baseline parameters into a configuration file
-        config = configparser.ConfigParser()
-        config["BASELINE PARAMETERS"] = self.baseline_params
-        with open(
-            os.path.join(directory, "baseline_parameters.txt"), mode="w"
-        ) as configfile:
-            config.write(configfile)
+        write_parameters(self.directory, self.baseline_params)
 
         super().accept()
@@ -0,0 +1,440 @@
+# -*- coding: utf-8 -*-
+"""
+Caching of computed baselines, in memory and on disk. This module does not depend
+on Qt.
+
+Baselines are identified by a hash of the data and of the parameters from which
+they are computed (see :func:`baseline_key`). Baselines cached on disk are therefore
+found again in later sessions, for the same data and parameters.
+"""
+import hashlib
+import os
+import os.path
+import re
+import sys
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+import numpy as np
+
+from .fileio import _remove, atomic_write
+
+# Default memory budget of baseline caches, in bytes
+DEFAULT_CACHE_SIZE = 256 * 2 ** 20
+
+# Default disk budget of on-disk baseline caches, in bytes
+DEFAULT_DISK_CACHE_SIZE = 256 * 2 ** 20
+
+# Maximum size of baselines cached on disk, in bytes. Larger baselines, e.g. of
+# stacks of many spectra, would take up most of the disk budget and take long to write.
+MAX_DISK_ENTRY_SIZE = 32 * 2 ** 20
+
+# Environment variable from which the directory of the on-disk cache is read,
+# if specified. Baselines are not cached on disk if it is empty.
+CACHE_DIRECTORY_VARIABLE = "DTGUI_CACHE_DIR"
+
+# Files of on-disk caches. Temporary files, and other files, are ignored.
+CACHE_FILE = re.compile(r"^([0-9a-f]{32})\.npy$")
+
+
+def data_digest(data):
+    """
+    Hash of an array, including its type and shape.
+
+    Parameters
+    ----------
+    data : `~numpy.ndarray`
+        Array to hash.
+
+    Returns
+    -------
+    digest : str
+    """
+    data = np.ascontiguousarray(data)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str((data.dtype.str, data.shape)).encode())
+    h.update(data.data)
+    return h.hexdigest()
+
+
+def baseline_key(data, params):
+    """
+    Key identifying a baseline computation, based on a hash of the data and
+    of the parameters.
+
+    Parameters
+    ----------
+    data : `~numpy.ndarray` or str
+        Data from which the baseline is computed, or its digest from
+        :func:`data_digest`. Passing a digest avoids re-hashing large data.
+    params : dict
+        Baseline parameters, including resolved background regions.
+
+    Returns
+    -------
+    key : str
+    """
+    if not isinstance(data, str):
+        data = data_digest(data)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(data.encode())
+    h.update(repr(sorted(params.items())).encode())
+    return h.hexdigest()
+
+
+def default_cache_directory():
+    """
+    Directory of the on-disk baseline cache: the directory specified by the
+    ``DTGUI_CACHE_DIR`` environment variable if any, otherwise a 'dtgui' directory
+    in the cache directory of the user.
+
+    Returns
+    -------
+    directory : str or None
+        Directory, or None if the environment variable is empty, in which case
+        baselines should not be cached on disk.
+    """
+    directory = os.environ.get(CACHE_DIRECTORY_VARIABLE)
+    if directory is not None:
+        return directory or None
+
+    if sys.platform.startswith("win"):
+        root = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    elif sys.platform == "darwin":
+        root = os.path.expanduser(os.path.join("~", "Library", "Caches"))
+    else:
+        root = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser(
+            os.path.join("~", ".cache")
+        )
+    return os.path.join(root, "dtgui")
+
+
+class DiskCache:
+    """
+    Least-recently-used cache of baselines on disk. Every baseline is stored in its
+    own NumPy file, named after its key, so that the cache can be shared by
+    many processes. The least-recently-used baselines are removed when the total size
+    of cached baselines exceeds a disk budget. This class is thread-safe.
+
+    Files are written atomically in a background thread, so that storing baselines
+    does not wait for the disk. Errors reading or writing files are ignored:
+    baselines which cannot be read are missing from the cache, and baselines which
+    cannot be written are not cached.
+
+    Parameters
+    ----------
+    directory : str
+        Directory in which baselines are stored. It is created if needed.
+    max_bytes : int, optional
+        Disk budget of the cache, in bytes.
+    max_entry_bytes : int, optional
+        Maximum size of cached baselines, in bytes. Larger baselines are not stored.
+    """
+
+    def __init__(
+        self,
+        directory,
+        max_bytes=DEFAULT_DISK_CACHE_SIZE,
+        max_entry_bytes=MAX_DISK_ENTRY_SIZE,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._lock = Lock()
+        # Sizes of cached files, from the least to the most recently used. The
+        # directory is only listed when first needed, to speed up startup.
+        self._sizes = None
+        self._nbytes = 0
+        # Baselines waiting to be written, by key. Files are written one at a time.
+        self._pending = dict()
+        self._writer = ThreadPoolExecutor(max_workers=1)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._index())
+
+    def __contains__(self, key):
+        with self._lock:
+            return (key in self._pending) or (key in self._index())
+
+    @property
+    def nbytes(self):
+        """ Total size of cached baselines, in bytes """
+        with self._lock:
+            self._index()
+            return self._nbytes
+
+    def _path(self, key):
+        return os.path.join(self.directory, "{}.npy".format(key))
+
+    def _index(self):
+        """ Sizes of cached files, listed from the directory if needed. Files
+        are ordered by last use, which is their modification time. """
+        if self._sizes is None:
+            entries = list()
+            try:
+                with os.scandir(self.directory) as it:
+                    for entry in it:
+                        match = CACHE_FILE.match(entry.name)
+                        if match is None:
+                            continue
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue
+                        entries.append((stat.st_mtime, match.group(1), stat.st_size))
+            except OSError:
+                pass
+            entries.sort()
+            self._sizes = OrderedDict((key, size) for _, key, size in entries)
+            self._nbytes = sum(self._sizes.values())
+        return self._sizes
+
+    def get(self, key):
+        """
+        Retrieve a cached baseline.
+
+        Parameters
+        ----------
+        key : str
+            Key, e.g. from :func:`baseline_key`.
+
+        Returns
+        -------
+        baseline : `~numpy.ndarray` or None
+            Baseline, or None if the baseline is not cached.
+        """
+        with self._lock:
+            baseline = self._pending.get(key)
+            if baseline is not None:
+                return baseline
+            if key not in self._index():
+                return None
+
+        # Files are read without holding the lock, so that other threads
+        # are not blocked meanwhile
+        path = self._path(key)
+        try:
+            baseline = np.load(path, allow_pickle=False)
+            # Files are ordered by last use across sessions
+            os.utime(path)
+        except (OSError, ValueError):
+            # Removed by another process, or corrupted
+            with self._lock:
+                self._nbytes -= self._sizes.pop(key, 0)
+            _remove(path)
+            return None
+
+        with self._lock:
+            if key in self._sizes:
+                self._sizes.move_to_end(key)
+        return baseline
+
+    def put(self, key, baseline):
+        """
+        Store a baseline in the cache. The baseline is written in the background,
+        and must not be modified afterwards. Baselines larger than `max_entry_bytes`,
+        or than the disk budget, are not stored.
+
+        Parameters
+        ----------
+        key : str
+            Key, e.g. from :func:`baseline_key`.
+        baseline : `~numpy.ndarray`
+            Baseline.
+        """
+        baseline = np.asarray(baseline)
+        if baseline.nbytes > min(self.max_entry_bytes, self.max_bytes):
+            return
+
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending[key] = baseline
+        try:
+            self._writer.submit(self._write, key, baseline)
+        except RuntimeError:
+            # The interpreter is shutting down
+            with self._lock:
+                del self._pending[key]
+
+    def flush(self):
+        """ Wait until all baselines stored so far are written """
+        self._writer.submit(int).result()
+
+    def _write(self, key, baseline):
+        """ Write a baseline, in the thread of the writer """
+        path = self._path(key)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with atomic_write(path) as temporary:
+                np.save(temporary, baseline)
+            size = os.path.getsize(path)
+        except OSError:
+            size = None
+
+        evicted = list()
+        with self._lock:
+            del self._pending[key]
+            if size is None:
+                return
+            sizes = self._index()
+            self._nbytes += size - sizes.pop(key, 0)
+            sizes[key] = size
+            while self._nbytes > self.max_bytes:
+                evicted_key, evicted_size = sizes.popitem(last=False)
+                self._nbytes -= evicted_size
+                evicted.append(evicted_key)
+
+        for evicted_key in evicted:
+            _remove(self._path(evicted_key))
+
+    def clear(self):
+        """ Remove all cached baselines """
+        self.flush()
+        with self._lock:
+            for key in self._index():
+                _remove(self._path(key))
+            self._sizes.clear()
+            self._nbytes = 0
+
+
+class BaselineCache:
+    """
+    Least-recently-used cache of baselines. The least-recently-used baselines are
+    evicted when the total size of cached baselines exceeds a memory budget.
+    This class is thread-safe.
+
+    Baselines can also be cached on disk, in which case baselines evicted from
+    memory, or computed in previous sessions, are read from disk.
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+        Memory budget of the cache, in bytes.
+    disk : `DiskCache` or None, optional
+        Cache on disk, if any. Baselines stored in this cache are also
+        stored on disk, in the background.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_SIZE, disk=None):
+        self.max_bytes = max_bytes
+        self.disk = disk
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._nbytes = 0
+        self._items = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        if key in self._items:
+            return True
+        return (self.disk is not None) and (key in self.disk)
+
+    @property
+    def nbytes(self):
+        """ Total size of cached baselines, in bytes """
+        return self._nbytes
+
+    def get(self, key):
+        """
+        Retrieve a cached baseline.
+
+        Parameters
+        ----------
+        key : str
+            Key, e.g. from :func:`baseline_key`.
+
+        Returns
+        -------
+        baseline : `~numpy.ndarray` or None
+            Read-only baseline, or None if the baseline is not cached.
+        """
+        with self._lock:
+            baseline = self._items.get(key)
+            if baseline is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return baseline
+
+        # Baselines found on disk are kept in memory afterwards
+        baseline = None if self.disk is None else self.disk.get(key)
+        with self._lock:
+            if baseline is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        return self._store(key, baseline)
+
+    def put(self, key, baseline):
+        """
+        Store a baseline in the cache, and on disk if applicable. Baselines larger
+        than the memory budget are not stored in memory.
+
+        Parameters
+        ----------
+        key : str
+            Key, e.g. from :func:`baseline_key`.
+        baseline : `~numpy.ndarray`
+            Baseline. A read-only copy is stored.
+        """
+        baseline = self._store(key, np.array(baseline, copy=True))
+        if self.disk is not None:
+            self.disk.put(key, baseline)
+
+    def _store(self, key, baseline):
+        """ Store a baseline in memory, which is made read-only and returned """
+        baseline.setflags(write=False)
+        if baseline.nbytes > self.max_bytes:
+            return baseline
+
+        with self._lock:
+            if key in self._items:
+                self._nbytes -= self._items.pop(key).nbytes
+            self._items[key] = baseline
+            self._nbytes += baseline.nbytes
+
+            while self._nbytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._nbytes -= evicted.nbytes
+        return baseline
+
+    def clear(self):
+        """ Remove all baselines cached in memory, and reset statistics.
+        Baselines cached on disk are kept. """
+        with self._lock:
+            self._items.clear()
+            self._nbytes = 0
+            self.hits = self.disk_hits = self.misses = 0
+
+    def stats(self):
+        """
+        Cache statistics.
+
+        Returns
+        -------
+        stats : dict
+            Number of hits, misses and cached baselines, and total size in bytes.
+            If baselines are cached on disk, the number of baselines read from
+            disk, and the number and total size of baselines on disk, are included.
+        """
+        stats = {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self),
+            "nbytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+        }
+        if self.disk is not None:
+            stats.update(
+                disk_hits=self.disk_hits,
+                disk_entries=len(self.disk),
+                disk_nbytes=self.disk.nbytes,
+                disk_max_bytes=self.disk.max_bytes,
+            )
+        return stats
@@ -0,0 +1,560 @@
+# -*- coding: utf-8 -*-
+"""
+Command-line interface. Subcommands other than the default (the GUI)
+must not import Qt, so that they can be used on headless machines.
+"""
+import argparse
+import glob
+import os
+import secrets
+import signal
+import subprocess
+import sys
+
+DESCRIPTION = """Baseline-removal via the dual-tree complex wavelet transform.
+Without a subcommand, the graphical user interface is started."""
+
+BATCH_DESCRIPTION = """Baseline-removal of many two-column CSV files, without
+the graphical user interface. Processed files are stored in the output
+directory, along with the parameters used. Processed files are recorded in a
+manifest in the output directory, so that files which were already processed
+with the same parameters, and are unchanged, are skipped by later runs."""
+
+STREAM_DESCRIPTION = """Baseline-removal of a spectrum which might not fit in
+memory. The spectrum is processed in overlapping windows, and the processed
+spectrum is written as it is computed. The result is the same as processing
+the spectrum all at once. Input and output files must be NumPy arrays (.npy)
+or HDF5 files (.h5, .hdf5)."""
+
+WATCH_DESCRIPTION = """Baseline-removal of spectra as they are written into a
+directory, e.g. by an instrument. Every new or modified file is processed as soon
+as it is complete, and the processed file is stored in the output directory.
+Files already in the directory are processed as well, unless they are up-to-date.
+Press Ctrl+C to stop watching."""
+
+SERVE_DESCRIPTION = """Compute server, to which graphical user interfaces
+can offload baseline computations ("Connect to compute server" in the menu bar).
+Clients must know the authentication key of the server, which is read from the
+DTGUI_AUTHKEY environment variable unless specified. If no key is specified, a
+random key is generated. Requests are pickled: only serve trusted networks.
+Press Ctrl+C to stop serving."""
+
+IMPORTTIME_DESCRIPTION = """Report the time taken to import modules when the
+graphical user interface starts, as measured by Python's -X importtime option
+in a new interpreter. Modules are sorted by cumulative import time, including
+the modules they import."""
+
+# Default parameters are the same as the default values of the GUI controls
+DEFAULT_PARAMETERS = {
+    "first_stage": "sym6",
+    "wavelet": "qshift3",
+    "mode": "constant",
+    "max_iter": 100,
+    "level": 1,
+    "tol": 0.0,
+    "precision": "double",
+}
+
+# Modules which must never be imported by headless subcommands
+GUI_MODULES = ("PyQt5", "pyqtgraph", "qdarkstyle")
+
+
+def block_gui_imports():
+    """
+    Prevent GUI modules from being imported in this process. Dependencies which
+    optionally import GUI modules (e.g. scikit-ued importing pyqtgraph)
+    then behave as if GUI modules were not installed.
+    """
+    for name in GUI_MODULES:
+        # Setting a module to None in sys.modules causes imports to raise ImportError
+        sys.modules.setdefault(name, None)
+
+
+def watch_worker_initializer():
+    """ Initialize worker processes of the watch and serve subcommands. Workers
+    ignore interruptions, which stop the main process, so that files being
+    processed are completed. """
+    block_gui_imports()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def shard_type(value):
+    """ Parse a shard specification of the form 'INDEX/COUNT', where 0 <= INDEX < COUNT """
+    try:
+        index, count = (int(v) for v in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "Shard must be of the form INDEX/COUNT, not {}".format(value)
+        )
+    if not (0 <= index < count):
+        raise argparse.ArgumentTypeError(
+            "Shard index must be between 0 and {}".format(count - 1)
+        )
+    return index, count
+
+
+def add_baseline_arguments(parser):
+    """ Add baseline parameters arguments to a parser """
+    parser.add_argument(
+        "-p",
+        "--parameters",
+        default=None,
+        metavar="FILE",
+        help="Baseline parameters file, as written by a previous batch run "
+        "(baseline_parameters.txt). Explicit parameters below take precedence.",
+    )
+    parser.add_argument("--first-stage", dest="first_stage")
+    parser.add_argument("--wavelet")
+    parser.add_argument("--mode")
+    parser.add_argument("--max-iter", dest="max_iter", type=int)
+    parser.add_argument("--level", type=int)
+    parser.add_argument(
+        "--tol",
+        type=float,
+        help="Convergence tolerance. Iterations stop once the baseline changes by "
+        "less than this fraction of the largest data value between iterations.",
+    )
+    parser.add_argument(
+        "--precision",
+        choices=("double", "single"),
+        help="Floating-point precision of computations and of processed files. "
+        "Single precision halves memory usage, and baselines deviate from double "
+        "precision by about 1e-5 of the largest data value.",
+    )
+
+
+def make_parser():
+    """ Build the command-line argument parser. """
+    parser = argparse.ArgumentParser(prog="dtgui", description=DESCRIPTION)
+    subparsers = parser.add_subparsers(dest="command")
+
+    batch_parser = subparsers.add_parser(
+        "batch", help="Batch baseline-removal.", description=BATCH_DESCRIPTION
+    )
+    batch_parser.add_argument(
+        "inputs",
+        nargs="+",
+        metavar="INPUT",
+        help="Input files or glob patterns, e.g. 'data/**/*.csv'.",
+    )
+    batch_parser.add_argument(
+        "-o",
+        "--output",
+        required=True,
+        help="Directory in which to store processed files. Created if needed.",
+    )
+    batch_parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes. Default is the number of CPUs.",
+    )
+    add_baseline_arguments(batch_parser)
+    batch_parser.add_argument(
+        "-f",
+        "--format",
+        default=".csv",
+        choices=(".csv", ".npy", ".npz", ".h5", ".hdf5"),
+        help="File format of processed files. Default is '.csv'.",
+    )
+    batch_parser.add_argument(
+        "--stack",
+        default=None,
+        metavar="FILE",
+        help="Store all processed spectra in a single stacked file (.npy, .npz, .h5), "
+        "relative to the output directory, rather than one file per input. "
+        "All inputs must share the same abscissa.",
+    )
+    batch_parser.add_argument(
+        "--compression",
+        default=None,
+        help="Compression filter for HDF5 files (e.g. 'gzip', 'lzf'). "
+        "NumPy archives are compressed with any value.",
+    )
+    batch_parser.add_argument(
+        "--shard",
+        type=shard_type,
+        default=None,
+        metavar="INDEX/COUNT",
+        help="Only process every COUNT-th input file, starting at INDEX. "
+        "Useful to split work across array jobs, e.g. "
+        "--shard $SLURM_ARRAY_TASK_ID/$SLURM_ARRAY_TASK_COUNT.",
+    )
+    batch_parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Process all input files, including files which are up-to-date.",
+    )
+    batch_parser.add_argument(
+        "--timings",
+        default=None,
+        metavar="FILE",
+        help="Write the processing time of every file to a JSON file.",
+    )
+    batch_parser.add_argument(
+        "-q", "--quiet", action="store_true", help="Do not report progress."
+    )
+
+    stream_parser = subparsers.add_parser(
+        "stream",
+        help="Baseline-removal of spectra larger than memory.",
+        description=STREAM_DESCRIPTION,
+    )
+    stream_parser.add_argument("input", metavar="INPUT", help="Input spectrum.")
+    stream_parser.add_argument(
+        "-o", "--output", required=True, help="Path to the processed spectrum."
+    )
+    stream_parser.add_argument(
+        "-w",
+        "--window",
+        type=int,
+        default=None,
+        help="Number of points processed at once, excluding the overlap between "
+        "windows. Larger windows are faster, but require more memory.",
+    )
+    add_baseline_arguments(stream_parser)
+    stream_parser.add_argument(
+        "--compression",
+        default=None,
+        help="Compression filter for HDF5 files (e.g. 'gzip', 'lzf').",
+    )
+    stream_parser.add_argument(
+        "-q", "--quiet", action="store_true", help="Do not report progress."
+    )
+
+    watch_parser = subparsers.add_parser(
+        "watch",
+        help="Baseline-removal of spectra as they are written.",
+        description=WATCH_DESCRIPTION,
+    )
+    watch_parser.add_argument(
+        "directory", metavar="DIRECTORY", help="Directory to watch."
+    )
+    watch_parser.add_argument(
+        "-o",
+        "--output",
+        required=True,
+        help="Directory in which to store processed files. Created if needed.",
+    )
+    watch_parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes. Default is the number of CPUs.",
+    )
+    add_baseline_arguments(watch_parser)
+    watch_parser.add_argument(
+        "-f",
+        "--format",
+        default=".csv",
+        choices=(".csv", ".npy", ".npz", ".h5", ".hdf5"),
+        help="File format of processed files. Default is '.csv'.",
+    )
+    watch_parser.add_argument(
+        "--pattern",
+        default="*.csv",
+        help="Pattern of the names of files to process. Default is '*.csv'.",
+    )
+    watch_parser.add_argument(
+        "--interval",
+        type=float,
+        default=None,
+        help="Interval between checks for new files, in seconds. Default is 0.2.",
+    )
+    watch_parser.add_argument(
+        "-q", "--quiet", action="store_true", help="Do not report processed files."
+    )
+
+    serve_parser = subparsers.add_parser(
+        "serve", help="Compute server.", description=SERVE_DESCRIPTION
+    )
+    serve_parser.add_argument(
+        "-a",
+        "--address",
+        default="localhost:6000",
+        help="Address on which to listen, either HOST:PORT or the path to a Unix "
+        "socket. Default is 'localhost:6000', which only accepts local clients.",
+    )
+    serve_parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes. Default is the number of CPUs.",
+    )
+    serve_parser.add_argument(
+        "--authkey", default=None, help="Authentication key of clients."
+    )
+
+    importtime_parser = subparsers.add_parser(
+        "importtime",
+        help="Report import times at startup.",
+        description=IMPORTTIME_DESCRIPTION,
+    )
+    importtime_parser.add_argument(
+        "--module",
+        default="dtgui.gui",
+        help="Module to import. Default is the graphical user interface, 'dtgui.gui'.",
+    )
+    importtime_parser.add_argument(
+        "-n",
+        "--top",
+        type=int,
+        default=25,
+        help="Number of modules to report. Default is 25.",
+    )
+    return parser
+
+
+def expand_inputs(patterns):
+    """
+    Expand input glob patterns into a sorted list of unique files.
+
+    Parameters
+    ----------
+    patterns : iterable of str
+        File paths or glob patterns.
+
+    Returns
+    -------
+    files : list of str
+    """
+    files = set()
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True)
+        if not matches and os.path.isfile(pattern):
+            matches = [pattern]
+        files.update(m for m in matches if os.path.isfile(m))
+    return sorted(files)
+
+
+def baseline_parameters(args):
+    """ Determine baseline parameters from parsed command-line arguments """
+    from .engine import read_parameters
+
+    params = dict(DEFAULT_PARAMETERS)
+    if args.parameters is not None:
+        params.update(read_parameters(args.parameters))
+
+    for key in DEFAULT_PARAMETERS:
+        value = getattr(args, key)
+        if value is not None:
+            params[key] = value
+    return params
+
+
+def batch(args):
+    """ Batch baseline-removal, from parsed command-line arguments """
+    block_gui_imports()
+    from .engine import BatchProcessor, write_parameters
+
+    files = expand_inputs(args.inputs)
+    if args.shard is not None:
+        index, count = args.shard
+        files = files[index::count]
+    if not files:
+        print("No input files to process.", file=sys.stderr)
+        return 1
+
+    params = baseline_parameters(args)
+    os.makedirs(args.output, exist_ok=True)
+
+    processor = BatchProcessor(
+        params,
+        args.output,
+        workers=args.workers,
+        initializer=block_gui_imports,
+        extension=args.format,
+        compression=args.compression,
+        force=args.force,
+    )
+    if args.stack is None:
+        results = processor.run(files)
+    else:
+        results = processor.run_stacked(files, os.path.join(args.output, args.stack))
+
+    try:
+        for index, (fname, processed_fname) in enumerate(results, start=1):
+            if not args.quiet:
+                print("[{}/{}] {}".format(index, len(files), processed_fname))
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    if processor.skipped and not args.quiet:
+        print("{} up-to-date files were skipped.".format(len(processor.skipped)))
+
+    write_parameters(args.output, params)
+    if args.timings is not None:
+        processor.timings.dump_json(args.timings)
+    return 0
+
+
+def stream(args):
+    """ Streaming baseline-removal, from parsed command-line arguments """
+    block_gui_imports()
+    from .streaming import DEFAULT_WINDOW, stream_baseline
+
+    params = baseline_parameters(args)
+    progress = stream_baseline(
+        args.input,
+        args.output,
+        params,
+        window=args.window or DEFAULT_WINDOW,
+        compression=args.compression,
+    )
+    for processed, total in progress:
+        if not args.quiet:
+            print("[{}/{}] {}".format(processed, total, args.output))
+    return 0
+
+
+def watch(args):
+    """ Watch-folder baseline-removal, from parsed command-line arguments """
+    block_gui_imports()
+    from .engine import write_parameters
+    from .watch import POLL_INTERVAL, WatchFolder
+
+    if not os.path.isdir(args.directory):
+        print("{} is not a directory.".format(args.directory), file=sys.stderr)
+        return 1
+
+    params = baseline_parameters(args)
+    os.makedirs(args.output, exist_ok=True)
+    write_parameters(args.output, params)
+
+    try:
+        folder = WatchFolder(
+            args.directory,
+            args.output,
+            params,
+            pattern=args.pattern,
+            workers=args.workers,
+            initializer=watch_worker_initializer,
+            extension=args.format,
+            interval=args.interval or POLL_INTERVAL,
+        )
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    if not args.quiet:
+        print("Watching {}. Press Ctrl+C to stop.".format(args.directory))
+
+    try:
+        for completed, failed in folder.run():
+            for fname, message in failed:
+                print("{}: {}".format(fname, message), file=sys.stderr)
+            if not args.quiet:
+                for _, processed_fname in completed:
+                    print(processed_fname)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def serve(args):
+    """ Compute server, from parsed command-line arguments """
+    block_gui_imports()
+    from .server import (
+        ComputeServer,
+        authentication_key,
+        format_address,
+        parse_address,
+    )
+
+    authkey = authentication_key(args.authkey)
+    if authkey is None:
+        key = secrets.token_urlsafe(16)
+        print("Authentication key: {}".format(key))
+        authkey = authentication_key(key)
+
+    try:
+        server = ComputeServer(
+            parse_address(args.address),
+            authkey=authkey,
+            workers=args.workers,
+            initializer=watch_worker_initializer,
+        )
+    except OSError as e:
+        print("Cannot listen on {}: {}".format(args.address, e), file=sys.stderr)
+        return 1
+
+    print(
+        "Serving on {}. Press Ctrl+C to stop.".format(format_address(server.address))
+    )
+    try:
+        server.run()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def import_times(module):
+    """
+    Measure the import time of a module, and of every module it imports,
+    in a new interpreter.
+
+    Parameters
+    ----------
+    module : str
+        Name of the module, e.g. 'dtgui.gui'.
+
+    Returns
+    -------
+    times : list of 3-tuples
+        Name, self and cumulative import time in seconds of every module
+        imported, sorted by decreasing cumulative import time.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import {}".format(module)],
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    times = list()
+    for line in result.stderr.splitlines():
+        # Lines are of the form "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:"):
+            continue
+        self_time, cumulative, name = line[len("import time:") :].split("|")
+        if not self_time.strip().isdigit():
+            continue  # header
+        times.append((name.strip(), int(self_time) / 1e6, int(cumulative) / 1e6))
+    return sorted(times, key=lambda t: t[2], reverse=True)
+
+
+def importtime(args):
+    """ Report import times, from parsed command-line arguments """
+    if getattr(sys, "frozen", False):
+        print("Import times cannot be measured from an executable.", file=sys.stderr)
+        return 1
+
+    print("{:>12} {:>12}  {}".format("cumul. [ms]", "self [ms]", "module"))
+    for name, self_time, cumulative in import_times(args.module)[: args.top]:
+        print("{:>12.1f} {:>12.1f}  {}".format(1e3 * cumulative, 1e3 * self_time, name))
+    return 0
+
+
+def main(argv=None):
+    """ Entry point of the command-line interface. Returns an exit code. """
+    args = make_parser().parse_args(argv)
+
+    if args.command == "batch":
+        return batch(args)
+    elif args.command == "stream":
+        return stream(args)
+    elif args.command == "watch":
+        return watch(args)
+    elif args.command == "serve":
+        return serve(args)
+    elif args.command == "importtime":
+        return importtime(args)
+
+    # The GUI is only imported when needed, so that other subcommands
+    # do not import Qt.
+    from .gui import run
+
+    return run()
@@ -1,9 +1,6 @@
 # -*- coding: utf-8 -*-
 
 from PyQt5 import QtCore, QtWidgets
-from pywt import Modes
-
-from skued.baseline import ALL_COMPLEX_WAV, ALL_FIRST_STAGE
 
 from .error_aware import ErrorAware
 
@@ -17,8 +14,26 @@ while the second column should be the ordinates.
 
 TRIM_TEXT = "Data can be trimmed. Drag the edges of the overlay. Data outside the bound will be removed."
 
+LIVE_UPDATE_TEXT = """
+Live update recomputes the baseline as parameters are changed or background markers are moved.
+""".replace(
+    "\n", ""
+)
+
+# Delay between the last parameter change and the live update of the baseline
+LIVE_UPDATE_DELAY_MS = 300
+
+PRECISION_TEXT = """
+Single precision halves the memory used by spectra and baselines, 
+including spectra which are already loaded. 
+Baselines then deviate from double precision by about 1e-5 of the largest data value.
+""".replace(
+    "\n", ""
+)
+
 BACKGROUND_MARKER_TEXT = """
-Position background markers where you know the signal should only be composed of background.
+Position background markers where you know the signal should only be composed of background. 
+Background regions mark entire ranges of the abscissa as background.
 """.replace(
     "\n", ""
 )
@@ -29,8 +44,14 @@ class ControlBar(QtWidgets.QWidget, metaclass=ErrorAware):
     baseline_parameters_signal = QtCore.pyqtSignal(dict)
     show_trim_widget = QtCore.pyqtSignal(bool)
     trim_bounds_signal = QtCore.pyqtSignal()
+    undo_trim_signal = QtCore.pyqtSignal()
+    redo_trim_signal = QtCore.pyqtSignal()
+
+    stream_iterations_signal = QtCore.pyqtSignal(bool)
+    precision_signal = QtCore.pyqtSignal(str)
 
     add_background_marker_signal = QtCore.pyqtSignal()
+    add_background_region_signal = QtCore.pyqtSignal()
     clear_background_markers_signal = QtCore.pyqtSignal()
 
     data_available_signal = QtCore.pyqtSignal(bool)
@@ -53,12 +74,25 @@ class ControlBar(QtWidgets.QWidget, metaclass=ErrorAware):
         show_trim_bounds_btn.toggled.connect(trigger_trim_btn.setEnabled)
         trigger_trim_btn.setEnabled(False)
 
+        # Trims are non-destructive, and can be undone
+        self.undo_trim_btn = QtWidgets.QPushButton("Undo trim")
+        self.undo_trim_btn.clicked.connect(self.undo_trim_signal)
+        self.undo_trim_btn.setEnabled(False)
+
+        self.redo_trim_btn = QtWidgets.QPushButton("Redo trim")
+        self.redo_trim_btn.clicked.connect(self.redo_trim_signal)
+        self.redo_trim_btn.setEnabled(False)
+
         data_controls_layout = QtWidgets.QVBoxLayout()
         data_controls_layout.addWidget(trim_label)
         btns = QtWidgets.QHBoxLayout()
         btns.addWidget(show_trim_bounds_btn)
         btns.addWidget(trigger_trim_btn)
         data_controls_layout.addLayout(btns)
+        history_btns = QtWidgets.QHBoxLayout()
+        history_btns.addWidget(self.undo_trim_btn)
+        history_btns.addWidget(self.redo_trim_btn)
+        data_controls_layout.addLayout(history_btns)
 
         # Background-only markers
         background_markers_label = QtWidgets.QLabel(BACKGROUND_MARKER_TEXT)
@@ -68,6 +102,9 @@ class ControlBar(QtWidgets.QWidget, metaclass=ErrorAware):
         add_background_marker_btn = QtWidgets.QPushButton("Add background marker", self)
         add_background_marker_btn.clicked.connect(self.add_background_marker_signal)
 
+        add_background_region_btn = QtWidgets.QPushButton("Add background region", self)
+        add_background_region_btn.clicked.connect(self.add_background_region_signal)
+
         clear_background_markers_btn = QtWidgets.QPushButton(
             "Clear background markers", self
         )
@@ -78,22 +115,19 @@ class ControlBar(QtWidgets.QWidget, metaclass=ErrorAware):
         background_marker_layout = QtWidgets.QGridLayout()
         background_marker_layout.addWidget(background_markers_label, 0, 0, 1, 2)
         background_marker_layout.addWidget(add_background_marker_btn, 1, 0, 1, 1)
-        background_marker_layout.addWidget(clear_background_markers_btn, 1, 1, 1, 1)
+        background_marker_layout.addWidget(add_background_region_btn, 1, 1, 1, 1)
+        background_marker_layout.addWidget(clear_background_markers_btn, 2, 0, 1, 2)
 
+        # Combo boxes only contain default values until all choices are known,
+        # which requires importing scikit-ued. See set_parameter_choices
         self.first_stage_cb = QtWidgets.QComboBox()
-        self.first_stage_cb.addItems(ALL_FIRST_STAGE)
-        if "sym6" in ALL_FIRST_STAGE:
-            self.first_stage_cb.setCurrentText("sym6")
+        self.first_stage_cb.addItem("sym6")
 
         self.wavelet_cb = QtWidgets.QComboBox()
-        self.wavelet_cb.addItems(ALL_COMPLEX_WAV)
-        if "qshift3" in ALL_COMPLEX_WAV:
-            self.wavelet_cb.setCurrentText("qshift3")
+        self.wavelet_cb.addItem("qshift3")
 
         self.mode_cb = QtWidgets.QComboBox()
-        self.mode_cb.addItems(Modes.modes)
-        if "smooth" in Modes.modes:
-            self.mode_cb.setCurrentText("constant")
+        self.mode_cb.addItem("constant")
 
         self.max_iter_widget = QtWidgets.QSpinBox()
         self.max_iter_widget.setRange(0, 1000)
@@ -103,6 +137,29 @@ class ControlBar(QtWidgets.QWidget, metaclass=ErrorAware):
         self.level_widget.setMinimum(0)
         self.level_widget.setValue(1)
 
+        # A tolerance of 0 stops iterations once the baseline does not change at all,
+        # which yields the same result as performing all iterations.
+        self.tol_widget = QtWidgets.QDoubleSpinBox()
+        self.tol_widget.setDecimals(6)
+        self.tol_widget.setRange(0, 1)
+        self.tol_widget.setSingleStep(1e-4)
+        self.tol_widget.setValue(0)
+        self.tol_widget.setToolTip(
+            "Iterations stop once the baseline changes by less than this fraction "
+            "of the largest data value between iterations."
+        )
+
+        self.precision_cb = QtWidgets.QComboBox()
+        self.precision_cb.addItems(["double", "single"])
+        self.precision_cb.setToolTip(PRECISION_TEXT)
+        self.precision_cb.currentTextChanged.connect(self.precision_signal)
+
+        self.stream_iterations_widget = QtWidgets.QCheckBox(
+            "Show intermediate baselines", parent=self
+        )
+        self.stream_iterations_widget.setChecked(True)
+        self.stream_iterations_widget.toggled.connect(self.stream_iterations_signal)
+
         self.compute_baseline_btn = QtWidgets.QPushButton(
             "Compute baseline", parent=self
         )
@@ -110,23 +167,130 @@ class ControlBar(QtWidgets.QWidget, metaclass=ErrorAware):
             lambda _: self.baseline_parameters_signal.emit(self.baseline_parameters())
         )
 
+        # Live updates are debounced: the baseline is only computed once
+        # parameters have stopped changing for a short while.
+        self.live_update_widget = QtWidgets.QCheckBox("Live update", parent=self)
+        self.live_update_widget.setToolTip(LIVE_UPDATE_TEXT)
+        self.live_update_widget.toggled.connect(self.schedule_live_update)
+
+        self._live_update_timer = QtCore.QTimer(parent=self)
+        self._live_update_timer.setSingleShot(True)
+        self._live_update_timer.setInterval(LIVE_UPDATE_DELAY_MS)
+        self._live_update_timer.timeout.connect(
+            lambda: self.baseline_parameters_signal.emit(self.baseline_parameters())
+        )
+
+        for widget in (
+            self.first_stage_cb,
+            self.wavelet_cb,
+            self.mode_cb,
+            self.precision_cb,
+        ):
+            widget.currentIndexChanged.connect(self.schedule_live_update)
+        for widget in (self.max_iter_widget, self.level_widget, self.tol_widget):
+            widget.valueChanged.connect(self.schedule_live_update)
+        for signal in (
+            self.trim_bounds_signal,
+            self.undo_trim_signal,
+            self.redo_trim_signal,
+        ):
+            signal.connect(self.schedule_live_update)
+
         baseline_controls = QtWidgets.QFormLayout()
         baseline_controls.addRow("First stage wavelet: ", self.first_stage_cb)
         baseline_controls.addRow("Dual-tree wavelet: ", self.wavelet_cb)
         baseline_controls.addRow("Extensions mode: ", self.mode_cb)
         baseline_controls.addRow("Iterations: ", self.max_iter_widget)
         baseline_controls.addRow("Decomposition level: ", self.level_widget)
+        baseline_controls.addRow("Convergence tolerance: ", self.tol_widget)
+        baseline_controls.addRow("Precision: ", self.precision_cb)
 
         layout = QtWidgets.QVBoxLayout()
         layout.addLayout(data_controls_layout)
         layout.addLayout(background_marker_layout)
         layout.addLayout(baseline_controls)
         layout.addWidget(self.compute_baseline_btn)
+        layout.addWidget(self.live_update_widget)
+        layout.addWidget(self.stream_iterations_widget)
         layout.addStretch(1)
 
         self.setLayout(layout)
         self.resize(self.minimumSize())
 
+    @QtCore.pyqtSlot()
+    def schedule_live_update(self):
+        """ Schedule a baseline computation, if live updates are enabled.
+        Scheduling again before the computation is triggered delays it further. """
+        if self.live_update_widget.isChecked():
+            self._live_update_timer.start()
+
+    @QtCore.pyqtSlot(dict)
+    def set_parameter_choices(self, choices):
+        """
+        Set the choices of baseline parameters, keeping current selections.
+
+        Parameters
+        ----------
+        choices : dict
+            Names of wavelets available for the first stage ('first_stage') and for
+            other stages ('wavelet'), and of signal extension modes ('mode').
+        """
+        for key, widget in (
+            ("first_stage", self.first_stage_cb),
+            ("wavelet", self.wavelet_cb),
+            ("mode", self.mode_cb),
+        ):
+            current = widget.currentText()
+            widget.blockSignals(True)
+            widget.clear()
+            widget.addItems(choices[key])
+            widget.setCurrentText(current)
+            widget.blockSignals(False)
+
+    def parameter_choices(self):
+        """ Returns the choices of baseline parameters. See set_parameter_choices. """
+        return {
+            key: [widget.itemText(i) for i in range(widget.count())]
+            for key, widget in (
+                ("first_stage", self.first_stage_cb),
+                ("wavelet", self.wavelet_cb),
+                ("mode", self.mode_cb),
+            )
+        }
+
+    @QtCore.pyqtSlot(dict)
+    def set_baseline_parameters(self, params):
+        """
+        Set baseline parameters. Parameters which are not specified are unchanged.
+
+        Parameters
+        ----------
+        params : dict
+            Dictionary of baseline-computation parameters, as returned by
+            baseline_parameters.
+        """
+        for key, widget in (
+            ("first_stage", self.first_stage_cb),
+            ("wavelet", self.wavelet_cb),
+            ("mode", self.mode_cb),
+            ("precision", self.precision_cb),
+        ):
+            if key in params:
+                widget.setCurrentText(params[key])
+        for key, widget in (
+            ("max_iter", self.max_iter_widget),
+            ("level", self.level_widget),
+            ("tol", self.tol_widget),
+        ):
+            if key in params:
+                widget.setValue(params[key])
+
+    @QtCore.pyqtSlot(bool, bool)
+    def set_trim_history(self, can_undo, can_redo):
+        """ Enable trim undo/redo buttons according to the trim history """
+        self.undo_trim_btn.setEnabled(can_undo)
+        self.redo_trim_btn.setEnabled(can_redo)
+
     def baseline_parameters(self):
         """ Returns a dictionary of baseline-computation parameters """
         return {
@@ -135,4 +299,6 @@ class ControlBar(QtWidgets.QWidget, metaclass=ErrorAware):
             "mode": self.mode_cb.currentText(),
             "max_iter": self.max_iter_widget.value(),
             "level": self.level_widget.value(),
+            "tol": self.tol_widget.value(),
+            "precision": self.precision_cb.currentText(),
         }
@@ -1,11 +1,45 @@
 # -*- coding: utf-8 -*-
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from threading import Lock
 
 import numpy as np
 from PyQt5 import QtCore
 
-from skued import baseline_dt
-
+from .baseline import (
+    baseline_stack,
+    iter_baseline,
+    iter_baseline_stack,
+    parameter_choices,
+    precision_dtype,
+)
+from .cache import (
+    BaselineCache,
+    DiskCache,
+    baseline_key,
+    data_digest,
+    default_cache_directory,
+)
 from .error_aware import ErrorAware
+from .fileio import load_spectrum, load_stack, save_columns
+from .indexing import background_regions, index_range
+from .instrumentation import profiler, span, timed
+from .project import Project
+from .session import Session
+from .streaming import stream_baseline
+
+# Intermediate baselines are plotted every few iterations, but no more often
+# than the display refresh rate.
+STREAM_EVERY = 5
+STREAM_INTERVAL = 1 / 60
+
+# Number of spectra on each side of the displayed spectrum of a session whose
+# baselines are computed in the background
+PRECOMPUTE_NEIGHBOURS = 2
+
+# Interval at which baselines computed by a compute server are checked for being
+# superseded by a more recent request, in seconds
+SERVER_POLL_INTERVAL = 0.05
 
 
 class Controller(QtCore.QObject, metaclass=ErrorAware):
@@ -17,8 +51,20 @@ class Controller(QtCore.QObject, metaclass=ErrorAware):
     clear_baseline_signal = QtCore.pyqtSignal()
 
     raw_data_loaded_signal = QtCore.pyqtSignal(bool)
+    stack_size_signal = QtCore.pyqtSignal(int)
+    trim_history_signal = QtCore.pyqtSignal(bool, bool)
+    cache_stats_signal = QtCore.pyqtSignal(dict)
+    server_connected_signal = QtCore.pyqtSignal(bool)
+    status_message_signal = QtCore.pyqtSignal(str)
+    parameter_choices_signal = QtCore.pyqtSignal(dict)
+    export_columns_signal = QtCore.pyqtSignal(str, object, object)
+    sweep_data_signal = QtCore.pyqtSignal(object, object, list)
+    project_signal = QtCore.pyqtSignal(str, object)
+    project_restored_signal = QtCore.pyqtSignal(dict, list, int)
     error_message_signal = QtCore.pyqtSignal(str)
 
+    _baseline_requested_signal = QtCore.pyqtSignal()
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -26,91 +72,787 @@ class Controller(QtCore.QObject, metaclass=ErrorAware):
         self.raw_ordinates = None
         self.baseline = None
 
-        # Background-only location
+        # Stack of spectra sharing the same abscissa, if loaded.
+        # In this case, raw_ordinates and baseline are rows of the stack.
+        self.stack = None
+        self.stack_baselines = None
+        self.stack_index = 0
+
+        # Session of many spectra with possibly different abscissas, if loaded.
+        # In this case, abscissa and raw_ordinates are those of a spectrum of the session.
+        # Baselines of neighbouring spectra are computed in the background.
+        self.session = None
+        self.session_index = 0
+        self._precompute_executor = ThreadPoolExecutor(max_workers=1)
+        self._precompute_futures = dict()
+
+        # Data as loaded, before trimming. Trimming is non-destructive:
+        # abscissa, raw_ordinates and stack are views into these arrays.
+        # Trims are ranges of indices, and previous trims can be restored.
+        self._full_abscissa = None
+        self._full_data = None
+        self._data_digest = None
+        self._trim_history = list()
+        self._trim_position = 0
+
+        # Parameters of the most recent baseline computation
+        self._last_params = None
+
+        # Baselines computed previously, so that revisiting parameters is instant.
+        # Baselines are also cached on disk, so that they are found in later sessions,
+        # unless disabled.
+        directory = default_cache_directory()
+        self.cache = BaselineCache(
+            disk=None if directory is None else DiskCache(directory)
+        )
+
+        # Connection to a compute server, if baselines are computed remotely.
+        # Intermediate baselines are not plotted in this case.
+        self.server = None
+
+        # Whether intermediate baselines are plotted during the computation
+        self.streaming = True
+
+        # Data-type in which spectra and stacks are stored when loaded. Baselines
+        # are computed in the precision of their parameters regardless.
+        self.dtype = precision_dtype("double")
+
+        # Baseline requests can be made from any thread. Only the most recent
+        # request is computed, and results of superseded requests are not plotted.
+        self._request_lock = Lock()
+        self._requested_params = None
+        self._generation = 0
+        self._baseline_requested_signal.connect(self._compute_requested_baseline)
+
+        # Background-only locations, either points or (start, stop) regions in
+        # abscissa units. Their indices are resolved once, until markers or trim change.
         self.background_markers = list()
+        self._background_regions = None
 
         self.clear_raw_signal.emit()
         self.clear_baseline_signal.emit()
         self.raw_data_loaded_signal.emit(False)
 
+    @QtCore.pyqtSlot()
+    @timed("preload")
+    def preload(self):
+        """ Import heavy dependencies, which are otherwise imported on first use,
+        and determine the choices of baseline parameters. """
+        self.parameter_choices_signal.emit(parameter_choices())
+
     @QtCore.pyqtSlot(list)
     def update_background_markers(self, markers):
-        """ Update the background-only indices """
+        """ Update the background-only locations, either points or (start, stop) regions """
         self.background_markers = markers
+        self._background_regions = None
 
     @QtCore.pyqtSlot(str)
+    @timed("load")
     def load_raw_data(self, fname):
         """ 
-        Read a CSV file. It is assumed that the CSV file has two columns (x, y)
-        with no headers or footers. 
+        Read a spectrum. The file format is determined by the file extension.
+        CSV files are assumed to have two columns (x, y) with no footers.
         
         Parameters
         ----------
         fname : str
             absolute filename
         """
-        self.abscissa, self.raw_ordinates = np.loadtxt(
-            fname, delimiter=",", unpack=True
+        self.set_spectrum(*load_spectrum(fname))
+
+    @QtCore.pyqtSlot(object, object)
+    def set_spectrum(self, abscissa, ordinates):
+        """
+        Display a spectrum, e.g. read by an :class:`dtgui.io_executor.IOExecutor`.
+
+        Parameters
+        ----------
+        abscissa, ordinates : `~numpy.ndarray`, ndim 1
+        """
+        self._show_spectrum(
+            abscissa.astype(self.dtype, copy=False),
+            ordinates.astype(self.dtype, copy=False),
         )
+
+    def _show_spectrum(self, abscissa, ordinates):
+        """ Display a spectrum, in its data-type """
+        self.stack = self.stack_baselines = None
+        self.session = None
+        self._set_data(abscissa, ordinates)
+        self.stack_size_signal.emit(0)
         self.raw_data_loaded_signal.emit(True)
         self.clear_raw_signal.emit()
+        self.clear_baseline_signal.emit()
 
-        self.baseline = np.zeros_like(self.raw_ordinates)
+        self.raw_plot_signal.emit(self.abscissa, self.raw_ordinates)
+        self.baseline_plot_signal.emit(self.abscissa, self.baseline)
+
+    @QtCore.pyqtSlot(object, object, object)
+    def set_processed(self, abscissa, ordinates, baseline):
+        """
+        Display a spectrum along with a baseline which was computed elsewhere,
+        e.g. by a watch folder. The baseline is not cached, since its parameters
+        might differ from the current parameters.
+
+        Parameters
+        ----------
+        abscissa, ordinates, baseline : `~numpy.ndarray`, ndim 1
+        """
+        self.set_spectrum(abscissa, ordinates)
+        self.baseline = baseline.astype(self.dtype, copy=False)
+        self.baseline_plot_signal.emit(self.abscissa, self.baseline)
+
+    @QtCore.pyqtSlot(list)
+    @timed("load stack")
+    def load_stack(self, fnames):
+        """
+        Read many spectra which share the same abscissa. Baselines of all
+        spectra are then computed at once.
+
+        Parameters
+        ----------
+        fnames : list of str
+            absolute filenames
+        """
+        self.set_stack(*load_stack(fnames))
+
+    @QtCore.pyqtSlot(object, object)
+    def set_stack(self, abscissa, stack):
+        """
+        Display a stack of spectra sharing the same abscissa.
+
+        Parameters
+        ----------
+        abscissa : `~numpy.ndarray`, shape (N,)
+        stack : `~numpy.ndarray`, shape (M, N)
+        """
+        self._show_stack(
+            abscissa.astype(self.dtype, copy=False), stack.astype(self.dtype, copy=False)
+        )
+
+    def _show_stack(self, abscissa, stack):
+        """ Display a stack of spectra, in its data-type """
+        self.session = None
+        self.stack_index = 0
+        self._set_data(abscissa, stack)
+        self.stack_size_signal.emit(self.stack.shape[0])
+        self.raw_data_loaded_signal.emit(True)
+
+        self.clear_raw_signal.emit()
         self.clear_baseline_signal.emit()
+        self.select_spectrum(0)
+
+    @QtCore.pyqtSlot(list)
+    @timed("load session")
+    def load_session(self, fnames):
+        """
+        Read many spectra, which may have different abscissas. Spectra are
+        displayed one at a time, while the baselines of neighbouring spectra
+        are computed in the background.
+
+        Parameters
+        ----------
+        fnames : list of str
+            absolute filenames
+        """
+        self.set_session(Session.from_files(fnames))
+
+    @QtCore.pyqtSlot(object)
+    def set_session(self, session):
+        """
+        Display the spectra of a session one at a time.
+
+        Parameters
+        ----------
+        session : `~dtgui.session.Session`
+        """
+        self.stack = self.stack_baselines = None
+        self.session = session
+        self.stack_size_signal.emit(len(session))
+        self.raw_data_loaded_signal.emit(True)
+
+        self.clear_raw_signal.emit()
+        self.clear_baseline_signal.emit()
+        self.select_spectrum(0)
+
+    @QtCore.pyqtSlot(int)
+    def select_spectrum(self, index):
+        """
+        Display a spectrum from the stack of spectra, or from the session.
+
+        Parameters
+        ----------
+        index : int
+            Index of the spectrum in the stack or session.
+        """
+        if self.session is not None:
+            self.session_index = index
+            self._set_data(*self._session_spectrum(self.session, index))
+            self.raw_plot_signal.emit(self.abscissa, self.raw_ordinates)
+
+            # The baseline of this spectrum might be computed in the background
+            # already, in which case it is cached once done
+            future = self._precompute_futures.pop(index, None)
+            if (future is not None) and (not future.cancel()):
+                future.result()
+
+            # The baseline is computed with the most recent parameters, unless cached.
+            # The baselines of neighbouring spectra are then computed in the background.
+            if self._last_params is not None:
+                self.compute_baseline(dict(self._last_params))
+            else:
+                self.baseline_plot_signal.emit(self.abscissa, self.baseline)
+            self.status_message_signal.emit(
+                "Spectrum {}/{}: {}".format(
+                    index + 1, len(self.session), self.session.names[index]
+                )
+            )
+            return
+
+        if self.stack is None:
+            return
+
+        self.stack_index = index
+        self.raw_ordinates = self.stack[index]
+        self.baseline = self.stack_baselines[index]
 
         self.raw_plot_signal.emit(self.abscissa, self.raw_ordinates)
         self.baseline_plot_signal.emit(self.abscissa, self.baseline)
 
+    def _set_data(self, abscissa, data, digest=None):
+        """ Set untrimmed data, either a single spectrum or a stack of spectra.
+        The digest of the data is computed, unless provided. """
+        self._full_abscissa = abscissa
+        self._full_data = data
+        self._data_digest = digest or data_digest(data)
+        self._trim_history = [(0, len(abscissa))]
+        self._trim_position = 0
+        self._apply_trim()
+
+    def _apply_trim(self):
+        """ Update data views according to the current trim, and restore the
+        corresponding baseline if it was computed previously. """
+        start, stop = self.trim_range
+        self.abscissa = self._full_abscissa[start:stop]
+        self._background_regions = None
+        if self._full_data.ndim == 2:
+            self.stack = self._full_data[:, start:stop]
+            self.raw_ordinates = self.stack[self.stack_index]
+        else:
+            self.raw_ordinates = self._full_data[start:stop]
+
+        baseline = None
+        if self._last_params is not None:
+            params = self._resolve_markers(dict(self._last_params))
+            baseline = self.cache.get(self._baseline_key(params))
+
+        if self.stack is not None:
+            if baseline is None:
+                baseline = np.zeros_like(self.stack)
+            self.stack_baselines = baseline
+            self.baseline = self.stack_baselines[self.stack_index]
+        else:
+            self.baseline = np.zeros_like(self.raw_ordinates)
+            if baseline is not None:
+                self.baseline = baseline
+
+        self.trim_history_signal.emit(
+            self._trim_position > 0, self._trim_position < len(self._trim_history) - 1
+        )
+
+    @property
+    def trim_range(self):
+        """ Range of indices (start, stop) of the untrimmed data currently in use """
+        return self._trim_history[self._trim_position]
+
     @QtCore.pyqtSlot(float, float)
+    @timed("trim")
     def trim_data_bounds(self, mi, ma):
         """ 
-        Trim data according to abscissa values
+        Trim data according to abscissa values. Trimming is non-destructive,
+        and can be undone with :meth:`undo_trim`.
         
         Parameters
         ----------
         mi, ma : float
             Abscissa bounds
         """
-        min_ind = int(np.argmin(np.abs(self.abscissa - mi)))
-        max_ind = int(np.argmin(np.abs(self.abscissa - ma)))
+        current_start, current_stop = self.trim_range
+        start, stop = index_range(self._full_abscissa, mi, ma)
+        start, stop = max(start, current_start), min(stop, current_stop)
+        if stop - start < 2:
+            raise ValueError("Trim bounds must contain at least two data points")
+
+        # Trimming discards the trims that could have been redone
+        del self._trim_history[self._trim_position + 1 :]
+        self._trim_history.append((start, stop))
+        self._trim_position += 1
+        self._update_trim()
+
+    @QtCore.pyqtSlot()
+    @timed("trim")
+    def undo_trim(self):
+        """ Restore the data bounds before the most recent trim """
+        if self._trim_position > 0:
+            self._trim_position -= 1
+            self._update_trim()
 
-        self.abscissa = self.abscissa[min_ind:max_ind]
-        self.raw_ordinates = self.raw_ordinates[min_ind:max_ind]
-        self.baseline = np.zeros_like(self.raw_ordinates)  # baseline no longer valid
+    @QtCore.pyqtSlot()
+    @timed("trim")
+    def redo_trim(self):
+        """ Re-apply the most recently undone trim """
+        if self._trim_position < len(self._trim_history) - 1:
+            self._trim_position += 1
+            self._update_trim()
 
+    def _update_trim(self):
+        self._apply_trim()
         self.raw_plot_signal.emit(self.abscissa, self.raw_ordinates)
         self.baseline_plot_signal.emit(self.abscissa, self.baseline)
 
     @QtCore.pyqtSlot(str)
+    @timed("export")
     def export_data(self, fname):
         """ 
-        Export the baseline-corrected data to a file
+        Export the baseline-corrected data to a file. The file format is
+        determined by the file extension.
         
         Parameters
         ----------
         fname : str
             absolute filename
         """
+        save_columns(fname, *self._export_columns())
+
+    @QtCore.pyqtSlot(str)
+    def request_export(self, fname):
+        """
+        Request the export of the baseline-corrected data, which is emitted via
+        `export_columns_signal` to be written elsewhere, e.g. by an
+        :class:`dtgui.io_executor.IOExecutor`. Baseline computations can then
+        proceed while data is written.
+
+        Parameters
+        ----------
+        fname : str
+            absolute filename
+        """
+        self.export_columns_signal.emit(fname, *self._export_columns())
+
+    def _export_columns(self):
+        """ Names and arrays of the columns of exported data. Arrays
+        are never modified afterwards. """
         if self.baseline is None:
             self.baseline = np.zeros_like(self.raw_ordinates)
+        return (
+            ("abscissa", "processed", "baseline"),
+            (self.abscissa, self.raw_ordinates - self.baseline, self.baseline),
+        )
+
+    @QtCore.pyqtSlot()
+    def request_sweep_data(self):
+        """
+        Request the displayed spectrum, as trimmed, and its background regions,
+        which are emitted via `sweep_data_signal` for parameter sweeps. Arrays are
+        never modified afterwards, so that they are consistent even if other data
+        is loaded or trimmed in the meantime.
+        """
+        regions = self._resolve_markers(dict())["background_regions"]
+        self.sweep_data_signal.emit(self.abscissa, self.raw_ordinates, regions)
+
+    @QtCore.pyqtSlot(str, dict)
+    def request_project(self, fname, params):
+        """
+        Request that the loaded data, trims, background markers and baseline
+        parameters be saved as a project, which is emitted via `project_signal`
+        to be written elsewhere, e.g. by an :class:`dtgui.io_executor.IOExecutor`.
+        The displayed baseline is included if it was computed with these parameters.
+
+        Parameters
+        ----------
+        fname : str
+            absolute filename
+        params : dict
+            Baseline parameters, without background regions.
+        """
+        self.project_signal.emit(fname, self._project(params))
+
+    def _project(self, params):
+        """ Project of the current state. Arrays are never modified afterwards. """
+        if self.session is not None:
+            abscissa, data, index = None, self.session, self.session_index
+        else:
+            abscissa, data = self._full_abscissa, self._full_data
+            index = self.stack_index
+
+        baselines = dict()
+        key = self._baseline_key(self._resolve_markers(dict(params)))
+        baseline = self.cache.get(key)
+        if baseline is not None:
+            baselines[key] = baseline
+
+        return Project(
+            abscissa,
+            data,
+            params,
+            markers=self.background_markers,
+            trims=self._trim_history,
+            trim_position=self._trim_position,
+            index=index,
+            baselines=baselines,
+        )
+
+    @QtCore.pyqtSlot(object)
+    @timed("restore project")
+    def set_project(self, project):
+        """
+        Restore the state of a project, e.g. read by an
+        :class:`dtgui.io_executor.IOExecutor`. Baselines of the project are cached,
+        and displayed without being computed again. Baseline parameters, background
+        markers and the index of the displayed spectrum are emitted via
+        `project_restored_signal`, for display.
+
+        Parameters
+        ----------
+        project : `~dtgui.project.Project`
+        """
+        for key, baseline in project.baselines.items():
+            self.cache.put(key, baseline)
+        self.background_markers = list(project.markers)
+        self._background_regions = None
+
+        # Data is displayed without baselines, until trims are restored
+        self._last_params = None
+        if project.is_session:
+            self.set_session(project.data)
+            self.select_spectrum(project.index)
+        elif project.data.ndim == 2:
+            self._show_stack(project.abscissa, project.data)
+            self.stack_index = project.index
+        else:
+            self._show_spectrum(project.abscissa, project.data)
+
+        self._last_params = dict(project.params)
+        self._trim_history = list(project.trims)
+        self._trim_position = project.trim_position
+        self._update_trim()
+        self.cache_stats_signal.emit(self.cache.stats())
+        self.project_restored_signal.emit(
+            dict(project.params), list(project.markers), project.index
+        )
+
+    @QtCore.pyqtSlot(str, str, dict)
+    @timed("stream")
+    def stream_file(self, fname, output, params):
+        """
+        Remove the baseline of a spectrum which might not fit in memory, without
+        loading it. See :func:`dtgui.streaming.stream_baseline`.
+
+        Parameters
+        ----------
+        fname, output : str
+            Paths to the spectrum and to the processed spectrum.
+        params : dict
+            Baseline parameters. Background markers are not used.
+        """
+        for processed, total in stream_baseline(fname, output, params):
+            self.status_message_signal.emit(
+                "Processing {}: {:.0%}".format(fname, processed / total)
+            )
+        self.status_message_signal.emit("Processed spectrum written to {}".format(output))
+
+    def _precompute_neighbours(self):
+        """ Compute the baselines of spectra neighbouring the displayed spectrum of
+        the session in the background, with the most recent parameters.
+        Pending computations for previous spectra or parameters are cancelled. """
+        for future in self._precompute_futures.values():
+            future.cancel()
+        self._precompute_futures.clear()
+
+        if (self.session is None) or (self._last_params is None):
+            return
+
+        for index in self.session.neighbours(self.session_index, PRECOMPUTE_NEIGHBOURS):
+            self._precompute_futures[index] = self._precompute_executor.submit(
+                self._precompute_baseline,
+                self.session,
+                index,
+                dict(self._last_params),
+                list(self.background_markers),
+            )
+
+    def _precompute_baseline(self, session, index, params, markers):
+        """ Compute the baseline of an untrimmed spectrum of a session, and cache it.
+        This method is called from a background thread. """
+        abscissa, ordinates, digest = self._session_spectrum(session, index)
+        params["background_regions"] = background_regions(abscissa, markers)
+
+        # Same key as the baseline computed by compute_baseline once this
+        # spectrum is displayed
+        key = baseline_key(digest, dict(params, trim=(0, len(abscissa))))
+        if key in self.cache:
+            return
+
+        server, baseline = self.server, None
+        with span("precompute baseline"):
+            if server is not None:
+                try:
+                    baseline = server.baseline(ordinates, **params)
+                except ConnectionError:
+                    # Reported by the computation of the displayed baseline
+                    pass
+            if baseline is None:
+                baseline = baseline_stack(ordinates[None, :], **params)[0]
+        self.cache.put(key, baseline)
+
+    def _session_spectrum(self, session, index):
+        """ Spectrum of a session in the current data-type, and its digest. Spectra
+        are converted when needed, in which case their digest is computed again. """
+        abscissa, ordinates = session.spectrum(index)
+        if ordinates.dtype == self.dtype:
+            return abscissa, ordinates, session.digests[index]
+        ordinates = ordinates.astype(self.dtype)
+        return abscissa.astype(self.dtype), ordinates, data_digest(ordinates)
+
+    def stop_precompute(self):
+        """ Cancel background computations of baselines. This method
+        can be called from any thread. """
+        for future in list(self._precompute_futures.values()):
+            future.cancel()
+        self._precompute_executor.shutdown(wait=False)
+
+    @QtCore.pyqtSlot()
+    def start_profiling(self):
+        """ Start profiling the operations of the controller """
+        profiler.start()
+
+    @QtCore.pyqtSlot(str)
+    def stop_profiling(self, fname):
+        """
+        Stop profiling the operations of the controller, and write the results.
+
+        Parameters
+        ----------
+        fname : str
+            Path to the profile, which can be read with the pstats module.
+            If empty, the profile is discarded.
+        """
+        profiler.stop(fname)
+        if fname:
+            self.status_message_signal.emit("Profile written to {}".format(fname))
+
+    @QtCore.pyqtSlot(bool)
+    def set_streaming(self, enabled):
+        """ Enable or disable plotting of intermediate baselines """
+        self.streaming = enabled
+
+    @QtCore.pyqtSlot(object)
+    def set_server(self, server):
+        """
+        Offload baseline computations to a compute server, or compute them locally.
+
+        Parameters
+        ----------
+        server : `~dtgui.server.ComputeClient` or None
+            Connection to a compute server, which is closed once replaced.
+            If None, baselines are computed locally.
+        """
+        from .server import format_address
+
+        previous, self.server = self.server, server
+        if previous is not None:
+            previous.close()
+        self.server_connected_signal.emit(server is not None)
+        if server is not None:
+            self.status_message_signal.emit(
+                "Baselines are computed by the server at {}".format(
+                    format_address(server.address)
+                )
+            )
+
+    def _remote_baseline(self, data, params, generation):
+        """ Compute a baseline on the compute server. Returns None if the computation
+        has been superseded by a more recent request, in which case its result is
+        discarded. If the connection to the server is lost, the baseline is
+        computed locally. """
+        try:
+            future = self.server.submit_baseline(data, **params)
+            while not wait([future], timeout=SERVER_POLL_INTERVAL)[0]:
+                if self.is_stale(generation):
+                    # Shared memory with the server, if any, is released right away
+                    future.cancel()
+                    return None
+            return future.result()
+        except ConnectionError as e:
+            self.set_server(None)
+            self.error_message_signal.emit(
+                "{}. Baselines are computed locally.".format(e)
+            )
+        return baseline_stack(np.atleast_2d(data), **params).reshape(data.shape)
+
+    @QtCore.pyqtSlot(str)
+    def set_precision(self, precision):
+        """
+        Set the floating-point precision in which spectra and stacks are stored,
+        which is also the precision in which they are plotted and exported. Data
+        which is already loaded is converted, keeping trims and the displayed baseline.
+        Converting data to double precision does not restore the digits discarded
+        in single precision.
+
+        Parameters
+        ----------
+        precision : str
+            Either 'double' or 'single'. See :data:`dtgui.baseline.PRECISIONS`.
+        """
+        self.dtype = precision_dtype(precision)
+        if self.session is not None:
+            # Spectra of sessions are converted when displayed
+            self.select_spectrum(self.session_index)
+        elif (self._full_data is not None) and (self._full_data.dtype != self.dtype):
+            self._convert_data()
 
-        arr = np.empty(shape=(self.raw_ordinates.size, 3), dtype=np.float)
-        arr[:, 0] = self.abscissa
-        arr[:, 1] = self.raw_ordinates - self.baseline
-        arr[:, 2] = self.baseline
+    @timed("convert data")
+    def _convert_data(self):
+        """ Convert the loaded spectrum or stack to the current data-type """
+        baseline = self.baseline if self.stack is None else self.stack_baselines
+        trims, position = self._trim_history, self._trim_position
+        self._set_data(
+            self._full_abscissa.astype(self.dtype), self._full_data.astype(self.dtype)
+        )
+        self._trim_history, self._trim_position = trims, position
+        self._apply_trim()
 
-        np.savetxt(fname, arr, delimiter=",", header="abscissa, processed, baseline")
+        # Converted data has another digest, so that the displayed baseline is not
+        # found in the cache anymore. It is displayed until computed again.
+        if self.stack is not None:
+            self.stack_baselines = baseline.astype(self.dtype)
+            self.baseline = self.stack_baselines[self.stack_index]
+        else:
+            self.baseline = baseline.astype(self.dtype)
+        self.raw_plot_signal.emit(self.abscissa, self.raw_ordinates)
+        self.baseline_plot_signal.emit(self.abscissa, self.baseline)
 
     @QtCore.pyqtSlot(dict)
-    def compute_baseline(self, params):
+    def request_baseline(self, params):
+        """
+        Request the computation of a baseline. This method can be called from any thread;
+        the computation takes place in the controller's thread.
+
+        Requests are coalesced: if many requests are made while a baseline is being
+        computed, only the most recent one is computed afterwards. The result of a computation
+        which has been superseded by a more recent request is discarded.
+
+        Parameters
+        ----------
+        params : dict
+            Parameters passed to :meth:`compute_baseline`.
+        """
+        with self._request_lock:
+            self._requested_params = params
+            self._generation += 1
+        self._baseline_requested_signal.emit()
+
+    @QtCore.pyqtSlot()
+    def _compute_requested_baseline(self):
+        with self._request_lock:
+            params, self._requested_params = self._requested_params, None
+            generation = self._generation
+
+        # Request already handled by a previous call
+        if params is None:
+            return
+        self.compute_baseline(params, generation=generation)
+
+    def is_stale(self, generation):
+        """ Determine whether a baseline computation has been superseded
+        by a more recent request """
+        return (generation is not None) and (generation != self._generation)
+
+    @timed("resolve markers")
+    def _resolve_markers(self, params):
+        """ Determine the indices of background markers, and set them as
+        background regions in baseline parameters """
+        if self._background_regions is None:
+            self._background_regions = background_regions(
+                self.abscissa, self.background_markers
+            )
+        params["background_regions"] = list(self._background_regions)
+        return params
+
+    def _baseline_key(self, params):
+        """ Cache key of the baseline of the current data. The untrimmed data is only
+        hashed once, when loaded; trims are identified by their range of indices. """
+        return baseline_key(self._data_digest, dict(params, trim=self.trim_range))
+
+    @QtCore.pyqtSlot(dict)
+    @timed("compute baseline")
+    def compute_baseline(self, params, generation=None):
         """ Compute dual-tree complex wavelet baseline. All parameters are
-        passed to scikit-ued's baseline_dt function. """
+        passed to :func:`dtgui.baseline.iter_baseline`. If a stack of spectra is
+        loaded, the baselines of all spectra are computed at once.
 
-        # Determine the background markers index
-        markers_index = sorted(
-            [np.argmin(np.abs(m - self.abscissa)) for m in self.background_markers]
-        )
-        params["background_regions"] = markers_index
+        Intermediate baselines of single spectra are plotted as iterations progress,
+        if streaming is enabled, unless baselines are computed by a compute server
+        (see :meth:`set_server`). Iterations stop early once the tolerance ``tol``
+        is met.
+
+        Baselines are cached, based on the data and parameters. If this computation
+        was requested via :meth:`request_baseline` and a more recent request was made
+        in the meantime, the computation is abandoned, between iterations (of every
+        block of spectra, for stacks). """
+
+        self._last_params = dict(params)
+        params = self._resolve_markers(params)
+
+        data = self.raw_ordinates if self.stack is None else self.stack
+        key = self._baseline_key(params)
+        baseline = self.cache.get(key)
+        if baseline is not None:
+            self.status_message_signal.emit("Baseline retrieved from cache")
+        elif self.server is not None:
+            with span("remote baseline"):
+                baseline = self._remote_baseline(data, params, generation)
+            if baseline is None:
+                return
+            self.cache.put(key, baseline)
+        elif self.stack is not None:
+            with span("baseline"):
+                for _, baseline in iter_baseline_stack(data, **params):
+                    if self.is_stale(generation):
+                        return
+            self.cache.put(key, baseline)
+        else:
+            last_emitted = time.perf_counter()
+            iteration, baseline = 0, np.zeros_like(data)
+            with span("baseline"):
+                for iteration, baseline in iter_baseline(data, **params):
+                    if self.is_stale(generation):
+                        return
+
+                    if self.streaming and (iteration % STREAM_EVERY == 0):
+                        now = time.perf_counter()
+                        if now - last_emitted >= STREAM_INTERVAL:
+                            self.baseline_plot_signal.emit(
+                                self.abscissa, baseline.copy()
+                            )
+                            last_emitted = now
+
+            baseline = baseline.copy()
+            self.cache.put(key, baseline)
+            self.status_message_signal.emit(
+                "Baseline computed in {} of at most {} iterations".format(
+                    iteration, params["max_iter"]
+                )
+            )
+        self.cache_stats_signal.emit(self.cache.stats())
+
+        if self.is_stale(generation):
+            return
 
-        self.baseline = baseline_dt(self.raw_ordinates, **params)
+        if self.stack is not None:
+            self.stack_baselines = baseline
+            self.baseline = self.stack_baselines[self.stack_index]
+        else:
+            self.baseline = baseline
         self.baseline_plot_signal.emit(self.abscissa, self.baseline)
+        self._precompute_neighbours()
@@ -1,9 +1,13 @@
 # -*- coding: utf-8 -*-
 
 import numpy as np
-from PyQt5 import QtWidgets, QtCore
+from PyQt5 import QtWidgets, QtCore, QtGui
 import pyqtgraph as pg
 
+# Above this number of points, data is drawn as lines rather than symbols,
+# which is much faster to render and easier to read at this density.
+LINE_THRESHOLD = 10000
+
 
 class DataViewer(QtWidgets.QWidget):
     """ Widget displaying raw and baseline-removed data """
@@ -11,6 +15,7 @@ class DataViewer(QtWidgets.QWidget):
     error_message_signal = QtCore.pyqtSignal(str)
     trim_bounds_signal = QtCore.pyqtSignal(float, float)
     background_markers_signal = QtCore.pyqtSignal(list)
+    spectrum_index_signal = QtCore.pyqtSignal(int)
 
     def __init__(self, *args, **kwargs):
 
@@ -37,19 +42,54 @@ class DataViewer(QtWidgets.QWidget):
             symbolSize=3,
             name="Baseline",
         )
+
         self.data_bounds_region = pg.LinearRegionItem()
         self.data_bounds_region.hide()
 
         # Background markers are pyqtgraph InfiniteLines that
-        # indicate points where background is expected
+        # indicate points where background is expected, or LinearRegionItems
+        # that indicate ranges where background is expected.
         self.background_markers = list()
 
+        # Level-of-detail rendering: only the visible part of the data is drawn,
+        # decimated to about one min/max pair per pixel so that peaks are preserved.
+        # Decimation is re-computed when the view changes, so zooming reveals details.
+        # These settings apply to all items subsequently added to the plot.
+        plot_item = self.plot_widget.getPlotItem()
+        plot_item.setClipToView(True)
+        plot_item.setDownsampling(auto=True, mode="peak")
+
         self.plot_widget.addItem(self.raw_data_item)
         self.plot_widget.addItem(self.baseline_data_item)
         self.plot_widget.addItem(self.data_bounds_region)
 
+        # Selection of a spectrum, when a stack of spectra or a session is loaded
+        self.spectrum_index_widget = QtWidgets.QSpinBox(parent=self)
+        self.spectrum_index_widget.valueChanged.connect(self.spectrum_index_signal)
+
+        previous_btn = QtWidgets.QPushButton("Previous", parent=self)
+        previous_btn.setShortcut(QtGui.QKeySequence(QtCore.Qt.Key_PageUp))
+        previous_btn.setToolTip("Display the previous spectrum (Page Up)")
+        previous_btn.clicked.connect(self.spectrum_index_widget.stepDown)
+
+        next_btn = QtWidgets.QPushButton("Next", parent=self)
+        next_btn.setShortcut(QtGui.QKeySequence(QtCore.Qt.Key_PageDown))
+        next_btn.setToolTip("Display the next spectrum (Page Down)")
+        next_btn.clicked.connect(self.spectrum_index_widget.stepUp)
+
+        self.stack_controls = QtWidgets.QWidget(parent=self)
+        stack_layout = QtWidgets.QHBoxLayout()
+        stack_layout.addWidget(QtWidgets.QLabel("Spectrum: "))
+        stack_layout.addWidget(self.spectrum_index_widget)
+        stack_layout.addWidget(previous_btn)
+        stack_layout.addWidget(next_btn)
+        stack_layout.addStretch(1)
+        self.stack_controls.setLayout(stack_layout)
+        self.stack_controls.hide()
+
         layout = QtWidgets.QVBoxLayout()
         layout.addWidget(self.plot_widget)
+        layout.addWidget(self.stack_controls)
 
         self.setLayout(layout)
 
@@ -61,24 +101,86 @@ class DataViewer(QtWidgets.QWidget):
         else:
             self.data_bounds_region.hide()
 
+    @QtCore.pyqtSlot(int)
+    def set_stack_size(self, size):
+        """ Show spectrum selection controls if more than one spectrum is loaded """
+        self.spectrum_index_widget.blockSignals(True)
+        self.spectrum_index_widget.setRange(0, max(0, size - 1))
+        self.spectrum_index_widget.setValue(0)
+        self.spectrum_index_widget.blockSignals(False)
+        self.stack_controls.setVisible(size > 1)
+
+    @QtCore.pyqtSlot(int)
+    def set_spectrum_index(self, index):
+        """ Display the index of the spectrum selected elsewhere, e.g. in a project """
+        self.spectrum_index_widget.blockSignals(True)
+        self.spectrum_index_widget.setValue(index)
+        self.spectrum_index_widget.blockSignals(False)
+
     @QtCore.pyqtSlot()
     def add_background_marker(self):
-        new_marker = pg.InfiniteLine(pos=0, angle=90, movable=True)
+        self._add_marker(0)
+
+    @QtCore.pyqtSlot()
+    def add_background_region(self):
+        # New regions span the central tenth of the visible range
+        (left, right), _ = self.plot_widget.getPlotItem().getViewBox().viewRange()
+        center, width = (left + right) / 2, (right - left) / 20
+        self._add_region((center - width, center + width))
+        self.actualize_bg_markers()
+
+    def _add_marker(self, position):
+        new_marker = pg.InfiniteLine(pos=position, angle=90, movable=True)
         new_marker.sigPositionChanged.connect(self.actualize_bg_markers)
         self.plot_widget.addItem(new_marker)
         self.background_markers.append(new_marker)
 
+    def _add_region(self, values):
+        new_region = pg.LinearRegionItem(
+            values=values, brush=pg.mkBrush(255, 255, 0, 50), movable=True,
+        )
+        new_region.sigRegionChanged.connect(self.actualize_bg_markers)
+        self.plot_widget.addItem(new_region)
+        self.background_markers.append(new_region)
+
     @QtCore.pyqtSlot()
     def clear_background_markers(self):
+        self._remove_background_markers()
+        self.background_markers_signal.emit(list())
+
+    @QtCore.pyqtSlot(list)
+    def set_background_markers(self, markers):
+        """
+        Replace background markers, e.g. by the markers of a project.
+
+        Parameters
+        ----------
+        markers : list
+            Points (floats) or regions ((start, stop) tuples), in abscissa units.
+        """
+        self._remove_background_markers()
+        for marker in markers:
+            if isinstance(marker, tuple):
+                self._add_region(marker)
+            else:
+                self._add_marker(marker)
+        self.actualize_bg_markers()
+
+    def _remove_background_markers(self):
         for item in self.background_markers:
             self.plot_widget.getPlotItem().removeItem(item)
         self.background_markers.clear()
-        self.background_markers_signal.emit(list())
 
     @QtCore.pyqtSlot(object)
     def actualize_bg_markers(self, *args):
+        # Points are floats, while regions are (start, stop) tuples
         self.background_markers_signal.emit(
-            [marker.value() for marker in self.background_markers]
+            [
+                tuple(marker.getRegion())
+                if isinstance(marker, pg.LinearRegionItem)
+                else marker.value()
+                for marker in self.background_markers
+            ]
         )
 
     @QtCore.pyqtSlot()
@@ -95,7 +197,7 @@ class DataViewer(QtWidgets.QWidget):
         ----------
         x, y : ndarray
         """
-        self.raw_data_item.setData(x=np.array(x), y=np.array(y))
+        self._set_data(self.raw_data_item, x, y, color="g")
 
     @QtCore.pyqtSlot()
     def clear_raw_data(self):
@@ -114,9 +216,27 @@ class DataViewer(QtWidgets.QWidget):
         baseline : ndarray
             Baseline of spectral data
         """
-        self.baseline_data_item.setData(x=np.array(x), y=np.array(y))
+        self._set_data(self.baseline_data_item, x, y, color="r")
 
     @QtCore.pyqtSlot()
     def clear_baseline_data(self):
         """ Clear baseline from plot """
         self.baseline_data_item.clear()
+
+    @staticmethod
+    def _set_data(item, x, y, color):
+        """ Set the data of a plot item, drawn as symbols or lines depending on size """
+        # Arrays are not copied; pyqtgraph does not modify data in-place.
+        x, y = np.asarray(x), np.asarray(y)
+        if len(x) > LINE_THRESHOLD:
+            item.setData(x=x, y=y, pen=pg.mkPen(color), symbol=None)
+        else:
+            item.setData(
+                x=x,
+                y=y,
+                pen=None,
+                symbol="o",
+                symbolBrush=pg.mkBrush(color),
+                symbolPen=None,
+                symbolSize=3,
+            )
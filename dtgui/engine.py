@@ -0,0 +1,496 @@
+# -*- coding: utf-8 -*-
+"""
+Batch baseline-removal engine. This module does not depend on Qt,
+so that it can be used from worker processes.
+"""
+import configparser
+import os
+import os.path
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from . import instrumentation
+from .baseline import baseline_stack, precision_dtype
+from .fileio import StackWriter, load_spectrum, save_columns, stack_spectra
+from .manifest import Manifest, parameters_digest
+
+PARAMETERS_FILENAME = "baseline_parameters.txt"
+PARAMETERS_SECTION = "BASELINE PARAMETERS"
+
+# Type of every parameter passed to baseline_dt. This is required
+# to parse parameters stored as text.
+PARAMETER_TYPES = {
+    "first_stage": str,
+    "wavelet": str,
+    "mode": str,
+    "max_iter": int,
+    "level": int,
+    "tol": float,
+    "precision": str,
+}
+
+# Maximum number of files sent to a worker process at once.
+MAX_CHUNKSIZE = 32
+
+# Minimum interval between writes of the manifest during batch runs, in seconds.
+# At most this much work is lost if a run is interrupted.
+MANIFEST_SAVE_INTERVAL = 5
+
+
+def write_parameters(directory, params):
+    """
+    Write baseline parameters into a configuration file in `directory`.
+
+    Parameters
+    ----------
+    directory : str
+        Directory in which to write the configuration file.
+    params : dict
+        Dictionary of parameters passed to baseline_dt.
+
+    Returns
+    -------
+    fname : str
+        Path to the configuration file.
+    """
+    config = configparser.ConfigParser()
+    config[PARAMETERS_SECTION] = params
+    fname = os.path.join(directory, PARAMETERS_FILENAME)
+    with open(fname, mode="w") as configfile:
+        config.write(configfile)
+    return fname
+
+
+def read_parameters(fname):
+    """
+    Read baseline parameters from a configuration file, as written by
+    :func:`write_parameters`.
+
+    Parameters
+    ----------
+    fname : str
+        Path to the configuration file.
+
+    Returns
+    -------
+    params : dict
+        Dictionary of parameters passed to baseline_dt.
+
+    Raises
+    ------
+    ValueError : if the file does not contain baseline parameters.
+    """
+    config = configparser.ConfigParser()
+    if not config.read(fname) or PARAMETERS_SECTION not in config:
+        raise ValueError("{} does not contain baseline parameters".format(fname))
+
+    section = config[PARAMETERS_SECTION]
+    return {
+        key: PARAMETER_TYPES.get(key, str)(value) for key, value in section.items()
+    }
+
+
+def processed_filename(fname, directory, extension=None):
+    """
+    Determine the location of the processed version of a file
+
+    Parameters
+    ----------
+    fname : str
+        Path to the raw data file.
+    directory : str
+        Directory in which processed files are stored.
+    extension : str or None, optional
+        Extension of the processed file, e.g. '.npy', which determines the file format.
+        If None (default), the extension of the raw data file is kept.
+
+    Returns
+    -------
+    processed_fname : str
+        Path to the processed file.
+    """
+    base = os.path.basename(fname)
+    if extension is not None:
+        base = os.path.splitext(base)[0] + extension
+    return os.path.join(directory, "bs_" + base)
+
+
+def compute_files(fnames, params):
+    """
+    Remove the baseline of spectra. If all spectra share the same abscissa, baselines
+    are computed all at once.
+
+    Parameters
+    ----------
+    fnames : iterable of str
+        Paths to the raw data files.
+    params : dict
+        Dictionary of parameters passed to baseline_dt.
+
+    Returns
+    -------
+    results : list of 2-tuples of `~numpy.ndarray`
+        Abscissa and baseline-corrected ordinates of every spectrum, in the
+        precision of computations.
+    """
+    dtype = _dtype(params)
+    spectra = [
+        tuple(np.asarray(a, dtype=dtype) for a in load_spectrum(fname))
+        for fname in fnames
+    ]
+    try:
+        abscissa, stack = stack_spectra(spectra)
+    except ValueError:
+        # Spectra have different abscissas, and must be processed one-by-one
+        return [
+            (x, y - baseline_stack(y[None, :], **params)[0]) for x, y in spectra
+        ]
+
+    processed = stack - baseline_stack(stack, **params)
+    return [(abscissa, row) for row in processed]
+
+
+def process_files(fnames, directory, params, extension=".csv", compression=None):
+    """
+    Remove the baseline of spectra, and save the results in `directory`.
+
+    Parameters
+    ----------
+    fnames : iterable of str
+        Paths to the raw data files.
+    directory : str
+        Directory in which to save the processed files.
+    params : dict
+        Dictionary of parameters passed to baseline_dt.
+    extension : str, optional
+        Extension of the processed files, which determines the file format.
+    compression : str or None, optional
+        Compression filter for the file formats that support it.
+
+    Returns
+    -------
+    processed_fnames : list of str
+        Paths to the processed files.
+    """
+    fnames = list(fnames)
+    processed_fnames = list()
+    for fname, (wavenumbers, processed) in zip(fnames, compute_files(fnames, params)):
+        # Assemble the result into two columns: wavenumbers first, then baseline-corrected counts
+        processed_fname = processed_filename(fname, directory, extension)
+        save_columns(
+            processed_fname,
+            names=("abscissa", "processed"),
+            arrays=(wavenumbers, processed),
+            header=False,
+            compression=compression,
+        )
+        processed_fnames.append(processed_fname)
+    return processed_fnames
+
+
+def _dtype(params):
+    """ Data-type of spectra processed with the given baseline parameters """
+    return precision_dtype(params.get("precision", "double"))
+
+
+def _check_outputs(fnames, directory, extension):
+    """ Raise a ValueError if different files would be processed into the same
+    file, e.g. files with the same name in different directories. """
+    sources = dict()
+    for fname in fnames:
+        output = os.path.normcase(processed_filename(fname, directory, extension))
+        source = sources.setdefault(output, fname)
+        if os.path.abspath(source) != os.path.abspath(fname):
+            raise ValueError(
+                "{} and {} would both be processed into {}".format(
+                    source, fname, processed_filename(fname, directory, extension)
+                )
+            )
+
+
+def _timed_call(func, fnames, *args):
+    """ Call ``func(fnames, *args)``, and return its result along with the
+    time elapsed in seconds. """
+    start = time.perf_counter()
+    result = func(fnames, *args)
+    return result, time.perf_counter() - start
+
+
+def _warm_up():
+    """ Import the dependencies of baseline computations. This is called before
+    worker processes are started, so that forked workers inherit them, and waits
+    for imports in progress in other threads, e.g. of the GUI, which would otherwise
+    never complete in forked workers. It is also submitted to every worker process,
+    to start workers right away. """
+    import skued  # noqa: F401
+
+
+class BatchProcessor:
+    """
+    Baseline-removal of many files, spread over a pool of worker processes.
+
+    Parameters
+    ----------
+    params : dict
+        Dictionary of parameters passed to baseline_dt.
+    directory : str
+        Directory in which to save the processed files.
+    workers : int or None, optional
+        Number of worker processes. If None (default), the number of CPUs is used.
+    initializer : callable or None, optional
+        Callable run at the start of every worker process.
+    extension : str, optional
+        Extension of the processed files, which determines the file format.
+        Default is '.csv'.
+    compression : str or None, optional
+        Compression filter for the file formats that support it, e.g. 'gzip' for HDF5.
+    timings : `~dtgui.instrumentation.Timings` or None, optional
+        Collection in which the processing time of every file is recorded, as
+        'batch file' spans. Files processed together share their processing time
+        equally. If None (default), timings of the current process are used.
+    force : bool, optional
+        If False (default), files which were already processed into `directory` with
+        the same parameters, and which have not changed since, are skipped. See
+        :class:`dtgui.manifest.Manifest`. If True, all files are processed.
+    """
+
+    def __init__(
+        self,
+        params,
+        directory,
+        workers=None,
+        initializer=None,
+        extension=".csv",
+        compression=None,
+        timings=None,
+        force=False,
+    ):
+        self.params = dict(params)
+        self.directory = directory
+        self.workers = workers or os.cpu_count() or 1
+        self.initializer = initializer
+        self.extension = extension
+        self.compression = compression
+        if timings is None:
+            timings = instrumentation.timings
+        self.timings = timings
+        self.force = force
+        # Files skipped during the last run, since they were up-to-date
+        self.skipped = list()
+        self._cancelled = False
+
+    def cancel(self):
+        """ Cancel the current run. Files currently being processed are completed,
+        but pending files are not processed. """
+        self._cancelled = True
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    @property
+    def manifest_parameters(self):
+        """ Parameters which determine the content of processed files """
+        return dict(self.params, compression=self.compression)
+
+    def run(self, files):
+        """
+        Process files in parallel. This is a generator, which yields the processed
+        filename of every file as soon as it is completed. Completion order is
+        not guaranteed to match the input order.
+
+        Processed files are recorded in the manifest of the output directory, as they
+        are completed. Unless `force` is True, files which are up-to-date are
+        skipped, and yielded first.
+
+        Parameters
+        ----------
+        files : iterable of str
+            Paths to the raw data files.
+
+        Yields
+        ------
+        fname, processed_fname : str
+            Path of the input file and of the processed file.
+
+        Raises
+        ------
+        ValueError : if files in different directories share the same name, since they
+            would be processed into the same file. Nothing is processed then.
+        """
+        # Cancellation applies from the start, including while skipped files are yielded
+        self._cancelled = False
+        files = list(files)
+        _check_outputs(files, self.directory, self.extension)
+
+        manifest = Manifest(self.directory)
+        params = self.manifest_parameters
+        digest = parameters_digest(params)
+
+        # Files are checked before processing starts, so that changes to files
+        # during processing are detected by the next run
+        self.skipped, pending = list(), dict()
+        for fname in files:
+            output = processed_filename(fname, self.directory, self.extension)
+            if not self.force and manifest.is_current(output, digest, [fname]):
+                self.skipped.append(fname)
+            else:
+                pending[fname] = os.stat(fname)
+
+        last_saved = time.perf_counter()
+        try:
+            for fname in self.skipped:
+                yield fname, processed_filename(fname, self.directory, self.extension)
+            if self._cancelled:
+                return
+
+            results = self._map(
+                process_files,
+                pending,
+                self.directory,
+                self.params,
+                self.extension,
+                self.compression,
+            )
+            for _, fname, processed_fname in results:
+                manifest.record(
+                    processed_fname, params, [fname], stats={fname: pending[fname]}
+                )
+                if time.perf_counter() - last_saved > MANIFEST_SAVE_INTERVAL:
+                    manifest.save()
+                    last_saved = time.perf_counter()
+                yield fname, processed_fname
+        finally:
+            # Completed files are recorded even if the run was interrupted
+            manifest.save()
+
+    def run_stacked(self, files, fname):
+        """
+        Process files in parallel, and store the results in a single stacked dataset
+        (see :class:`dtgui.fileio.StackWriter`). All files must share the same abscissa.
+        This is a generator, which yields every input filename as soon as it is completed.
+        If the run is cancelled, the stacked file is not written.
+
+        Parameters
+        ----------
+        files : iterable of str
+            Paths to the raw data files.
+        fname : str
+            Path to the stacked file. The extension determines the file format.
+
+        Yields
+        ------
+        fname, stack_fname : str
+            Path of the input file and of the stacked file.
+
+        Raises
+        ------
+        ValueError : if files do not share the same abscissa.
+
+        Notes
+        -----
+        Unless `force` is True, processing is skipped if the stacked file was
+        produced from the same files, which are unchanged, with the same parameters.
+        Otherwise, all files are processed again.
+        """
+        self._cancelled = False
+        files = list(files)
+        if not files:
+            return
+
+        manifest = Manifest(self.directory)
+        params = self.manifest_parameters
+        digest = parameters_digest(params)
+        stats = {f: os.stat(f) for f in files}
+        self.skipped = list()
+        if not self.force and manifest.is_current(fname, digest, files):
+            self.skipped = files
+            manifest.save()
+            for input_fname in files:
+                yield input_fname, fname
+            return
+        if self._cancelled:
+            return
+
+        reference, _ = load_spectrum(files[0])
+        reference = np.asarray(reference, dtype=_dtype(self.params))
+        with StackWriter(
+            fname,
+            abscissa=reference,
+            num_spectra=len(files),
+            labels=[os.path.basename(f) for f in files],
+            compression=self.compression,
+        ) as writer:
+            written = set()
+            for index, input_fname, (abscissa, processed) in self._map(
+                compute_files, files, self.params
+            ):
+                if not np.array_equal(abscissa, reference):
+                    raise ValueError(
+                        "{} does not share the abscissa of {}".format(
+                            input_fname, files[0]
+                        )
+                    )
+                writer.write(index, processed)
+                written.add(index)
+                yield input_fname, fname
+
+            # Spectra which were not processed, e.g. because the run was cancelled,
+            # would be left as zeros in the stack
+            complete = not self._cancelled and len(written) == len(files)
+            if not complete:
+                writer.discard()
+
+        # The stacked file is only replaced, and recorded, once all files are processed.
+        # Otherwise, an earlier stack would be recorded as produced from these files
+        if complete:
+            manifest.record(fname, params, files, stats=stats)
+            manifest.save()
+
+    def _map(self, func, files, *args):
+        """
+        Apply ``func(fnames, *args)`` to chunks of files in a pool of worker processes,
+        where ``func`` returns one result per file. This is a generator, which yields
+        results as soon as they are available.
+
+        Yields
+        ------
+        index, fname, result
+            Index and path of the input file, and result of ``func``.
+        """
+        files = list(files)
+        if not files:
+            return
+
+        # Files are sent to workers in chunks, so that spectra sharing the
+        # same abscissa can be processed together. Chunks are small enough that
+        # every worker gets a few chunks, which balances the load.
+        workers = min(self.workers, len(files))
+        chunksize = max(1, min(MAX_CHUNKSIZE, len(files) // (4 * workers)))
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=self.initializer
+        ) as executor:
+            pending = {
+                executor.submit(
+                    _timed_call, func, files[start : start + chunksize], *args
+                ): start
+                for start in range(0, len(files), chunksize)
+            }
+            try:
+                while pending:
+                    done, _ = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        start = pending.pop(future)
+                        results, elapsed = future.result()
+                        for index, result in enumerate(results, start=start):
+                            self.timings.record("batch file", elapsed / len(results))
+                            yield index, files[index], result
+
+                    if self._cancelled:
+                        break
+            finally:
+                # Pending work is dropped on cancellation, or if an error occurred
+                for future in pending:
+                    future.cancel()
@@ -0,0 +1,672 @@
+# -*- coding: utf-8 -*-
+"""
+Reading and writing spectra. This module does not depend on Qt.
+
+Spectra can be stored as comma-separated values (.csv), or in binary columnar
+formats: NumPy arrays (.npy), NumPy archives (.npz) and HDF5 (.h5, .hdf5).
+The file format is determined by the file extension.
+
+Files are written atomically: data is written into a temporary file, which then
+replaces the destination. Incomplete files are never visible, even if writing fails.
+"""
+import os
+import os.path
+import uuid
+import warnings
+from contextlib import contextmanager
+from importlib.util import find_spec
+
+import numpy as np
+
+# h5py is optional. It is only imported when HDF5 files are used, since
+# importing it slows down startup.
+WITH_H5PY = find_spec("h5py") is not None
+
+# Starting with NumPy 1.23, np.loadtxt is implemented in C. Before that,
+# it parses files line-by-line in Python, which is very slow for large files.
+# The bulk parser is therefore only used with NumPy 1.20 to 1.22.
+NUMPY_HAS_C_LOADTXT = tuple(int(v) for v in np.__version__.split(".")[:2]) >= (1, 23)
+
+# Size of the blocks of text parsed at once by the bulk parser, in bytes
+CHUNK_SIZE = 2 ** 26
+
+# Number of rows of CSV files written at once, between progress reports
+CSV_BLOCK_ROWS = 2 ** 16
+
+# Format of single-precision values written to CSV files. Nine significant digits
+# are enough to read values back exactly, and much faster to write than the default.
+CSV_SINGLE_FORMAT = "%.8e"
+
+
+def read_csv(fname):
+    """
+    Read a CSV file. It is assumed that the CSV file has two columns (x, y)
+    with no footers. Header lines starting with '#' are ignored. Further
+    columns, e.g. the baseline of exported data, are ignored.
+
+    The fastest parser available is used: NumPy's C parser if available,
+    or a chunked bulk parser otherwise. If the bulk parser cannot make sense of the
+    file, ``np.loadtxt`` is used as a fallback.
+
+    Parameters
+    ----------
+    fname : str
+        Path to the CSV file.
+
+    Returns
+    -------
+    x, y : `~numpy.ndarray`, ndim 1
+        Contiguous abscissa and ordinates.
+    """
+    if not NUMPY_HAS_C_LOADTXT:
+        try:
+            return _split_columns(_read_csv_chunked(fname))
+        except ValueError:
+            pass
+    return _split_columns(np.loadtxt(fname, delimiter=",", ndmin=2))
+
+
+def _split_columns(arr):
+    """ Split the first two columns of an array into two contiguous arrays. """
+    if arr.ndim != 2 or arr.shape[1] < 2:
+        raise ValueError(
+            "Expected two columns (x, y), but found array of shape {}".format(arr.shape)
+        )
+    return np.ascontiguousarray(arr[:, 0]), np.ascontiguousarray(arr[:, 1])
+
+
+def _read_csv_chunked(fname, chunksize=CHUNK_SIZE):
+    """
+    Bulk parser of CSV files. Text is parsed in large blocks
+    by NumPy's C number parser, rather than line-by-line.
+
+    Parameters
+    ----------
+    fname : str
+        Path to the CSV file.
+    chunksize : int, optional
+        Approximate size of the blocks of text parsed at once, in bytes.
+
+    Returns
+    -------
+    arr : `~numpy.ndarray`, shape (N, k)
+
+    Raises
+    ------
+    ValueError : if the file is not made of columns of numbers.
+    """
+    blocks = list()
+    remainder = b""
+    header = True
+    with open(fname, mode="rb") as f:
+        while True:
+            chunk = f.read(chunksize)
+            text = remainder + chunk
+            if not chunk:
+                remainder = b""
+            else:
+                # Only complete lines are parsed
+                end = text.rfind(b"\n") + 1
+                text, remainder = text[:end], text[end:]
+
+            if header:
+                text = _strip_header(text)
+                header = not text.strip()
+
+            if text.strip():
+                blocks.append(_parse_block(text))
+
+            if not chunk:
+                break
+
+    if not blocks:
+        raise ValueError("{} does not contain any data".format(fname))
+    return np.concatenate(blocks)
+
+
+def _strip_header(text):
+    """ Remove leading lines starting with '#' """
+    while text.lstrip().startswith(b"#"):
+        end = text.find(b"\n")
+        text = text[end + 1 :] if end >= 0 else b""
+    return text
+
+
+def _parse_block(text):
+    """ Parse complete lines of comma-separated text into an array of shape (N, k) """
+    text = text.strip()
+    num_lines = text.count(b"\n") + 1
+    num_columns = text.split(b"\n", 1)[0].count(b",") + 1
+    with warnings.catch_warnings():
+        # np.fromstring only warns when it cannot parse the entire text
+        warnings.simplefilter("error", DeprecationWarning)
+        try:
+            values = np.fromstring(text.replace(b"\n", b",").decode("ascii"), sep=",")
+        except (DeprecationWarning, UnicodeDecodeError) as e:
+            raise ValueError(str(e))
+
+    if values.size != num_columns * num_lines:
+        raise ValueError("Expected {} values per line".format(num_columns))
+    return values.reshape((-1, num_columns))
+
+
+def write_csv(fname, names, arrays, header=True, progress=None, **kwargs):
+    """
+    Write columns of data to a CSV file. Rows are written in blocks, since
+    formatting text is slow for large files.
+
+    Parameters
+    ----------
+    fname : str
+        Path to the CSV file.
+    names : iterable of str
+        Names of the columns.
+    arrays : iterable of `~numpy.ndarray`, ndim 1
+        Columns of data.
+    header : bool, optional
+        If True (default), column names are written as a header.
+    progress : callable or None, optional
+        Callable ``progress(written, total)`` called after every block of rows.
+    """
+    table = np.column_stack(arrays)
+    fmt = CSV_SINGLE_FORMAT if table.dtype == np.float32 else "%.18e"
+    with open(fname, mode="w") as f:
+        if header:
+            f.write("# {}\n".format(", ".join(names)))
+        for start in range(0, len(table), CSV_BLOCK_ROWS):
+            stop = min(start + CSV_BLOCK_ROWS, len(table))
+            np.savetxt(f, table[start:stop], delimiter=",", fmt=fmt)
+            if progress is not None:
+                progress(stop, len(table))
+
+
+def read_npy(fname):
+    """
+    Read a spectrum from a NumPy array file. The array is memory-mapped.
+
+    The array is expected to be columnar, i.e. of shape (k, N), where the first
+    row is the abscissa and the second row are the ordinates. Arrays of
+    shape (N, k), like the ones read from CSV files, are also supported.
+
+    Parameters
+    ----------
+    fname : str
+        Path to the .npy file.
+
+    Returns
+    -------
+    x, y : `~numpy.ndarray`, ndim 1
+    """
+    arr = np.load(fname, mmap_mode="r")
+    if arr.ndim != 2:
+        raise ValueError(
+            "Expected a two-dimensional array, but found shape {}".format(arr.shape)
+        )
+    if arr.shape[0] > 3 and arr.shape[1] <= 3:
+        arr = arr.T
+    return arr[0], arr[1]
+
+
+def write_npy(fname, names, arrays, **kwargs):
+    """
+    Write columns of data to a NumPy array file, as a columnar array of shape (k, N).
+    Column names are not stored.
+
+    Parameters
+    ----------
+    fname : str
+        Path to the .npy file.
+    names : iterable of str
+        Names of the columns. Ignored.
+    arrays : iterable of `~numpy.ndarray`, ndim 1
+        Columns of data.
+    """
+    np.save(fname, np.stack(arrays))
+
+
+def read_npz(fname):
+    """
+    Read a spectrum from a NumPy archive. The archive is expected to contain
+    an array named 'abscissa', as well as an array named either 'ordinates' or 'processed'.
+
+    Parameters
+    ----------
+    fname : str
+        Path to the .npz file.
+
+    Returns
+    -------
+    x, y : `~numpy.ndarray`, ndim 1
+    """
+    with np.load(fname) as archive:
+        return archive["abscissa"], archive[_ordinates_name(archive.files, fname)]
+
+
+def write_npz(fname, names, arrays, compression=None, **kwargs):
+    """
+    Write columns of data to a NumPy archive, one array per column.
+
+    Parameters
+    ----------
+    fname : str
+        Path to the .npz file.
+    names : iterable of str
+        Names of the columns.
+    arrays : iterable of `~numpy.ndarray`, ndim 1
+        Columns of data.
+    compression : str or None, optional
+        If not None, the archive is compressed.
+    """
+    savefunc = np.savez if compression is None else np.savez_compressed
+    savefunc(fname, **dict(zip(names, arrays)))
+
+
+def read_hdf5(fname):
+    """
+    Read a spectrum from an HDF5 file. The file is expected to contain
+    a dataset named 'abscissa', as well as a dataset named either 'ordinates' or 'processed'.
+
+    Parameters
+    ----------
+    fname : str
+        Path to the HDF5 file.
+
+    Returns
+    -------
+    x, y : `~numpy.ndarray`, ndim 1
+    """
+    import h5py
+
+    with h5py.File(fname, mode="r") as f:
+        return f["abscissa"][()], f[_ordinates_name(f.keys(), fname)][()]
+
+
+def write_hdf5(fname, names, arrays, compression=None, **kwargs):
+    """
+    Write columns of data to an HDF5 file, one chunked dataset per column.
+
+    Parameters
+    ----------
+    fname : str
+        Path to the HDF5 file.
+    names : iterable of str
+        Names of the columns.
+    arrays : iterable of `~numpy.ndarray`, ndim 1
+        Columns of data.
+    compression : str or None, optional
+        HDF5 compression filter, e.g. 'gzip' or 'lzf'. Default is no compression.
+    """
+    import h5py
+
+    with h5py.File(fname, mode="w") as f:
+        for name, arr in zip(names, arrays):
+            f.create_dataset(name, data=arr, chunks=True, compression=compression)
+
+
+def _ordinates_name(keys, fname):
+    """ Determine which array contains ordinates """
+    for name in ("ordinates", "processed"):
+        if name in keys:
+            return name
+    raise ValueError("{} does not contain ordinates".format(fname))
+
+
+READERS = {".csv": read_csv, ".npy": read_npy, ".npz": read_npz}
+WRITERS = {".csv": write_csv, ".npy": write_npy, ".npz": write_npz}
+
+if WITH_H5PY:
+    READERS.update({".h5": read_hdf5, ".hdf5": read_hdf5})
+    WRITERS.update({".h5": write_hdf5, ".hdf5": write_hdf5})
+
+FORMAT_NAMES = {
+    ".csv": "Comma-separated values",
+    ".npy": "NumPy array",
+    ".npz": "NumPy archive",
+    ".h5": "HDF5",
+    ".hdf5": "HDF5",
+}
+
+
+def extension(fname):
+    """ Lowercase file extension, e.g. '.csv' """
+    return os.path.splitext(fname)[-1].lower()
+
+
+def temporary_filename(fname):
+    """
+    Unique path to a temporary file next to `fname`, with the same extension. Since
+    both files are in the same directory, the temporary file can replace
+    `fname` atomically.
+
+    Parameters
+    ----------
+    fname : str
+        Path to the destination file.
+
+    Returns
+    -------
+    temporary : str
+        Path to a file which does not exist.
+    """
+    directory, base = os.path.split(os.path.abspath(fname))
+    root, ext = os.path.splitext(base)
+    return os.path.join(directory, ".{}.{}.tmp{}".format(root, uuid.uuid4().hex, ext))
+
+
+@contextmanager
+def atomic_write(fname):
+    """
+    Context manager for writing a file atomically. The path to a temporary file is
+    yielded, which replaces `fname` once the body completes. If an exception is
+    raised, the temporary file is removed and `fname` is untouched.
+
+    Parameters
+    ----------
+    fname : str
+        Path to the destination file.
+
+    Yields
+    ------
+    temporary : str
+        Path to the temporary file to write.
+    """
+    temporary = temporary_filename(fname)
+    try:
+        yield temporary
+    except BaseException:
+        _remove(temporary)
+        raise
+    os.replace(temporary, fname)
+
+
+def _remove(fname):
+    """ Remove a file, if it exists """
+    try:
+        os.remove(fname)
+    except OSError:
+        pass
+
+
+def _handler(registry, fname):
+    try:
+        return registry[extension(fname)]
+    except KeyError:
+        raise ValueError(
+            "Unsupported file format {}. Supported formats are {}".format(
+                extension(fname), ", ".join(sorted(registry))
+            )
+        )
+
+
+def load_spectrum(fname):
+    """
+    Read a spectrum. The file format is determined by the file extension.
+
+    Parameters
+    ----------
+    fname : str
+        Path to the file.
+
+    Returns
+    -------
+    x, y : `~numpy.ndarray`, ndim 1
+        Abscissa and ordinates.
+
+    Raises
+    ------
+    ValueError : if the file format is not supported.
+    """
+    return _handler(READERS, fname)(fname)
+
+
+def stack_spectra(spectra):
+    """
+    Stack spectra which share the same abscissa into a two-dimensional array.
+
+    Parameters
+    ----------
+    spectra : iterable of 2-tuples of `~numpy.ndarray`
+        Spectra as (x, y) pairs.
+
+    Returns
+    -------
+    x : `~numpy.ndarray`, shape (N,)
+        Abscissa shared by all spectra.
+    stack : `~numpy.ndarray`, shape (M, N)
+        Ordinates of all spectra.
+
+    Raises
+    ------
+    ValueError : if spectra do not share the same abscissa.
+    """
+    spectra = list(spectra)
+    if not spectra:
+        raise ValueError("No spectra to stack")
+
+    reference = spectra[0][0]
+    for x, _ in spectra[1:]:
+        if not np.array_equal(x, reference):
+            raise ValueError("Spectra do not share the same abscissa")
+    return np.asarray(reference), np.stack([y for _, y in spectra])
+
+
+def load_stack(fnames):
+    """
+    Read many spectra which share the same abscissa, into a two-dimensional array.
+
+    Parameters
+    ----------
+    fnames : iterable of str
+        Paths to the files. File formats are determined by file extensions.
+
+    Returns
+    -------
+    x : `~numpy.ndarray`, shape (N,)
+        Abscissa shared by all spectra.
+    stack : `~numpy.ndarray`, shape (M, N)
+        Ordinates of all spectra.
+
+    Raises
+    ------
+    ValueError : if spectra do not share the same abscissa.
+    """
+    return stack_spectra(load_spectrum(fname) for fname in fnames)
+
+
+def save_columns(fname, names, arrays, header=True, compression=None, progress=None):
+    """
+    Write columns of data to a file atomically. The file format is determined by
+    the file extension.
+
+    Parameters
+    ----------
+    fname : str
+        Path to the file.
+    names : iterable of str
+        Names of the columns, e.g. ``("abscissa", "processed", "baseline")``.
+    arrays : iterable of `~numpy.ndarray`, ndim 1
+        Columns of data, all of the same length.
+    header : bool, optional
+        If True (default), text formats include column names as a header.
+    compression : str or None, optional
+        Compression filter for the formats that support it, e.g. 'gzip' for HDF5.
+    progress : callable or None, optional
+        Callable ``progress(written, total)`` called as rows are written. Only
+        text formats report progress before completion.
+
+    Raises
+    ------
+    ValueError : if the file format is not supported.
+    """
+    writer = _handler(WRITERS, fname)
+    arrays = tuple(arrays)
+    with atomic_write(fname) as temporary:
+        writer(
+            temporary,
+            tuple(names),
+            arrays,
+            header=header,
+            compression=compression,
+            progress=progress,
+        )
+    if progress is not None:
+        size = len(arrays[0]) if arrays else 0
+        progress(size, size)
+
+
+def dialog_filter(extensions):
+    """
+    File dialog filter string for a set of extensions, e.g.
+    'Spectra (*.csv *.npy);;Comma-separated values (*.csv);;NumPy array (*.npy)'
+
+    Parameters
+    ----------
+    extensions : iterable of str
+        File extensions, e.g. ``READERS.keys()``
+
+    Returns
+    -------
+    filter : str
+    """
+    extensions = list(extensions)
+    filters = ["Spectra ({})".format(" ".join("*" + ext for ext in extensions))]
+    filters.extend(
+        "{} (*{})".format(FORMAT_NAMES.get(ext, ext), ext) for ext in extensions
+    )
+    return ";;".join(filters)
+
+
+class StackWriter:
+    """
+    Writer of many spectra sharing the same abscissa into a single stacked
+    two-dimensional dataset of shape (num_spectra, N). Spectra can be written in any order.
+
+    The file format is determined by the file extension:
+
+    * NumPy arrays (.npy) are columnar arrays of shape (1 + num_spectra, N), where the
+      first row is the abscissa. Rows are written directly into a memory-mapped file.
+    * NumPy archives (.npz) contain the arrays 'abscissa', 'processed' and 'labels'.
+      The archive is only written when the writer is closed.
+    * HDF5 files (.h5, .hdf5) contain the datasets 'abscissa', 'processed' and 'labels'.
+      Spectra are written as they come, one chunk per spectrum.
+
+    Spectra are written into a temporary file, which replaces `fname` once the writer
+    is closed. If an exception is raised within a ``with`` block, the stack is discarded.
+    Stacks discarded within a ``with`` block are not written when the block exits.
+
+    Parameters
+    ----------
+    fname : str
+        Path to the file.
+    abscissa : `~numpy.ndarray`, shape (N,)
+        Abscissa shared by all spectra.
+    num_spectra : int
+        Number of spectra.
+    labels : iterable of str or None, optional
+        Label of every spectrum, e.g. input filenames.
+    compression : str or None, optional
+        Compression filter for the formats that support it, e.g. 'gzip' for HDF5.
+
+    Raises
+    ------
+    ValueError : if the file format does not support stacks.
+    """
+
+    extensions = (".npy", ".npz", ".h5", ".hdf5") if WITH_H5PY else (".npy", ".npz")
+
+    def __init__(self, fname, abscissa, num_spectra, labels=None, compression=None):
+        self.fname = fname
+        self.format = extension(fname)
+        if self.format not in self.extensions:
+            raise ValueError(
+                "Stacks cannot be saved in the {} format".format(self.format)
+            )
+        self._temporary = temporary_filename(fname)
+        self._finished = False
+
+        abscissa = np.asarray(abscissa)
+        self.shape = (num_spectra, abscissa.size)
+        self.compression = compression
+        labels = list(labels or [])
+
+        if self.format == ".npy":
+            self._file = None
+            self._data = np.lib.format.open_memmap(
+                self._temporary,
+                mode="w+",
+                dtype=abscissa.dtype,
+                shape=(1 + num_spectra, abscissa.size),
+            )
+            self._data[0] = abscissa
+            self._stack = self._data[1:]
+        elif self.format == ".npz":
+            self._file = None
+            self._data = {"abscissa": abscissa, "labels": np.array(labels, dtype=str)}
+            self._stack = np.zeros(self.shape, dtype=abscissa.dtype)
+        else:
+            import h5py
+
+            self._file = h5py.File(self._temporary, mode="w")
+            self._file.create_dataset("abscissa", data=abscissa)
+            self._file.create_dataset(
+                "labels", data=np.array(labels, dtype=h5py.string_dtype())
+            )
+            self._stack = self._file.create_dataset(
+                "processed",
+                shape=self.shape,
+                dtype=abscissa.dtype,
+                chunks=(1, abscissa.size),
+                compression=compression,
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if self._finished:
+            return
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def write(self, index, spectrum):
+        """
+        Write a spectrum into the stack.
+
+        Parameters
+        ----------
+        index : int
+            Position of the spectrum in the stack.
+        spectrum : `~numpy.ndarray`, shape (N,)
+        """
+        spectrum = np.asarray(spectrum)
+        if spectrum.shape != self.shape[1:]:
+            raise ValueError(
+                "Spectrum of shape {} does not match the stack shape {}".format(
+                    spectrum.shape, self.shape
+                )
+            )
+        self._stack[index] = spectrum
+
+    def close(self):
+        """ Finalize writing the stack, which then replaces the destination file. """
+        self._finished = True
+        if self.format == ".npy":
+            self._data.flush()
+            del self._data, self._stack
+        elif self.format == ".npz":
+            savefunc = np.savez if self.compression is None else np.savez_compressed
+            savefunc(self._temporary, processed=self._stack, **self._data)
+        else:
+            self._file.close()
+        os.replace(self._temporary, self.fname)
+
+    def discard(self):
+        """ Stop writing the stack. The destination file is untouched. """
+        self._finished = True
+        if self.format == ".npy":
+            del self._data, self._stack
+        elif self._file is not None:
+            self._file.close()
+        _remove(self._temporary)
@@ -6,20 +6,36 @@ import pyqtgraph as pg
 from PyQt5 import QtCore, QtGui, QtWidgets
 from qdarkstyle import load_stylesheet_pyqt5
 
-from .batch import BatchProcessDialog
 from .control_bar import ControlBar
 from .controller import Controller
 from .dataviewer import DataViewer
 from .error_aware import ErrorAware
+from .fileio import READERS, WRITERS, dialog_filter, extension
+from .io_executor import IOExecutor
+from .io_panel import IOPanel
+from .project import PROJECT_EXTENSION
+from .stats_panel import StatsPanel
+from .streaming import STREAM_EXTENSIONS
+
+PROJECT_FILTER = "dtgui project (*{})".format(PROJECT_EXTENSION)
 
 
 class DtGui(QtWidgets.QMainWindow, metaclass=ErrorAware):
 
     raw_data_path = QtCore.pyqtSignal(str)
+    raw_stack_paths = QtCore.pyqtSignal(list)
+    raw_session_paths = QtCore.pyqtSignal(list)
+    project_path = QtCore.pyqtSignal(str)
+    save_project_path = QtCore.pyqtSignal(str, dict)
     export_data_path = QtCore.pyqtSignal(str)
+    stream_paths = QtCore.pyqtSignal(str, str, dict)
+    sweep_requested_signal = QtCore.pyqtSignal()
+    server_signal = QtCore.pyqtSignal(object)
 
     error_message_signal = QtCore.pyqtSignal(str)
 
+    _preload_signal = QtCore.pyqtSignal()
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -28,14 +44,52 @@ class DtGui(QtWidgets.QMainWindow, metaclass=ErrorAware):
         self.controller.moveToThread(self._control_thread)
         self._control_thread.start()
 
-        self.raw_data_path.connect(self.controller.load_raw_data)
-        self.export_data_path.connect(self.controller.export_data)
+        # Files are read and written in a separate thread, so that file I/O and
+        # baseline computations do not wait for each other. Jobs are submitted
+        # immediately, from the requesting thread, so that they are listed as pending.
+        self.io = IOExecutor()
+        self._io_thread = QtCore.QThread()
+        self.io.moveToThread(self._io_thread)
+        self._io_thread.start()
+
+        self.raw_data_path.connect(self.io.load_spectrum, QtCore.Qt.DirectConnection)
+        self.raw_stack_paths.connect(self.io.load_stack, QtCore.Qt.DirectConnection)
+        self.raw_session_paths.connect(
+            self.io.load_session, QtCore.Qt.DirectConnection
+        )
+        self.io.spectrum_loaded_signal.connect(self.controller.set_spectrum)
+        self.io.stack_loaded_signal.connect(self.controller.set_stack)
+        self.io.session_loaded_signal.connect(self.controller.set_session)
+        self.io.processed_loaded_signal.connect(self.controller.set_processed)
+
+        self.project_path.connect(self.io.load_project, QtCore.Qt.DirectConnection)
+        self.io.project_loaded_signal.connect(self.controller.set_project)
+        self.save_project_path.connect(self.controller.request_project)
+        self.controller.project_signal.connect(
+            self.io.save_project, QtCore.Qt.DirectConnection
+        )
+
+        self.export_data_path.connect(self.controller.request_export)
+        self.controller.export_columns_signal.connect(
+            self.io.save_columns, QtCore.Qt.DirectConnection
+        )
+        self.stream_paths.connect(self.controller.stream_file)
+
+        # Data to sweep is requested from the controller, whose thread may
+        # replace it at any time, rather than being read from this thread
+        self.sweep_requested_signal.connect(self.controller.request_sweep_data)
+        self.controller.sweep_data_signal.connect(self.show_sweep_dialog)
 
         self.controls = ControlBar(parent=self)
         self.controls.setEnabled(False)
         self.controller.raw_data_loaded_signal.connect(self.controls.setEnabled)
+        self.controller.parameter_choices_signal.connect(
+            self.controls.set_parameter_choices
+        )
+        # Baseline requests are registered immediately, from this thread, so that
+        # requests which are superseded can be skipped by the controller.
         self.controls.baseline_parameters_signal.connect(
-            self.controller.compute_baseline
+            self.controller.request_baseline, QtCore.Qt.DirectConnection
         )
 
         self.data_viewer = DataViewer(parent=self)
@@ -46,26 +100,63 @@ class DtGui(QtWidgets.QMainWindow, metaclass=ErrorAware):
             self.data_viewer.clear_baseline_data
         )
         self.data_viewer.trim_bounds_signal.connect(self.controller.trim_data_bounds)
+        self.controller.stack_size_signal.connect(self.data_viewer.set_stack_size)
+        self.data_viewer.spectrum_index_signal.connect(self.controller.select_spectrum)
         self.controls.add_background_marker_signal.connect(
             self.data_viewer.add_background_marker
         )
+        self.controls.add_background_region_signal.connect(
+            self.data_viewer.add_background_region
+        )
         self.controls.clear_background_markers_signal.connect(
             self.data_viewer.clear_background_markers
         )
         self.data_viewer.background_markers_signal.connect(
             self.controller.update_background_markers
         )
+        self.data_viewer.background_markers_signal.connect(
+            self.controls.schedule_live_update
+        )
 
         self.controls.show_trim_widget.connect(self.data_viewer.toggle_trim_widget)
         self.controls.trim_bounds_signal.connect(self.data_viewer.trim_bounds)
+        self.controls.undo_trim_signal.connect(self.controller.undo_trim)
+        self.controls.redo_trim_signal.connect(self.controller.redo_trim)
+        self.controller.trim_history_signal.connect(self.controls.set_trim_history)
+        self.controller.project_restored_signal.connect(self.restore_project)
 
         self.error_message_signal.connect(self.show_error_message)
         self.controller.error_message_signal.connect(self.show_error_message)
+        self.controller.cache_stats_signal.connect(self.show_cache_stats)
+        self.controller.status_message_signal.connect(self.statusBar().showMessage)
+        self.controls.stream_iterations_signal.connect(self.controller.set_streaming)
+        self.controls.precision_signal.connect(self.controller.set_precision)
+
+        self.cache_stats_label = QtWidgets.QLabel(parent=self)
+        self.statusBar().addPermanentWidget(self.cache_stats_label)
         self.data_viewer.error_message_signal.connect(self.show_error_message)
 
-        load_raw_data_action = QtWidgets.QAction("Load CSV data", self)
+        load_raw_data_action = QtWidgets.QAction("Load data", self)
         load_raw_data_action.triggered.connect(self.load_raw_data)
 
+        load_stack_action = QtWidgets.QAction("Load stack of spectra", self)
+        load_stack_action.triggered.connect(self.load_stack)
+
+        load_session_action = QtWidgets.QAction("Load many spectra", self)
+        load_session_action.triggered.connect(self.load_session)
+
+        open_project_action = QtWidgets.QAction("Open project", self)
+        open_project_action.triggered.connect(self.open_project)
+
+        save_project_action = QtWidgets.QAction("Save project", self)
+        save_project_action.setToolTip(
+            "Save the data, trims, background markers, parameters and baseline, "
+            "so that they can be restored instantly."
+        )
+        save_project_action.triggered.connect(self.save_project)
+        save_project_action.setEnabled(False)
+        self.controller.raw_data_loaded_signal.connect(save_project_action.setEnabled)
+
         export_bs_data_action = QtWidgets.QAction(
             "Export background-subtracted data", self
         )
@@ -76,10 +167,88 @@ class DtGui(QtWidgets.QMainWindow, metaclass=ErrorAware):
         launch_batch_process_action = QtWidgets.QAction("Launch batch process", self)
         launch_batch_process_action.triggered.connect(self.launch_batch_process)
 
+        sweep_action = QtWidgets.QAction("Sweep parameters", self)
+        sweep_action.triggered.connect(self.sweep_requested_signal)
+        sweep_action.setEnabled(False)
+        self.controller.raw_data_loaded_signal.connect(sweep_action.setEnabled)
+
+        stream_action = QtWidgets.QAction("Process large spectrum", self)
+        stream_action.setToolTip(
+            "Remove the baseline of a spectrum which is too large to be loaded, "
+            "using the current parameters."
+        )
+        stream_action.triggered.connect(self.stream_large_spectrum)
+
+        # Watch folders are processed in a separate thread, which is only
+        # started while the action is checked
+        self._watch_worker = None
+        self._watch_thread = None
+        self.watch_action = QtWidgets.QAction("Watch folder", self)
+        self.watch_action.setCheckable(True)
+        self.watch_action.setToolTip(
+            "Remove the baseline of spectra as they are written into a directory, "
+            "using the current parameters, and display the latest spectrum."
+        )
+        self.watch_action.toggled.connect(self.toggle_watch)
+
+        # Baselines can be computed by a compute server, while the action is checked
+        self.server_action = QtWidgets.QAction("Connect to compute server", self)
+        self.server_action.setCheckable(True)
+        self.server_action.setToolTip(
+            "Compute baselines in a compute server, started with 'dtgui serve', "
+            "rather than in this process."
+        )
+        self.server_action.toggled.connect(self.toggle_server)
+        self.server_signal.connect(self.controller.set_server)
+        self.controller.server_connected_signal.connect(self.server_action.setChecked)
+
+        # Timing statistics are displayed in a panel which is hidden by default
+        self.stats_panel = StatsPanel(parent=self)
+        self.stats_panel.error_message_signal.connect(self.show_error_message)
+        self.stats_panel.start_profiling_signal.connect(self.controller.start_profiling)
+        self.stats_panel.stop_profiling_signal.connect(self.controller.stop_profiling)
+
+        self.stats_dock = QtWidgets.QDockWidget("Timing statistics", parent=self)
+        self.stats_dock.setWidget(self.stats_panel)
+        self.addDockWidget(QtCore.Qt.BottomDockWidgetArea, self.stats_dock)
+        self.stats_dock.hide()
+
+        show_stats_action = self.stats_dock.toggleViewAction()
+        show_stats_action.setText("Show timing statistics")
+
+        # Pending and completed file I/O jobs are listed in a panel hidden by default
+        self.io_panel = IOPanel(parent=self)
+        self.io_panel.error_message_signal.connect(self.show_error_message)
+        self.io.job_queued_signal.connect(self.io_panel.add_job)
+        self.io.job_started_signal.connect(self.io_panel.start_job)
+        self.io.job_progress_signal.connect(self.io_panel.set_progress)
+        self.io.job_finished_signal.connect(self.io_panel.finish_job)
+        self.io_panel.cancel_job_signal.connect(self.io.cancel, QtCore.Qt.DirectConnection)
+        self.io.status_message_signal.connect(self.statusBar().showMessage)
+        self.io.error_message_signal.connect(self.show_error_message)
+
+        self.io_dock = QtWidgets.QDockWidget("File I/O", parent=self)
+        self.io_dock.setWidget(self.io_panel)
+        self.addDockWidget(QtCore.Qt.BottomDockWidgetArea, self.io_dock)
+        self.io_dock.hide()
+
+        show_io_action = self.io_dock.toggleViewAction()
+        show_io_action.setText("Show file I/O")
+
         menu_bar = self.menuBar()
         menu_bar.addAction(load_raw_data_action)
+        menu_bar.addAction(load_stack_action)
+        menu_bar.addAction(load_session_action)
+        menu_bar.addAction(open_project_action)
+        menu_bar.addAction(save_project_action)
         menu_bar.addAction(export_bs_data_action)
         menu_bar.addAction(launch_batch_process_action)
+        menu_bar.addAction(sweep_action)
+        menu_bar.addAction(stream_action)
+        menu_bar.addAction(self.watch_action)
+        menu_bar.addAction(self.server_action)
+        menu_bar.addAction(show_stats_action)
+        menu_bar.addAction(show_io_action)
 
         layout = QtWidgets.QHBoxLayout()
         layout.addWidget(self.data_viewer)
@@ -93,9 +262,20 @@ class DtGui(QtWidgets.QMainWindow, metaclass=ErrorAware):
         self.center_window()
         self.show()
 
+        # Heavy dependencies are imported in the controller's thread, while the
+        # window is painted. Later requests to the controller wait until this is done.
+        self._preload_signal.connect(self.controller.preload)
+        self._preload_signal.emit()
+
     def closeEvent(self, event):
+        self.stop_watch()
+        self.controller.stop_precompute()
         self._control_thread.quit()
         self._control_thread.wait()
+        self.controller.set_server(None)
+        # Pending exports are completed before exiting
+        self.io.shutdown()
+        self._io_thread.wait()
         super().closeEvent(event)
 
     @QtCore.pyqtSlot()
@@ -108,26 +288,252 @@ class DtGui(QtWidgets.QMainWindow, metaclass=ErrorAware):
     @QtCore.pyqtSlot()
     def load_raw_data(self):
         fname = QtWidgets.QFileDialog.getOpenFileName(
-            parent=self, caption="Load data", filter="*.csv"
+            parent=self, caption="Load data", filter=dialog_filter(READERS)
         )[0]
         if fname:
             self.raw_data_path.emit(fname)
 
     @QtCore.pyqtSlot()
-    def export_bs_data(self):
-        fname = QtWidgets.QFileDialog.getSaveFileName(
-            parent=self, caption="Export data", filter="*.csv"
+    def load_stack(self):
+        fnames = QtWidgets.QFileDialog.getOpenFileNames(
+            parent=self,
+            caption="Load spectra sharing the same abscissa",
+            filter=dialog_filter(READERS),
+        )[0]
+        if fnames:
+            self.raw_stack_paths.emit(fnames)
+
+    @QtCore.pyqtSlot()
+    def load_session(self):
+        fnames = QtWidgets.QFileDialog.getOpenFileNames(
+            parent=self,
+            caption="Load spectra to step through",
+            filter=dialog_filter(READERS),
+        )[0]
+        if fnames:
+            self.raw_session_paths.emit(fnames)
+
+    @QtCore.pyqtSlot()
+    def open_project(self):
+        fname = QtWidgets.QFileDialog.getOpenFileName(
+            parent=self, caption="Open project", filter=PROJECT_FILTER
         )[0]
         if fname:
-            self.export_data_path.emit(fname)
+            self.project_path.emit(fname)
+
+    @QtCore.pyqtSlot()
+    def save_project(self):
+        fname = QtWidgets.QFileDialog.getSaveFileName(
+            parent=self, caption="Save project", filter=PROJECT_FILTER
+        )[0]
+        if not fname:
+            return
+        if extension(fname) != PROJECT_EXTENSION:
+            fname += PROJECT_EXTENSION
+        self.save_project_path.emit(fname, self.controls.baseline_parameters())
+
+    @QtCore.pyqtSlot(dict, list, int)
+    def restore_project(self, params, markers, index):
+        """ Display the parameters, background markers and selected spectrum
+        of a project restored by the controller """
+        self.controls.set_baseline_parameters(params)
+        self.data_viewer.set_background_markers(markers)
+        self.data_viewer.set_spectrum_index(index)
+
+    @QtCore.pyqtSlot()
+    def export_bs_data(self):
+        fname, selected_filter = QtWidgets.QFileDialog.getSaveFileName(
+            parent=self, caption="Export data", filter=dialog_filter(WRITERS)
+        )
+        if not fname:
+            return
+
+        # The file format is determined by the extension. If there is none,
+        # the first extension of the selected filter is used, e.g. "NumPy array (*.npy)"
+        if extension(fname) not in WRITERS:
+            fname += selected_filter.split("*")[1].split(" ")[0].rstrip(")")
+        self.export_data_path.emit(fname)
+
+    @QtCore.pyqtSlot()
+    def stream_large_spectrum(self):
+        # Streaming is only supported for formats which can be read and written in parts
+        extensions = [ext for ext in STREAM_EXTENSIONS if ext in READERS]
+        fname = QtWidgets.QFileDialog.getOpenFileName(
+            parent=self,
+            caption="Select large spectrum",
+            filter=dialog_filter(extensions),
+        )[0]
+        if not fname:
+            return
+
+        output = QtWidgets.QFileDialog.getSaveFileName(
+            parent=self,
+            caption="Save processed spectrum",
+            filter=dialog_filter(extensions),
+        )[0]
+        if output:
+            self.stream_paths.emit(fname, output, self.controls.baseline_parameters())
+
+    @QtCore.pyqtSlot(bool)
+    def toggle_watch(self, checked):
+        if checked:
+            self.start_watch()
+        else:
+            self.stop_watch()
+
+    @QtCore.pyqtSlot()
+    def start_watch(self):
+        # Watch folders are imported when first needed, to speed up startup
+        from .engine import write_parameters
+        from .watch import WatchFolder
+        from .watch_worker import WatchWorker
+
+        directory = QtWidgets.QFileDialog.getExistingDirectory(
+            parent=self, caption="Select directory to watch"
+        )
+        output = directory and QtWidgets.QFileDialog.getExistingDirectory(
+            parent=self, caption="Select directory in which to save processed files"
+        )
+        if not output:
+            self.watch_action.setChecked(False)
+            return
+
+        params = self.controls.baseline_parameters()
+        try:
+            folder = WatchFolder(directory, output, params)
+        except ValueError as e:
+            self.watch_action.setChecked(False)
+            self.show_error_message(str(e))
+            return
+        write_parameters(output, params)
+
+        self._watch_worker = WatchWorker(folder)
+        self._watch_thread = QtCore.QThread(parent=self)
+        self._watch_worker.moveToThread(self._watch_thread)
+
+        # Only the latest processed spectrum is read, and displayed
+        self._watch_worker.display_signal.connect(
+            self.io.load_processed, QtCore.Qt.DirectConnection
+        )
+        self._watch_worker.status_message_signal.connect(self.statusBar().showMessage)
+        self._watch_worker.error_message_signal.connect(self.show_error_message)
+        self._watch_worker.finished_signal.connect(self._watch_thread.quit)
+        self._watch_thread.started.connect(self._watch_worker.run)
+        self._watch_thread.start()
+        self.statusBar().showMessage("Watching {}".format(directory))
+
+    @QtCore.pyqtSlot()
+    def stop_watch(self):
+        """ Stop watching, once files being processed are completed """
+        if self._watch_worker is None:
+            return
+        # The thread exits its event loop once the worker is done
+        self._watch_worker.stop()
+        self._watch_thread.quit()
+        self._watch_thread.wait()
+        self._watch_worker = self._watch_thread = None
+        self.watch_action.setChecked(False)
+        self.statusBar().showMessage("Stopped watching")
+
+    @QtCore.pyqtSlot(bool)
+    def toggle_server(self, checked):
+        if not checked:
+            self.server_signal.emit(None)
+            return
+
+        # Compute servers are imported when first needed, to speed up startup
+        from multiprocessing import AuthenticationError
+
+        from .server import (
+            DEFAULT_ADDRESS,
+            ComputeClient,
+            authentication_key,
+            format_address,
+            parse_address,
+        )
+
+        address, ok = QtWidgets.QInputDialog.getText(
+            self,
+            "Connect to compute server",
+            "Address of the server (HOST:PORT, or path to a socket):",
+            text=format_address(DEFAULT_ADDRESS),
+        )
+        if ok:
+            key, ok = QtWidgets.QInputDialog.getText(
+                self,
+                "Connect to compute server",
+                "Authentication key of the server:",
+                QtWidgets.QLineEdit.Password,
+            )
+        if not ok:
+            self.server_action.setChecked(False)
+            return
+
+        try:
+            server = ComputeClient(
+                parse_address(address), authkey=authentication_key(key)
+            )
+        except (OSError, EOFError, AuthenticationError) as e:
+            self.server_action.setChecked(False)
+            self.show_error_message(
+                "Could not connect to the compute server at {}: {}".format(address, e)
+            )
+            return
+        self.server_signal.emit(server)
 
     @QtCore.pyqtSlot()
     def launch_batch_process(self):
+        # The batch-processing dialog is imported when first needed, to speed up startup
+        from .batch import BatchProcessDialog
+
         self.dialog = BatchProcessDialog(
             self.controls.baseline_parameters(), parent=self
         )
+        self.dialog.error_message_signal.connect(self.show_error_message)
+        return self.dialog.exec_()
+
+    @QtCore.pyqtSlot(object, object, list)
+    def show_sweep_dialog(self, abscissa, ordinates, regions):
+        """ Sweep parameters for the displayed spectrum, as trimmed, with
+        its background regions """
+        # The sweep dialog is imported when first needed, to speed up startup
+        from .sweep_dialog import SweepDialog
+
+        self.dialog = SweepDialog(
+            abscissa,
+            ordinates,
+            params=self.controls.baseline_parameters(),
+            choices=self.controls.parameter_choices(),
+            background_regions=regions,
+            parent=self,
+        )
+        self.dialog.error_message_signal.connect(self.show_error_message)
+        self.dialog.parameters_selected_signal.connect(
+            self.controls.set_baseline_parameters
+        )
         return self.dialog.exec_()
 
+    @QtCore.pyqtSlot(dict)
+    def show_cache_stats(self, stats):
+        text = (
+            "Baseline cache: {hits} hits, {misses} misses, {entries} baselines "
+            "({size:.1f} of {max_size:.0f} MB)".format(
+                size=stats["nbytes"] / 2 ** 20,
+                max_size=stats["max_bytes"] / 2 ** 20,
+                **stats
+            )
+        )
+        if "disk_entries" in stats:
+            text += (
+                "; on disk: {disk_hits} hits, {disk_entries} baselines "
+                "({size:.0f} of {max_size:.0f} MB)".format(
+                    size=stats["disk_nbytes"] / 2 ** 20,
+                    max_size=stats["disk_max_bytes"] / 2 ** 20,
+                    **stats
+                )
+            )
+        self.cache_stats_label.setText(text)
+
     @QtCore.pyqtSlot(str)
     def show_error_message(self, msg):
         self.error_dialog = QtWidgets.QErrorMessage(parent=self)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Conversion of abscissa values into indices, by binary search on sorted abscissas.
+This module does not depend on Qt.
+"""
+import numpy as np
+
+
+def _ascending(abscissa):
+    """ Returns an ascending view of a sorted abscissa, and whether it was reversed """
+    if abscissa[0] <= abscissa[-1]:
+        return abscissa, False
+    return abscissa[::-1], True
+
+
+def index_range(abscissa, lower, upper):
+    """
+    Range of indices of a sorted abscissa which lie between two bounds,
+    determined by binary search.
+
+    Parameters
+    ----------
+    abscissa : `~numpy.ndarray`, ndim 1
+        Abscissa, sorted in ascending or descending order.
+    lower, upper : float
+        Bounds, inclusive. The order of bounds is not important.
+
+    Returns
+    -------
+    start, stop : int
+        Abscissa values between the bounds are ``abscissa[start:stop]``.
+    """
+    lower, upper = sorted((lower, upper))
+    ascending, reversed_ = _ascending(abscissa)
+    start = np.searchsorted(ascending, lower, side="left")
+    stop = np.searchsorted(ascending, upper, side="right")
+    if reversed_:
+        start, stop = len(abscissa) - stop, len(abscissa) - start
+    return int(start), int(stop)
+
+
+def nearest_indices(abscissa, values):
+    """
+    Indices of the abscissa values nearest to many values at once,
+    determined by binary search.
+
+    Parameters
+    ----------
+    abscissa : `~numpy.ndarray`, ndim 1
+        Abscissa, sorted in ascending or descending order.
+    values : array_like
+        Values to locate.
+
+    Returns
+    -------
+    indices : `~numpy.ndarray` of ints
+        Indices of the nearest abscissa values. Ties are resolved to the lowest index.
+    """
+    values = np.asarray(values, dtype=float)
+    ascending, reversed_ = _ascending(abscissa)
+
+    right = np.clip(np.searchsorted(ascending, values), 1, len(ascending) - 1)
+    left = right - 1
+    left_distance = np.abs(values - ascending[left])
+    right_distance = np.abs(ascending[right] - values)
+    if reversed_:
+        # Ties are resolved to the right of the reversed abscissa,
+        # which is the lowest index of the original abscissa. The same goes for
+        # repeated abscissa values.
+        indices = np.where(right_distance <= left_distance, right, left)
+        indices = np.searchsorted(ascending, ascending[indices], side="right") - 1
+        return len(abscissa) - 1 - indices
+
+    indices = np.where(right_distance < left_distance, right, left)
+    return np.searchsorted(ascending, ascending[indices], side="left")
+
+
+def background_regions(abscissa, markers):
+    """
+    Indices of background regions, from background markers in abscissa units.
+
+    Parameters
+    ----------
+    abscissa : `~numpy.ndarray`, ndim 1
+        Abscissa, sorted in ascending or descending order.
+    markers : iterable
+        Background markers, either points (floats) or regions (2-tuples of floats).
+        Points are resolved to the nearest abscissa value, while regions include
+        all abscissa values between bounds.
+
+    Returns
+    -------
+    regions : list of ints and slices
+        Background regions, suitable as ``background_regions`` baseline parameter.
+        Points come first, sorted, followed by non-empty regions sorted by start.
+    """
+    if len(abscissa) < 2:
+        return list()
+
+    points, ranges = list(), list()
+    for marker in markers:
+        if np.ndim(marker) == 0:
+            points.append(marker)
+        else:
+            ranges.append(index_range(abscissa, *marker))
+
+    regions = sorted(set(int(i) for i in nearest_indices(abscissa, points)))
+    regions.extend(slice(start, stop) for start, stop in sorted(ranges) if start < stop)
+    return regions
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Timing instrumentation of the operations of dtgui. Timing spans are collected in
+memory, and can be summarized or dumped to JSON. This module does not depend on Qt.
+"""
+import cProfile
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+# Maximum number of individual spans kept in memory. Summaries include all spans.
+MAX_SPANS = 10000
+
+
+class Timings:
+    """
+    Collection of timing spans. This class is thread-safe.
+
+    Parameters
+    ----------
+    max_spans : int, optional
+        Maximum number of individual spans kept in memory. Older spans are
+        discarded, but are still included in summaries.
+    """
+
+    def __init__(self, max_spans=MAX_SPANS):
+        self._spans = deque(maxlen=max_spans)
+        self._summary = dict()
+        self._lock = threading.Lock()
+        self.enabled = True
+
+    def __len__(self):
+        return len(self._spans)
+
+    def record(self, name, duration, start=None):
+        """
+        Record a timing span.
+
+        Parameters
+        ----------
+        name : str
+            Name of the operation, e.g. 'load'.
+        duration : float
+            Duration of the operation, in seconds.
+        start : float or None, optional
+            Start time of the operation, from :func:`time.perf_counter`.
+        """
+        if not self.enabled:
+            return
+
+        thread = threading.current_thread().name
+        with self._lock:
+            self._spans.append((name, start, duration, thread))
+            count, total, longest = self._summary.get(name, (0, 0.0, 0.0))
+            self._summary[name] = (count + 1, total + duration, max(longest, duration))
+
+    @contextmanager
+    def span(self, name):
+        """
+        Context manager which records the time spent in its body, even if
+        an exception is raised.
+
+        Parameters
+        ----------
+        name : str
+            Name of the operation, e.g. 'load'.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, start=start)
+
+    def spans(self):
+        """
+        Individual timing spans, from oldest to most recent.
+
+        Returns
+        -------
+        spans : list of dict
+            Name, start time (in seconds, from an arbitrary origin), duration
+            (in seconds) and thread of every span.
+        """
+        with self._lock:
+            spans = list(self._spans)
+        return [
+            {"name": name, "start": start, "duration": duration, "thread": thread}
+            for name, start, duration, thread in spans
+        ]
+
+    def summary(self):
+        """
+        Summary of timings, per operation.
+
+        Returns
+        -------
+        summary : dict
+            Dictionary of operation names to dictionaries of the number of calls,
+            as well as the total, mean and maximum duration in seconds.
+        """
+        with self._lock:
+            items = list(self._summary.items())
+        return {
+            name: {
+                "count": count,
+                "total": total,
+                "mean": total / count,
+                "max": longest,
+            }
+            for name, (count, total, longest) in sorted(items)
+        }
+
+    def clear(self):
+        """ Discard all timing spans """
+        with self._lock:
+            self._spans.clear()
+            self._summary.clear()
+
+    def dump_json(self, fname):
+        """
+        Write timing spans and their summary to a JSON file.
+
+        Parameters
+        ----------
+        fname : str
+            Path to the JSON file.
+        """
+        with open(fname, mode="w") as f:
+            json.dump({"summary": self.summary(), "spans": self.spans()}, f, indent=2)
+
+
+class Profiler:
+    """
+    Deterministic profiling of instrumented operations, using cProfile. Operations are
+    only profiled within :meth:`profiling`, e.g. via :func:`timed` and :func:`span`,
+    rather than globally: Qt threads may not keep profiling hooks between slots.
+    This class is thread-safe, but only one thread is profiled at a time.
+    """
+
+    def __init__(self):
+        self._profile = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def running(self):
+        return self._profile is not None
+
+    def start(self):
+        """ Start profiling. Previous results are discarded. """
+        self._profile = cProfile.Profile()
+
+    def stop(self, fname=None):
+        """
+        Stop profiling, and write results to a file.
+
+        Parameters
+        ----------
+        fname : str or None, optional
+            Path to the profile, which can be read with :mod:`pstats`
+            or tools such as snakeviz. If None (default), results are discarded.
+
+        Raises
+        ------
+        RuntimeError : if profiling was not started.
+        """
+        if self._profile is None:
+            raise RuntimeError("Profiling was not started")
+        # Wait for the profiled operation in progress, if any
+        with self._lock:
+            profile, self._profile = self._profile, None
+        if fname:
+            profile.dump_stats(fname)
+
+    @contextmanager
+    def profiling(self):
+        """ Context manager which profiles its body, if profiling was started. Nested
+        operations are profiled as part of the outermost one. """
+        profile = self._profile
+        if profile is None or getattr(self._local, "active", False):
+            yield
+            return
+
+        # Another thread is being profiled
+        if not self._lock.acquire(blocking=False):
+            yield
+            return
+
+        self._local.active = True
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self._local.active = False
+            self._lock.release()
+
+
+# Timings and profiling of the current process
+timings = Timings()
+profiler = Profiler()
+
+
+@contextmanager
+def span(name):
+    """
+    Context manager which records the time spent in its body in :data:`timings`,
+    and profiles it if :data:`profiler` is running.
+
+    Parameters
+    ----------
+    name : str
+        Name of the operation, e.g. 'load'.
+    """
+    with timings.span(name), profiler.profiling():
+        yield
+
+
+def timed(name):
+    """
+    Decorator which records the time spent in a function in :data:`timings`,
+    and profiles it if :data:`profiler` is running.
+
+    Parameters
+    ----------
+    name : str
+        Name of the operation, e.g. 'load'.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def timed_func(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+
+        return timed_func
+
+    return decorator
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+import os.path
+from threading import Lock
+
+from PyQt5 import QtCore
+
+from .error_aware import ErrorAware
+from .fileio import load_spectrum, save_columns, stack_spectra
+from .instrumentation import span
+from .project import Project
+from .session import Session
+
+# Progress of jobs which cannot report it, e.g. reading a single file
+INDETERMINATE = -1
+
+# Final status of jobs
+DONE, FAILED, CANCELLED = "done", "failed", "cancelled"
+
+
+class IOExecutor(QtCore.QObject, metaclass=ErrorAware):
+    """
+    Reads and writes files in its own thread, so that file I/O does not delay baseline
+    computations. Jobs are executed one at a time, in the order in which they were
+    submitted. Jobs can be submitted and cancelled from any thread.
+
+    Every job is identified by an integer, and its progress is reported via signals.
+    """
+
+    job_queued_signal = QtCore.pyqtSignal(int, str)
+    job_started_signal = QtCore.pyqtSignal(int)
+    job_progress_signal = QtCore.pyqtSignal(int, int)
+    job_finished_signal = QtCore.pyqtSignal(int, str)
+
+    spectrum_loaded_signal = QtCore.pyqtSignal(object, object)
+    stack_loaded_signal = QtCore.pyqtSignal(object, object)
+    session_loaded_signal = QtCore.pyqtSignal(object)
+    processed_loaded_signal = QtCore.pyqtSignal(object, object, object)
+    project_loaded_signal = QtCore.pyqtSignal(object)
+    file_written_signal = QtCore.pyqtSignal(str)
+
+    status_message_signal = QtCore.pyqtSignal(str)
+    error_message_signal = QtCore.pyqtSignal(str)
+
+    _run_signal = QtCore.pyqtSignal(int)
+    _shutdown_signal = QtCore.pyqtSignal()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # Jobs are stored until they are run. Only the job identifier is sent to the
+        # thread of this object, so that cancelled jobs are dropped.
+        self._lock = Lock()
+        self._jobs = dict()
+        self._next_id = 0
+        self._run_signal.connect(self._run)
+        self._shutdown_signal.connect(self._shutdown)
+
+    def __len__(self):
+        """ Number of pending jobs """
+        with self._lock:
+            return len(self._jobs)
+
+    def submit(self, description, name, func, *args):
+        """
+        Submit a job. This method can be called from any thread.
+
+        Parameters
+        ----------
+        description : str
+            Description of the job, e.g. 'Export data.csv'.
+        name : str
+            Name of the operation in timing statistics, e.g. 'export'.
+        func : callable
+            Callable ``func(*args, progress)`` run in the thread of this object, where
+            ``progress(done, total)`` reports progress.
+
+        Returns
+        -------
+        job_id : int
+        """
+        with self._lock:
+            job_id = self._next_id
+            self._next_id += 1
+            self._jobs[job_id] = (name, func, args)
+        self.job_queued_signal.emit(job_id, description)
+        self._run_signal.emit(job_id)
+        return job_id
+
+    def cancel(self, job_id):
+        """
+        Cancel a pending job. Jobs which are running are completed. This method can
+        be called from any thread.
+
+        Parameters
+        ----------
+        job_id : int
+
+        Returns
+        -------
+        cancelled : bool
+            Whether the job was cancelled.
+        """
+        with self._lock:
+            cancelled = self._jobs.pop(job_id, None) is not None
+        if cancelled:
+            self.job_finished_signal.emit(job_id, CANCELLED)
+        return cancelled
+
+    def shutdown(self):
+        """ Stop the thread of this object once pending jobs are completed. This
+        method must be called from another thread. """
+        self._shutdown_signal.emit()
+
+    @QtCore.pyqtSlot()
+    def _shutdown(self):
+        self.thread().quit()
+
+    @QtCore.pyqtSlot(int)
+    def _run(self, job_id):
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is None:
+            return
+
+        name, func, args = job
+        self.job_started_signal.emit(job_id)
+        self.job_progress_signal.emit(job_id, INDETERMINATE)
+
+        def progress(done, total):
+            self.job_progress_signal.emit(job_id, int(100 * done / max(total, 1)))
+
+        try:
+            with span(name):
+                func(*args, progress)
+        except Exception:
+            self.job_finished_signal.emit(job_id, FAILED)
+            raise
+        self.job_finished_signal.emit(job_id, DONE)
+
+    def load_spectrum(self, fname):
+        """ Read a spectrum, which is emitted via `spectrum_loaded_signal`. """
+        return self.submit(
+            "Load {}".format(os.path.basename(fname)), "load", self._load, fname
+        )
+
+    def load_stack(self, fnames):
+        """ Read many spectra sharing the same abscissa, which are emitted
+        via `stack_loaded_signal`. """
+        return self.submit(
+            "Load stack of {} spectra".format(len(fnames)),
+            "load stack",
+            self._load_stack,
+            list(fnames),
+        )
+
+    def load_session(self, fnames):
+        """ Read many spectra as a :class:`dtgui.session.Session`, which is emitted
+        via `session_loaded_signal`. """
+        return self.submit(
+            "Load {} spectra".format(len(fnames)),
+            "load session",
+            self._load_session,
+            list(fnames),
+        )
+
+    def load_processed(self, fname, processed_fname):
+        """ Read a spectrum and its baseline-corrected version, e.g. written by a
+        batch process. The abscissa, spectrum and baseline are emitted
+        via `processed_loaded_signal`. """
+        return self.submit(
+            "Load {}".format(os.path.basename(processed_fname)),
+            "load",
+            self._load_processed,
+            fname,
+            processed_fname,
+        )
+
+    def save_columns(self, fname, names, arrays):
+        """ Write columns of data atomically. See :func:`dtgui.fileio.save_columns`.
+        Arrays must not be modified until they are written. """
+        return self.submit(
+            "Export {}".format(os.path.basename(fname)),
+            "export",
+            self._save_columns,
+            fname,
+            tuple(names),
+            tuple(arrays),
+        )
+
+    def load_project(self, fname):
+        """ Read a :class:`dtgui.project.Project`, which is emitted
+        via `project_loaded_signal`. """
+        return self.submit(
+            "Open {}".format(os.path.basename(fname)),
+            "load project",
+            self._load_project,
+            fname,
+        )
+
+    def save_project(self, fname, project):
+        """ Write a :class:`dtgui.project.Project` atomically. The project must
+        not be modified until it is written. """
+        return self.submit(
+            "Save {}".format(os.path.basename(fname)),
+            "save project",
+            self._save_project,
+            fname,
+            project,
+        )
+
+    def _load(self, fname, progress):
+        self.spectrum_loaded_signal.emit(*load_spectrum(fname))
+
+    def _load_stack(self, fnames, progress):
+        self.stack_loaded_signal.emit(*stack_spectra(_read(fnames, progress)))
+
+    def _load_session(self, fnames, progress):
+        self.session_loaded_signal.emit(
+            Session(
+                names=[os.path.basename(fname) for fname in fnames],
+                spectra=list(_read(fnames, progress)),
+            )
+        )
+
+    def _load_processed(self, fname, processed_fname, progress):
+        abscissa, ordinates = load_spectrum(fname)
+        _, processed = load_spectrum(processed_fname)
+        self.processed_loaded_signal.emit(abscissa, ordinates, ordinates - processed)
+
+    def _load_project(self, fname, progress):
+        self.project_loaded_signal.emit(Project.load(fname))
+
+    def _save_project(self, fname, project, progress):
+        project.save(fname)
+        self.file_written_signal.emit(fname)
+        self.status_message_signal.emit("Project saved to {}".format(fname))
+
+    def _save_columns(self, fname, names, arrays, progress):
+        save_columns(fname, names, arrays, progress=progress)
+        self.file_written_signal.emit(fname)
+        self.status_message_signal.emit("Data exported to {}".format(fname))
+
+
+def _read(fnames, progress):
+    """ Read spectra one by one, reporting progress after every spectrum """
+    for index, fname in enumerate(fnames, start=1):
+        yield load_spectrum(fname)
+        progress(index, len(fnames))
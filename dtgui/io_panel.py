@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+from PyQt5 import QtCore, QtWidgets
+
+from .error_aware import ErrorAware
+from .io_executor import CANCELLED, DONE, FAILED, INDETERMINATE
+
+COLUMNS = ("Job", "Status", "Progress")
+
+STATUS_TEXT = {DONE: "Done", FAILED: "Failed", CANCELLED: "Cancelled"}
+
+
+class IOPanel(QtWidgets.QWidget, metaclass=ErrorAware):
+    """ Widget displaying the queue of file I/O jobs, with their progress """
+
+    cancel_job_signal = QtCore.pyqtSignal(int)
+    error_message_signal = QtCore.pyqtSignal(str)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # Rows of jobs, by job identifier
+        self._rows = dict()
+
+        self.table = QtWidgets.QTableWidget(0, len(COLUMNS), parent=self)
+        self.table.setHorizontalHeaderLabels(COLUMNS)
+        self.table.verticalHeader().hide()
+        self.table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.table.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self.table.horizontalHeader().setSectionResizeMode(
+            0, QtWidgets.QHeaderView.Stretch
+        )
+
+        cancel_btn = QtWidgets.QPushButton("Cancel selected", parent=self)
+        cancel_btn.setToolTip("Cancel selected jobs which have not started yet.")
+        cancel_btn.clicked.connect(self.cancel_selected)
+
+        clear_btn = QtWidgets.QPushButton("Clear finished", parent=self)
+        clear_btn.clicked.connect(self.clear_finished)
+
+        btns = QtWidgets.QHBoxLayout()
+        btns.addWidget(cancel_btn)
+        btns.addWidget(clear_btn)
+
+        layout = QtWidgets.QVBoxLayout()
+        layout.addWidget(self.table)
+        layout.addLayout(btns)
+        self.setLayout(layout)
+
+    @QtCore.pyqtSlot(int, str)
+    def add_job(self, job_id, description):
+        row = self.table.rowCount()
+        self.table.insertRow(row)
+
+        item = QtWidgets.QTableWidgetItem(description)
+        item.setData(QtCore.Qt.UserRole, job_id)
+        self.table.setItem(row, 0, item)
+        self.table.setItem(row, 1, QtWidgets.QTableWidgetItem("Pending"))
+
+        progress_bar = QtWidgets.QProgressBar(parent=self.table)
+        progress_bar.setRange(0, 100)
+        progress_bar.setValue(0)
+        self.table.setCellWidget(row, 2, progress_bar)
+        self._rows[job_id] = item
+
+    @QtCore.pyqtSlot(int)
+    def start_job(self, job_id):
+        self._set_status(job_id, "Running")
+
+    @QtCore.pyqtSlot(int, int)
+    def set_progress(self, job_id, percent):
+        progress_bar = self._progress_bar(job_id)
+        if progress_bar is None:
+            return
+        # Progress bars with an empty range are busy indicators
+        if percent == INDETERMINATE:
+            progress_bar.setRange(0, 0)
+        else:
+            progress_bar.setRange(0, 100)
+            progress_bar.setValue(percent)
+
+    @QtCore.pyqtSlot(int, str)
+    def finish_job(self, job_id, status):
+        self._set_status(job_id, STATUS_TEXT.get(status, status))
+        progress_bar = self._progress_bar(job_id)
+        if progress_bar is not None:
+            progress_bar.setRange(0, 100)
+            progress_bar.setValue(100 if status == DONE else 0)
+
+    @QtCore.pyqtSlot()
+    def cancel_selected(self):
+        rows = {index.row() for index in self.table.selectedIndexes()}
+        for row in sorted(rows):
+            self.cancel_job_signal.emit(self.table.item(row, 0).data(QtCore.Qt.UserRole))
+
+    @QtCore.pyqtSlot()
+    def clear_finished(self):
+        finished = set(STATUS_TEXT.values())
+        for row in reversed(range(self.table.rowCount())):
+            if self.table.item(row, 1).text() in finished:
+                job_id = self.table.item(row, 0).data(QtCore.Qt.UserRole)
+                del self._rows[job_id]
+                self.table.removeRow(row)
+
+    def _set_status(self, job_id, text):
+        item = self._rows.get(job_id)
+        if item is not None:
+            self.table.item(item.row(), 1).setText(text)
+
+    def _progress_bar(self, job_id):
+        item = self._rows.get(job_id)
+        if item is None:
+            return None
+        return self.table.cellWidget(item.row(), 2)
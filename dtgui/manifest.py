@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+Manifests of batch runs, which record the files processed in an output directory.
+Runs can then be resumed, or repeated incrementally, by only processing new or
+changed files. This module does not depend on Qt.
+"""
+import hashlib
+import json
+import os
+import os.path
+import time
+from contextlib import contextmanager
+
+from .fileio import _remove, atomic_write
+
+MANIFEST_FILENAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+# Size of the blocks of files read at once when computing content hashes, in bytes
+HASH_BLOCK_SIZE = 2 ** 20
+
+# Manifests are saved by one process at a time, e.g. by the shards of a batch,
+# which hold a lock file meanwhile. Lock files older than LOCK_TIMEOUT seconds
+# were left by interrupted processes, and are removed.
+LOCK_TIMEOUT = 60
+LOCK_POLL_INTERVAL = 0.05
+
+
+def file_digest(fname):
+    """
+    SHA-256 hash of the content of a file.
+
+    Parameters
+    ----------
+    fname : str
+        Path to the file.
+
+    Returns
+    -------
+    digest : str
+        Hexadecimal digest.
+    """
+    sha = hashlib.sha256()
+    with open(fname, mode="rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def parameters_digest(params):
+    """
+    Hash of processing parameters, which does not depend on the order of parameters.
+
+    Parameters
+    ----------
+    params : dict
+        Dictionary of parameters, e.g. parameters passed to baseline_dt.
+
+    Returns
+    -------
+    digest : str
+        Hexadecimal digest.
+    """
+    text = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@contextmanager
+def _lock(fname):
+    """ Context manager holding an exclusive lock on a file, among processes which
+    use this function. The lock is a file created next to `fname`, since creating
+    files exclusively also works on network file systems. """
+    lock = fname + ".lock"
+    while True:
+        try:
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                stale = time.time() - os.path.getmtime(lock) > LOCK_TIMEOUT
+            except OSError:
+                # Released in the meantime
+                continue
+            if stale:
+                _remove(lock)
+            else:
+                time.sleep(LOCK_POLL_INTERVAL)
+    try:
+        yield
+    finally:
+        _remove(lock)
+
+
+class Manifest:
+    """
+    Record of the files processed into a directory, stored in the file
+    ``manifest.json`` of that directory. For every processed file, the manifest holds
+    its path relative to the directory, the hash of the parameters it was processed
+    with, as well as the path, size, modification time and content hash of every
+    input file it was produced from.
+
+    Many processes can record files into the same manifest, e.g. the shards of
+    a batch: entries recorded by other processes are kept when saving.
+
+    Parameters
+    ----------
+    directory : str
+        Directory in which processed files are stored.
+
+    Raises
+    ------
+    ValueError : if the manifest exists but cannot be read.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.fname = os.path.join(directory, MANIFEST_FILENAME)
+        self.parameters, self.outputs = self._read()
+        # Entries changed by this process, which are merged into the manifest on disk
+        self._changed = set()
+
+    def _read(self):
+        """ Parameters and outputs stored in the manifest file, if any """
+        if not os.path.isfile(self.fname):
+            return dict(), dict()
+        try:
+            with open(self.fname, mode="r") as f:
+                contents = json.load(f)
+            return contents["parameters"], contents["outputs"]
+        except (ValueError, KeyError, TypeError):
+            raise ValueError("{} is not a valid manifest".format(self.fname))
+
+    def __len__(self):
+        return len(self.outputs)
+
+    def __contains__(self, output):
+        return self._key(output) in self.outputs
+
+    def _key(self, output):
+        """ Path of an output file relative to the directory """
+        return os.path.relpath(output, self.directory)
+
+    def is_current(self, output, digest, inputs):
+        """
+        Determine whether a processed file exists, and was produced from the same
+        input files with the same parameters. Contents of input files are only hashed
+        if their size is the same, but their modification time differs.
+
+        Parameters
+        ----------
+        output : str
+            Path to the processed file.
+        digest : str
+            Hash of the processing parameters, from :func:`parameters_digest`.
+        inputs : iterable of str
+            Paths to the input files.
+
+        Returns
+        -------
+        current : bool
+        """
+        entry = self.outputs.get(self._key(output))
+        if entry is None or entry["parameters"] != digest:
+            return False
+        if not os.path.isfile(output):
+            return False
+
+        inputs = [os.path.abspath(fname) for fname in inputs]
+        if set(inputs) != set(entry["inputs"]):
+            return False
+
+        for fname in inputs:
+            recorded = entry["inputs"][fname]
+            stat = os.stat(fname)
+            if stat.st_size != recorded["size"]:
+                return False
+            if stat.st_mtime_ns == recorded["mtime_ns"]:
+                continue
+
+            # The file was touched or copied, but its content might be the same
+            if file_digest(fname) != recorded["sha256"]:
+                return False
+            recorded["mtime_ns"] = stat.st_mtime_ns
+            self._changed.add(self._key(output))
+        return True
+
+    def record(self, output, params, inputs, stats=None):
+        """
+        Record that a file was processed. Input files which were modified since
+        they were processed, according to `stats`, are hashed with their new content.
+        The processed file is then not recorded, so that it is processed again.
+
+        Parameters
+        ----------
+        output : str
+            Path to the processed file.
+        params : dict
+            Processing parameters.
+        inputs : iterable of str
+            Paths to the input files.
+        stats : dict or None, optional
+            Status (`os.stat_result`) of input files when they were processed, by path.
+            Input files which are missing use their current status.
+
+        Returns
+        -------
+        recorded : bool
+            Whether the processed file was recorded.
+        """
+        stats = stats or dict()
+        recorded = dict()
+        for fname in inputs:
+            try:
+                stat = stats.get(fname) or os.stat(fname)
+                sha256 = file_digest(fname)
+                # The file is unchanged since it was processed if it is unchanged
+                # once hashed
+                current = os.stat(fname)
+            except OSError:
+                return False
+            if (current.st_size, current.st_mtime_ns) != (
+                stat.st_size,
+                stat.st_mtime_ns,
+            ):
+                return False
+            recorded[os.path.abspath(fname)] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": sha256,
+            }
+
+        digest = parameters_digest(params)
+        self.parameters[digest] = params
+        self.outputs[self._key(output)] = {"parameters": digest, "inputs": recorded}
+        self._changed.add(self._key(output))
+        return True
+
+    def save(self):
+        """ Write the manifest atomically, merging entries recorded by other processes
+        since it was read. Parameters which are no longer referenced are discarded. """
+        with _lock(self.fname):
+            parameters, outputs = self._read()
+            for key in self._changed:
+                outputs[key] = self.outputs[key]
+                digest = outputs[key]["parameters"]
+                parameters[digest] = self.parameters[digest]
+            self.outputs, self._changed = outputs, set()
+
+            used = {entry["parameters"] for entry in self.outputs.values()}
+            self.parameters = {
+                digest: params
+                for digest, params in parameters.items()
+                if digest in used
+            }
+            with atomic_write(self.fname) as temporary:
+                with open(temporary, mode="w") as f:
+                    json.dump(
+                        {
+                            "version": MANIFEST_VERSION,
+                            "parameters": self.parameters,
+                            "outputs": self.outputs,
+                        },
+                        f,
+                        indent=1,
+                        default=str,
+                    )
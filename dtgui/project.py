@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Project files, which store the work of a session of the graphical user interface:
+spectra as loaded, trims, background markers, baseline parameters and computed
+baselines. This module does not depend on Qt.
+
+Projects are uncompressed NumPy archives, with the '.dtgui' extension. Arrays are
+stored in binary form, so that reopening a project is much faster than reading text
+files again. Baselines are stored with their cache keys (see
+:func:`dtgui.cache.baseline_key`), so that they are not computed again.
+"""
+import json
+
+import numpy as np
+
+from .fileio import atomic_write
+from .session import Session
+
+# Extension of project files
+PROJECT_EXTENSION = ".dtgui"
+
+# Version of the format of project files. Projects written by later versions
+# cannot be read.
+PROJECT_VERSION = 1
+
+# Prefix of the names of baselines in project files, followed by their key
+BASELINE_PREFIX = "baseline_"
+
+
+class Project:
+    """
+    Work of a session of the graphical user interface.
+
+    Parameters
+    ----------
+    abscissa : `~numpy.ndarray`, ndim 1, or None
+        Abscissa of the data, as loaded. None if the data is a session.
+    data : `~numpy.ndarray`, ndim 1 or 2, or `~dtgui.session.Session`
+        Data as loaded: a single spectrum, a stack of spectra sharing the same
+        abscissa (one spectrum per row), or a session of many spectra.
+    params : dict
+        Baseline parameters, without background regions.
+        See :func:`dtgui.baseline.iter_baseline`.
+    markers : list, optional
+        Background markers, either points or (start, stop) regions, in abscissa units.
+    trims : list of 2-tuples, optional
+        Trims, as ranges of indices (start, stop) into the data. The first trim
+        is usually the full range of the data. By default, data is not trimmed.
+    trim_position : int, optional
+        Index of the current trim.
+    index : int, optional
+        Index of the displayed spectrum of a stack or session.
+    baselines : dict, optional
+        Baselines, by cache key.
+    """
+
+    def __init__(
+        self,
+        abscissa,
+        data,
+        params,
+        markers=None,
+        trims=None,
+        trim_position=0,
+        index=0,
+        baselines=None,
+    ):
+        self.abscissa = abscissa
+        self.data = data
+        self.params = dict(params)
+        self.markers = list(markers or list())
+        if trims is None:
+            length = len(data.spectrum(index)[0] if self.is_session else abscissa)
+            trims = [(0, length)]
+        self.trims = [tuple(trim) for trim in trims]
+        self.trim_position = trim_position
+        self.index = index
+        self.baselines = dict(baselines or dict())
+
+    @property
+    def is_session(self):
+        """ Whether the data is a session of many spectra """
+        return isinstance(self.data, Session)
+
+    def save(self, fname):
+        """
+        Write the project atomically.
+
+        Parameters
+        ----------
+        fname : str
+            Path to the project file, usually with the '.dtgui' extension.
+        """
+        # Values are converted from NumPy types, which are not serializable
+        markers = [
+            list(map(float, marker)) if isinstance(marker, tuple) else float(marker)
+            for marker in self.markers
+        ]
+        state = {
+            "version": PROJECT_VERSION,
+            "params": self.params,
+            "markers": markers,
+            "trims": [[int(start), int(stop)] for start, stop in self.trims],
+            "trim_position": int(self.trim_position),
+            "index": int(self.index),
+        }
+        arrays = dict()
+        if self.is_session:
+            state["names"] = self.data.names
+            abscissa, ordinates, offsets = self.data.arrays()
+            arrays.update(
+                session_abscissa=abscissa,
+                session_ordinates=ordinates,
+                session_offsets=offsets,
+            )
+        else:
+            arrays.update(abscissa=self.abscissa, data=self.data)
+        for key, baseline in self.baselines.items():
+            arrays[BASELINE_PREFIX + key] = baseline
+        arrays["state"] = np.array(json.dumps(state))
+
+        # np.savez appends the .npz extension to file names, but not to files
+        with atomic_write(fname) as temporary:
+            with open(temporary, "wb") as f:
+                np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, fname):
+        """
+        Read a project.
+
+        Parameters
+        ----------
+        fname : str
+            Path to the project file.
+
+        Returns
+        -------
+        project : Project
+
+        Raises
+        ------
+        ValueError : if the file is not a project, or was written by a later version.
+        """
+        try:
+            archive = np.load(fname, allow_pickle=False)
+        except ValueError:
+            archive = None
+        if not isinstance(archive, np.lib.npyio.NpzFile):
+            raise ValueError("{} is not a dtgui project".format(fname))
+
+        with archive:
+            if "state" not in archive.files:
+                raise ValueError("{} is not a dtgui project".format(fname))
+            state = json.loads(str(archive["state"]))
+            if state["version"] > PROJECT_VERSION:
+                raise ValueError(
+                    "{} was written by a more recent version of dtgui".format(fname)
+                )
+
+            if "names" in state:
+                abscissa, data = None, Session.from_arrays(
+                    state["names"],
+                    archive["session_abscissa"],
+                    archive["session_ordinates"],
+                    archive["session_offsets"],
+                )
+            else:
+                abscissa, data = archive["abscissa"], archive["data"]
+
+            baselines = {
+                name[len(BASELINE_PREFIX) :]: archive[name]
+                for name in archive.files
+                if name.startswith(BASELINE_PREFIX)
+            }
+
+        # Regions are stored as lists by JSON, while points are numbers
+        markers = [
+            tuple(marker) if isinstance(marker, list) else marker
+            for marker in state["markers"]
+        ]
+        return cls(
+            abscissa,
+            data,
+            params=state["params"],
+            markers=markers,
+            trims=state["trims"],
+            trim_position=state["trim_position"],
+            index=state["index"],
+            baselines=baselines,
+        )
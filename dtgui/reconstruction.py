@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+"""
+Approximate reconstructions of signals via the dual-tree complex wavelet transform,
+where detail coefficients are discarded. This module does not depend on Qt.
+
+Approximate reconstructions are the bulk of the work of baseline computations.
+They are equivalent to scikit-ued's ``idtcwt(dtcwt(...))`` with zeroed detail
+coefficients, but only the low-pass filters are applied.
+
+Approximate reconstructions are linear. For low decomposition levels, they are
+therefore computed by a precomputed linear operator, which only involves a few
+points around every point. If numba is installed, the operator is applied by a
+compiled kernel which also performs the rest of baseline iterations.
+"""
+from functools import lru_cache
+from importlib.util import find_spec
+from math import sqrt
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# numba is optional. If it is installed, baseline iterations are compiled.
+WITH_NUMBA = find_spec("numba") is not None
+
+# Largest width of the linear operators used to compute approximate reconstructions,
+# in points. Wider operators are slower than wavelet transforms, which is typically
+# the case for decomposition levels above 1.
+MAX_OPERATOR_WIDTH = 48
+
+# Number of linear operators kept in memory, e.g. for different spectrum sizes
+OPERATOR_CACHE_SIZE = 32
+
+
+@lru_cache(maxsize=None)
+def filter_banks(first_stage, wavelet):
+    """
+    Wavelets of the real and imaginary trees of the dual-tree complex wavelet transform.
+    This function imports scikit-ued.
+
+    Parameters
+    ----------
+    first_stage : str
+        Wavelet to use for the first stage.
+    wavelet : str
+        Wavelet to use in stages > 1.
+
+    Returns
+    -------
+    trees : tuple
+        First-stage wavelet and pair of wavelets of stages > 1, for the real tree
+        and imaginary tree, as `pywt.Wavelet` objects.
+    """
+    from skued.baseline.dtcwt import dt_first_stage, dualtree_wavelet
+
+    real_wavelet, imag_wavelet = dualtree_wavelet(wavelet)
+    real_first, imag_first = dt_first_stage(first_stage)
+    return (
+        (real_first, (real_wavelet, imag_wavelet)),
+        (imag_first, (imag_wavelet, real_wavelet)),
+    )
+
+
+def max_level(size, first_stage, wavelet):
+    """ Maximum decomposition level of signals of a given size """
+    from pywt import dwt_max_level
+
+    (_, (real_wavelet, imag_wavelet)), _ = filter_banks(first_stage, wavelet)
+    return dwt_max_level(
+        data_len=size, filter_len=max(real_wavelet.dec_len, imag_wavelet.dec_len)
+    )
+
+
+def approx_rec(array, first_stage, wavelet, mode, level, axis=-1):
+    """
+    Approximate reconstruction of a signal using the dual-tree complex wavelet transform,
+    where detail coefficients are discarded.
+
+    Parameters
+    ----------
+    array : `~numpy.ndarray`
+        Signal, of even length along `axis`.
+    first_stage : str
+        Wavelet to use for the first stage.
+    wavelet : str
+        Wavelet to use in stages > 1.
+    mode : str
+        Signal extension mode, see pywt.Modes.
+    level : int or None
+        Decomposition level. If None, the maximum level possible is used.
+    axis : int, optional
+        Axis over which to compute the wavelet transform. Default is -1.
+
+    Returns
+    -------
+    reconstructed : `~numpy.ndarray`
+        Reconstruction, in single precision if `array` is in single precision,
+        and in double precision otherwise.
+
+    Raises
+    ------
+    ValueError : if the signal is too short for the decomposition level.
+    """
+    from pywt import dwt, idwt
+
+    array = np.asarray(array)
+    array = array.astype(np.result_type(array, np.float32), copy=False)
+    if level is None:
+        level = max_level(array.shape[axis], first_stage, wavelet)
+
+    # Scaling factors are Python floats, which keep the precision of arrays
+    data = array / sqrt(2)
+    if level == 0:
+        return sqrt(2) * data
+
+    reconstructed = None
+    for first, wavelets in filter_banks(first_stage, wavelet):
+        # Only approximation coefficients are kept, along with the size of detail
+        # coefficients, which determines the size of reconstructions.
+        approx, _ = dwt(data, first, mode=mode, axis=axis)
+        sizes = [approx.shape[axis]]
+        for stage in range(level - 1):
+            approx, _ = dwt(approx, wavelets[stage % 2], mode=mode, axis=axis)
+            sizes.append(approx.shape[axis])
+
+        for stage in reversed(range(level - 1)):
+            approx = _truncate(approx, sizes[stage + 1], axis)
+            approx = idwt(approx, None, wavelets[stage % 2], mode="constant", axis=axis)
+        approx = _truncate(approx, sizes[0], axis)
+        approx = idwt(approx, None, first, mode="constant", axis=axis)
+
+        if reconstructed is None:
+            reconstructed = approx
+        else:
+            reconstructed += approx
+    return sqrt(2) * reconstructed / 2
+
+
+def _truncate(approx, size, axis):
+    """ Adjust the size of approximation coefficients to the size of detail
+    coefficients, which might be one less. """
+    excess = approx.shape[axis] - size
+    if excess not in (0, 1):
+        raise ValueError(
+            "Approximation coefficients of size {} cannot be combined with detail "
+            "coefficients of size {}".format(approx.shape[axis], size)
+        )
+    if excess == 0:
+        return approx
+    return np.swapaxes(np.swapaxes(approx, axis, 0)[:-1], 0, axis)
+
+
+@lru_cache(maxsize=None)
+def reconstruction_radius(first_stage, wavelet, mode, level):
+    """
+    Largest distance between a point and the points that influence its approximate
+    reconstruction, determined from the response to impulses. Impulses are placed
+    at every position modulo the decimation period, since wavelet transforms are
+    not shift-invariant.
+    """
+    period = 2 ** (level + 1)
+    size = 1024
+    while True:
+        radius = 0
+        for phase in range(period):
+            impulse = np.zeros(size)
+            center = size // 2 + phase
+            impulse[center] = 1
+            response = approx_rec(
+                impulse, first_stage=first_stage, wavelet=wavelet, mode=mode, level=level
+            )
+            nonzero = np.nonzero(response)[0]
+            radius = max(radius, center - nonzero[0], nonzero[-1] - center)
+
+        # The response must be far from the edges, which affect reconstructions
+        if 2 * radius < size // 4:
+            return int(radius)
+        size *= 4
+
+
+def minimum_width(first_stage, wavelet, level):
+    """
+    Lower bound of the width of approximate reconstructions of impulses, in points,
+    from the length of the filters of stages > 1. This is much faster to determine
+    than :func:`reconstruction_radius` for high decomposition levels.
+    """
+    (_, (real_wavelet, imag_wavelet)), _ = filter_banks(first_stage, wavelet)
+    length = max(real_wavelet.dec_len, imag_wavelet.dec_len)
+    # Filters of stage j > 1 are dilated by 2 ** (j - 1), both for decomposition
+    # and reconstruction
+    return 1 + (length - 1) * (2 ** (level + 1) - 4)
+
+
+class ReconstructionOperator:
+    """
+    Approximate reconstruction of signals of a given size, as a linear operator.
+
+    Away from the edges, approximate reconstructions are convolutions which
+    repeat with the decimation period of the wavelet transform: every point is a
+    weighted sum of the points within the reconstruction radius, with weights which
+    depend on the position modulo the period. Points near the edges are affected
+    by the signal extension mode, and are weighted sums of the points near the edges.
+
+    Parameters
+    ----------
+    top, bottom : `~numpy.ndarray`, ndim 2
+        Weights of the points at the start and end of signals, respectively.
+        The first (last) rows of reconstructions are the product of `top` (`bottom`)
+        with the first (last) points of signals.
+    kernels : `~numpy.ndarray`, shape (period, width)
+        Weights of the points around every other point, by position modulo the period.
+        The number of rows of `top` must be a multiple of the period.
+
+    Weights are in the precision of reconstructions, e.g. single precision to
+    reconstruct single-precision signals.
+    """
+
+    def __init__(self, top, bottom, kernels):
+        self.top = np.ascontiguousarray(top)
+        self.bottom = np.ascontiguousarray(bottom)
+        self.kernels = np.ascontiguousarray(kernels)
+        self.period, self.width = kernels.shape
+        self.radius = (self.width - 1) // 2
+
+        self._iterate = None
+        if WITH_NUMBA:
+            from ._kernels import iterate
+
+            self._iterate = iterate
+
+    @property
+    def dtype(self):
+        """ Data-type of weights """
+        return self.kernels.dtype
+
+    def astype(self, dtype):
+        """ Operator with weights of another data-type """
+        return type(self)(
+            top=self.top.astype(dtype),
+            bottom=self.bottom.astype(dtype),
+            kernels=self.kernels.astype(dtype),
+        )
+
+    def __call__(self, array, out=None):
+        """
+        Approximate reconstruction of signals along the last axis.
+
+        Parameters
+        ----------
+        array : `~numpy.ndarray`
+            Signals.
+        out : `~numpy.ndarray` or None, optional
+            Array in which to store the result, of the same shape as `array`.
+
+        Returns
+        -------
+        reconstructed : `~numpy.ndarray`
+        """
+        array = np.asarray(array)
+        array = array.astype(np.result_type(array, self.dtype), copy=False)
+        if out is None:
+            out = np.empty_like(array)
+
+        size = array.shape[-1]
+        (top_rows, top_cols), (bottom_rows, bottom_cols) = (
+            self.top.shape,
+            self.bottom.shape,
+        )
+        np.matmul(array[..., :top_cols], self.top.T, out=out[..., :top_rows])
+        np.matmul(
+            array[..., size - bottom_cols :],
+            self.bottom.T,
+            out=out[..., size - bottom_rows :],
+        )
+
+        # Windows of points start a radius before every point
+        stop = size - bottom_rows
+        if stop > top_rows:
+            windows = sliding_window_view(array, self.width, axis=-1)
+            for phase, kernel in enumerate(self.kernels):
+                rows = slice(top_rows + phase, stop, self.period)
+                starts = slice(rows.start - self.radius, stop - self.radius, self.period)
+                out[..., rows] = windows[..., starts, :] @ kernel
+        return out
+
+    def iterate(self, array, signal, background):
+        """
+        Single iteration of the baseline algorithm, for many signals at once.
+        See :func:`dtgui.baseline.iter_baseline`. If numba is installed,
+        this is a compiled kernel.
+
+        Parameters
+        ----------
+        array : `~numpy.ndarray`, ndim 2
+            Signals, one per row.
+        signal : `~numpy.ndarray`, ndim 2
+            Signals with peaks removed, modified in-place.
+        background : `~numpy.ndarray`, ndim 2
+            Baselines, modified in-place.
+
+        Returns
+        -------
+        change : float
+            Largest change of baselines.
+        """
+        if self._iterate is not None:
+            return self._iterate(
+                array, signal, background, self.top, self.bottom, self.kernels
+            )
+
+        previous = np.array(background, copy=True)
+        self(signal, out=background)
+        np.clip(background, a_min=0, a_max=None, out=background)
+        np.copyto(background, signal, where=background > array)
+        np.minimum(signal, background, out=signal)
+        return np.max(np.abs(background - previous), initial=0)
+
+
+@lru_cache(maxsize=OPERATOR_CACHE_SIZE)
+def reconstruction_operator(size, first_stage, wavelet, mode, level, dtype=float):
+    """
+    Linear operator which computes approximate reconstructions of signals
+    of a given size. Operators are cached.
+
+    Parameters
+    ----------
+    size : int
+        Size of signals, which must be even.
+    first_stage, wavelet, mode : str
+        Parameters of the dual-tree complex wavelet transform.
+        See :func:`approx_rec`.
+    level : int
+        Decomposition level.
+    dtype : dtype, optional
+        Data-type of the weights of the operator. Weights are always determined
+        in double precision.
+
+    Returns
+    -------
+    operator : `ReconstructionOperator` or None
+        Linear operator, or None if it would be slower than wavelet transforms,
+        or if reconstructions are not local (e.g. periodic signal extension modes).
+    """
+    if level == 0:
+        return None
+
+    # Wide operators are rejected before their exact width is determined, which
+    # involves many wavelet transforms at high decomposition levels
+    if minimum_width(first_stage, wavelet, level) > MAX_OPERATOR_WIDTH:
+        return None
+
+    period = 2 ** level
+    radius = reconstruction_radius(first_stage, wavelet, mode, level)
+    if 2 * radius + 1 > MAX_OPERATOR_WIDTH:
+        return None
+
+    # Weights are determined from the reconstructions of impulses in a short signal.
+    # Far from the edges, all periods of the short signal have the same weights.
+    # The short signal has the same size as the full signal modulo the period, so that
+    # the end of both signals are decimated in the same way.
+    margin = period * int(np.ceil(3 * radius / period))
+    short_size = 2 * (margin + radius + period)
+    short_size = min(size, short_size + (size - short_size) % period)
+
+    try:
+        responses = approx_rec(np.eye(short_size), first_stage, wavelet, mode, level)
+    except (ValueError, RuntimeError):
+        return None
+    if responses.shape != (short_size, short_size):
+        return None
+
+    # Impulse responses are the columns of the operator
+    weights = responses.T
+    if short_size == size:
+        operator = ReconstructionOperator(
+            top=weights, bottom=np.empty((0, 0)), kernels=np.zeros((period, 1))
+        )
+    else:
+        operator = ReconstructionOperator(
+            top=weights[:margin, : margin + radius],
+            bottom=weights[short_size - margin :, short_size - margin - radius :],
+            kernels=np.stack(
+                [
+                    weights[row, row - radius : row + radius + 1]
+                    for row in range(margin, margin + period)
+                ]
+            ),
+        )
+
+    # The operator is only used if it agrees with wavelet transforms, which is
+    # not the case if the edges influence each other (e.g. periodic extension)
+    signal = np.random.default_rng(0).random(size)
+    expected = approx_rec(signal, first_stage, wavelet, mode, level)
+    if not np.allclose(operator(signal), expected, rtol=1e-9, atol=1e-12):
+        return None
+    return operator.astype(dtype)
@@ -0,0 +1,566 @@
+# -*- coding: utf-8 -*-
+"""
+Compute server, to which baseline computations and file operations can be offloaded
+from the graphical user interface, on the same machine or over the network. A single
+server can serve many clients. This module does not depend on Qt.
+
+Requests and responses are pickled, and sent over connections from the
+:mod:`multiprocessing.connection` module. Since unpickling can execute arbitrary code,
+connections are authenticated with a key shared between the server and its clients.
+Servers should only be reachable from trusted networks.
+
+Arrays are sent to worker processes via shared memory (see :mod:`dtgui.shm`), rather
+than being pickled. Clients on the same machine as the server also send spectra, and
+receive baselines, via shared memory.
+"""
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from pickle import PicklingError
+
+import numpy as np
+
+from .baseline import baseline, baseline_stack, parameter_choices, precision_dtype
+from .engine import _warm_up
+from .fileio import load_spectrum, save_columns
+from .shm import SHARED_MEMORY_THRESHOLD, SharedArrays
+
+# Default address of compute servers
+DEFAULT_ADDRESS = ("localhost", 6000)
+
+# Environment variable from which the authentication key is read, if not specified
+AUTHKEY_VARIABLE = "DTGUI_AUTHKEY"
+
+# Number of threads of servers which read and write files
+IO_THREADS = 4
+
+# Interval at which connections waiting for messages check whether they
+# should be closed, in seconds
+POLL_INTERVAL = 0.1
+
+
+def parse_address(text):
+    """
+    Parse the address of a compute server.
+
+    Parameters
+    ----------
+    text : str
+        Either 'HOST:PORT' for TCP connections, or the path to a Unix socket
+        (or a Windows named pipe).
+
+    Returns
+    -------
+    address : 2-tuple or str
+        Address as understood by :mod:`multiprocessing.connection`.
+    """
+    host, separator, port = text.rpartition(":")
+    if separator and host and port.isdigit():
+        return host, int(port)
+    return text
+
+
+def format_address(address):
+    """ Format an address as parsed by :func:`parse_address` """
+    if isinstance(address, tuple):
+        return "{}:{}".format(*address)
+    return address
+
+
+def authentication_key(key=None):
+    """
+    Determine the key with which connections are authenticated.
+
+    Parameters
+    ----------
+    key : str or None, optional
+        Key. If None (default), the key is read from the environment variable
+        ``DTGUI_AUTHKEY``.
+
+    Returns
+    -------
+    authkey : bytes or None
+        Key, or None if no key is specified.
+    """
+    key = key or os.environ.get(AUTHKEY_VARIABLE)
+    if not key:
+        return None
+    return key.encode("utf-8")
+
+
+def compute_baseline(array, params):
+    """
+    Baseline of a spectrum, or of every row of a stack of spectra.
+
+    Parameters
+    ----------
+    array : `~numpy.ndarray`, ndim 1 or 2
+        Spectrum or stack of spectra.
+    params : dict
+        Baseline parameters, including background regions of every spectrum.
+        See :func:`dtgui.baseline.iter_baseline`.
+
+    Returns
+    -------
+    baseline : `~numpy.ndarray`
+    """
+    if np.ndim(array) == 2:
+        return baseline_stack(array, **params)
+    return baseline(array, **params)
+
+
+def _shared_baseline(array, out, params):
+    """
+    Baseline of a spectrum, or of every row of a stack of spectra, in shared memory.
+
+    Parameters
+    ----------
+    array : `~dtgui.shm.SharedArray`
+        Spectrum or stack of spectra.
+    out : `~dtgui.shm.SharedArray`
+        Array in which the baseline is written.
+    params : dict
+        Baseline parameters. See :func:`compute_baseline`.
+    """
+    with array.attach() as data, out.attach() as result:
+        result[...] = compute_baseline(data, params)
+
+
+def _baseline_dtype(params):
+    """ Data-type of baselines computed with parameters `params` """
+    return precision_dtype(params.get("precision", "double"))
+
+
+def submit_baseline(executor, arrays, array, params):
+    """
+    Compute a baseline in a pool of worker processes. Unless they are small, the
+    spectra are sent to the worker process, and the baseline received from it,
+    via shared memory.
+
+    Parameters
+    ----------
+    executor : `~concurrent.futures.ProcessPoolExecutor`
+        Pool of worker processes.
+    arrays : `~dtgui.shm.SharedArrays`
+        Collection in which the arrays are placed.
+    array : `~numpy.ndarray`, ndim 1 or 2
+        Spectrum or stack of spectra.
+    params : dict
+        Baseline parameters. See :func:`compute_baseline`.
+
+    Returns
+    -------
+    future : `~concurrent.futures.Future`
+        Baseline, once computed.
+    """
+    if np.asarray(array).nbytes < SHARED_MEMORY_THRESHOLD:
+        return executor.submit(compute_baseline, array, params)
+    return _submit_shared(
+        partial(executor.submit, _shared_baseline), arrays, array, params
+    )
+
+
+def _submit_shared(submit, arrays, array, params):
+    """
+    Submit the computation of a baseline in shared memory, where ``submit(array,
+    out, params)`` returns the future of :func:`_shared_baseline`.
+
+    Shared memory is released once the computation is complete, whether it is
+    successful or not, or as soon as the returned future is cancelled.
+    """
+    handle = arrays.put(array)
+    out, _ = arrays.empty(np.shape(array), _baseline_dtype(params))
+    release = partial(_release, arrays, handle, out)
+    try:
+        computed = submit(array=handle, out=out, params=params)
+    except BaseException:
+        release()
+        raise
+
+    future = Future()
+    future.add_done_callback(partial(_cancel, computed, release))
+    computed.add_done_callback(partial(_copy_baseline, future, arrays, out, release))
+    return future
+
+
+def _release(arrays, *handles):
+    """ Release arrays in shared memory """
+    for handle in handles:
+        arrays.release(handle)
+
+
+def _cancel(computed, release, future):
+    """ Cancel a computation in shared memory if its future is cancelled """
+    if future.cancelled():
+        computed.cancel()
+        release()
+
+
+def _copy_baseline(future, arrays, out, release, computed):
+    """ Resolve the future of a baseline computed in shared memory, once the shared
+    memory is released """
+    # Futures cannot be cancelled once resolving them has started
+    if not future.set_running_or_notify_cancel():
+        release()
+        return
+
+    try:
+        computed.result()
+        result = np.array(arrays.array(out))
+    except BaseException as e:
+        release()
+        future.set_exception(e)
+    else:
+        release()
+        future.set_result(result)
+
+
+def _can_attach(probe, token):
+    """ Determine whether shared memory segments of a client can be attached to,
+    i.e. whether the client is on the same machine """
+    try:
+        with probe.attach() as array:
+            return array.tobytes() == token
+    except (OSError, ValueError):
+        return False
+
+
+def _load(fname):
+    """ Read a spectrum into memory, rather than memory-mapping it """
+    return tuple(np.array(a) for a in load_spectrum(fname))
+
+
+class ComputeServer:
+    """
+    Server which computes baselines, and reads and writes files, on behalf of
+    clients (see :class:`ComputeClient`). Baselines are computed in a pool of
+    worker processes, so that requests from many clients are computed in parallel,
+    and files are read and written in threads.
+
+    Every request is handled as soon as it is received, even if previous requests
+    from the same client are not completed. Files are read from, and written to,
+    the file system of the server.
+
+    Parameters
+    ----------
+    address : 2-tuple or str, optional
+        Address on which to listen, either (host, port) or the path to a Unix socket.
+        Port 0 selects any free port. See :attr:`address`.
+    authkey : bytes or None, optional
+        Key which clients must know to connect.
+    workers : int or None, optional
+        Number of worker processes. If None (default), the number of CPUs is used.
+    initializer : callable or None, optional
+        Callable run at the start of every worker process.
+    """
+
+    def __init__(
+        self, address=DEFAULT_ADDRESS, authkey=None, workers=None, initializer=None
+    ):
+        self._listener = Listener(address, authkey=authkey)
+        self._authkey = authkey
+        self.workers = workers or os.cpu_count() or 1
+        self.initializer = initializer
+        self._stopped = False
+
+    @property
+    def address(self):
+        """ Address on which the server listens """
+        return self._listener.address
+
+    def stop(self):
+        """ Stop serving. Clients are disconnected, and requests being computed are
+        completed but not answered. This method can be called from any thread. """
+        self._stopped = True
+        # The listener is waiting for connections, which is interrupted by connecting
+        try:
+            Client(self.address, authkey=self._authkey).close()
+        except OSError:
+            pass
+
+    @property
+    def stopped(self):
+        return self._stopped
+
+    def run(self):
+        """ Serve clients until :meth:`stop` is called. Every client is served
+        in its own thread. """
+        # Dependencies are imported before worker processes are started
+        _warm_up()
+
+        # Shared memory is released once pending computations are complete
+        with SharedArrays() as arrays, ProcessPoolExecutor(
+            max_workers=self.workers, initializer=self.initializer
+        ) as executor, ThreadPoolExecutor(max_workers=IO_THREADS) as io_executor:
+            # Workers are started right away, rather than on the first request
+            for _ in range(self.workers):
+                executor.submit(_warm_up)
+
+            # Operations submit requests, and return futures
+            operations = {
+                "ping": partial(io_executor.submit, os.getpid),
+                "parameter_choices": partial(io_executor.submit, parameter_choices),
+                "load_spectrum": partial(io_executor.submit, _load),
+                "save_columns": partial(io_executor.submit, save_columns),
+                "baseline": partial(submit_baseline, executor, arrays),
+                "can_attach": partial(io_executor.submit, _can_attach),
+                "shared_baseline": partial(executor.submit, _shared_baseline),
+            }
+            threads = list()
+            try:
+                while not self._stopped:
+                    try:
+                        connection = self._listener.accept()
+                    except (OSError, EOFError, AuthenticationError):
+                        # Connections which fail to authenticate are ignored
+                        continue
+                    if self._stopped:
+                        connection.close()
+                        break
+                    thread = threading.Thread(
+                        target=self._serve, args=(connection, operations), daemon=True
+                    )
+                    thread.start()
+                    threads = [t for t in threads if t.is_alive()] + [thread]
+            finally:
+                # Clients are disconnected once they notice that the server stopped,
+                # including if serving was interrupted
+                self._stopped = True
+                self._listener.close()
+                for thread in threads:
+                    thread.join()
+
+    def _serve(self, connection, operations):
+        """ Handle the requests of a client until it disconnects """
+        # Responses are sent from the threads in which requests complete
+        send_lock = threading.Lock()
+        try:
+            while not self._stopped:
+                try:
+                    if not connection.poll(POLL_INTERVAL):
+                        continue
+                    request_id, operation, kwargs = connection.recv()
+                except (EOFError, OSError):
+                    break
+
+                submit = operations.get(operation)
+                future = Future()
+                if submit is None:
+                    future.set_exception(
+                        ValueError("Unknown operation {}".format(operation))
+                    )
+                else:
+                    try:
+                        future = submit(**kwargs)
+                    except Exception as e:
+                        future.set_exception(e)
+                future.add_done_callback(
+                    partial(_respond, connection, send_lock, request_id)
+                )
+        finally:
+            with send_lock:
+                connection.close()
+
+
+def _respond(connection, lock, request_id, future):
+    """ Send the result of a request, or the exception it raised """
+    try:
+        response = (request_id, True, future.result())
+    except Exception as e:
+        response = (request_id, False, e)
+
+    with lock:
+        try:
+            connection.send(response)
+        except (PicklingError, AttributeError, TypeError) as e:
+            # Exceptions which cannot be pickled are sent as messages
+            connection.send((request_id, False, RuntimeError(str(e))))
+        except (OSError, ValueError):
+            # The client has disconnected
+            pass
+
+
+class ComputeClient:
+    """
+    Connection to a :class:`ComputeServer`. Requests are sent without waiting for
+    previous requests to complete, and their results are available as futures.
+    Methods can be called from any thread.
+
+    Parameters
+    ----------
+    address : 2-tuple or str, optional
+        Address of the server, either (host, port) or the path to a Unix socket.
+    authkey : bytes or None, optional
+        Key shared with the server.
+    shared_memory : bool, optional
+        If True (default), arrays are exchanged with servers on the same machine
+        via shared memory, rather than being sent over the connection.
+        See :attr:`shared_memory`.
+
+    Raises
+    ------
+    ConnectionError : if the server cannot be reached.
+    multiprocessing.AuthenticationError : if the key is not the key of the server.
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, authkey=None, shared_memory=True):
+        self.address = address
+        self._connection = Client(address, authkey=authkey)
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._pending = dict()
+        self._next_id = 0
+        self._closed = False
+        self._receiver = threading.Thread(target=self._receive, daemon=True)
+        self._receiver.start()
+
+        self._arrays = SharedArrays()
+        self._shared_memory = shared_memory and self._can_share()
+
+    @property
+    def shared_memory(self):
+        """ Whether arrays are exchanged with the server via shared memory, which is
+        the case if the server is on the same machine """
+        return self._shared_memory
+
+    def _can_share(self):
+        """ Determine whether the server can attach to shared memory of this process """
+        token = os.urandom(16)
+        probe = self._arrays.put(np.frombuffer(token, dtype=np.uint8))
+        try:
+            return self.submit("can_attach", probe=probe, token=token).result()
+        except ValueError:
+            # Servers of previous versions do not support shared memory
+            return False
+        finally:
+            self._arrays.release(probe)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def closed(self):
+        """ Whether the connection is closed, either by the client or by the server """
+        return self._closed
+
+    def close(self):
+        """ Close the connection. Pending requests fail with a ConnectionError. """
+        self._closed = True
+        self._receiver.join()
+        with self._send_lock:
+            self._connection.close()
+        self._arrays.close()
+
+    def submit(self, operation, **kwargs):
+        """
+        Send a request to the server.
+
+        Parameters
+        ----------
+        operation : str
+            Name of the operation, e.g. 'baseline'.
+        kwargs
+            Parameters of the operation.
+
+        Returns
+        -------
+        future : `~concurrent.futures.Future`
+            Result of the request. If the connection is lost, the future fails
+            with a ConnectionError. Requests cannot be cancelled.
+        """
+        future = Future()
+        future.set_running_or_notify_cancel()
+        with self._lock:
+            if self._closed:
+                raise ConnectionError("Connection to compute server is closed")
+            request_id, self._next_id = self._next_id, self._next_id + 1
+            self._pending[request_id] = future
+
+        # Responses are received while large requests are sent
+        with self._send_lock:
+            try:
+                self._connection.send((request_id, operation, kwargs))
+            except (OSError, ValueError):
+                with self._lock:
+                    self._pending.pop(request_id, None)
+                raise ConnectionError("Connection to compute server is lost")
+        return future
+
+    def _receive(self):
+        """ Resolve the futures of requests as responses are received """
+        while not self._closed:
+            try:
+                if not self._connection.poll(POLL_INTERVAL):
+                    continue
+                request_id, success, result = self._connection.recv()
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                future = self._pending.pop(request_id)
+            if success:
+                future.set_result(result)
+            else:
+                future.set_exception(result)
+
+        with self._lock:
+            self._closed = True
+            pending, self._pending = self._pending, dict()
+        for future in pending.values():
+            future.set_exception(
+                ConnectionError("Connection to compute server is lost")
+            )
+
+    def ping(self):
+        """ Wait for a response of the server, and return its process ID """
+        return self.submit("ping").result()
+
+    def parameter_choices(self):
+        """ Choices of baseline parameters available on the server.
+        See :func:`dtgui.baseline.parameter_choices`. """
+        return self.submit("parameter_choices").result()
+
+    def load_spectrum(self, fname):
+        """ Read a spectrum from the file system of the server.
+        See :func:`dtgui.fileio.load_spectrum`. """
+        return self.submit("load_spectrum", fname=fname).result()
+
+    def save_columns(self, fname, names, arrays, **kwargs):
+        """ Write columns of data to the file system of the server.
+        See :func:`dtgui.fileio.save_columns`. """
+        return self.submit(
+            "save_columns", fname=fname, names=names, arrays=arrays, **kwargs
+        ).result()
+
+    def submit_baseline(self, array, **params):
+        """
+        Request the baseline of a spectrum, or of every row of a stack of spectra.
+        See :func:`compute_baseline`.
+
+        If the server is on the same machine, the spectra are sent and the
+        baseline received via shared memory (see :attr:`shared_memory`), unless
+        they are small.
+
+        Returns
+        -------
+        future : `~concurrent.futures.Future`
+            Baseline, once computed.
+        """
+        if (
+            not self._shared_memory
+            or np.asarray(array).nbytes < SHARED_MEMORY_THRESHOLD
+        ):
+            return self.submit("baseline", array=array, params=params)
+        return _submit_shared(
+            partial(self.submit, "shared_baseline"), self._arrays, array, params
+        )
+
+    def baseline(self, array, **params):
+        """ Baseline of a spectrum, or of every row of a stack of spectra.
+        See :func:`compute_baseline`. """
+        return self.submit_baseline(array, **params).result()
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Sessions of many spectra, which may not share the same abscissa.
+This module does not depend on Qt.
+"""
+import os.path
+
+import numpy as np
+
+from .cache import data_digest
+from .fileio import load_spectrum
+
+
+class Session:
+    """
+    Collection of spectra of possibly different abscissas and lengths. Spectra are
+    stored back-to-back in two contiguous arrays, rather than as many small arrays.
+
+    Parameters
+    ----------
+    names : iterable of str
+        Name of every spectrum, e.g. its filename.
+    spectra : iterable of 2-tuples of `~numpy.ndarray`
+        Abscissa and ordinates of every spectrum.
+    """
+
+    def __init__(self, names, spectra):
+        self.names = list(names)
+        spectra = list(spectra)
+        if len(self.names) != len(spectra):
+            raise ValueError("Every spectrum must have a name")
+        if not spectra:
+            raise ValueError("Sessions must contain at least one spectrum")
+
+        lengths = [len(y) for _, y in spectra]
+        self._offsets = np.zeros(len(spectra) + 1, dtype=np.intp)
+        np.cumsum(lengths, out=self._offsets[1:])
+
+        self._abscissa = np.concatenate([x for x, _ in spectra]).astype(float)
+        self._ordinates = np.concatenate([y for _, y in spectra]).astype(float)
+
+        # Hashes identify spectra in baseline caches. They are computed
+        # once, rather than every time a spectrum is displayed.
+        self.digests = [data_digest(self.spectrum(i)[1]) for i in range(len(self))]
+
+    @classmethod
+    def from_files(cls, fnames):
+        """
+        Load a session from spectra files, in any supported format.
+
+        Parameters
+        ----------
+        fnames : iterable of str
+            Paths to the spectra.
+
+        Returns
+        -------
+        session : Session
+        """
+        fnames = list(fnames)
+        return cls(
+            names=[os.path.basename(fname) for fname in fnames],
+            spectra=[load_spectrum(fname) for fname in fnames],
+        )
+
+    @classmethod
+    def from_arrays(cls, names, abscissa, ordinates, offsets):
+        """
+        Session of spectra stored back-to-back, as returned by :meth:`arrays`.
+
+        Parameters
+        ----------
+        names : iterable of str
+            Name of every spectrum.
+        abscissa, ordinates : `~numpy.ndarray`, ndim 1
+            Abscissas and ordinates of all spectra, back-to-back.
+        offsets : `~numpy.ndarray`, ndim 1
+            Index of the first point of every spectrum, followed by the total
+            number of points.
+
+        Returns
+        -------
+        session : Session
+        """
+        spans = [slice(start, stop) for start, stop in zip(offsets[:-1], offsets[1:])]
+        return cls(
+            names=names, spectra=[(abscissa[span], ordinates[span]) for span in spans]
+        )
+
+    def arrays(self):
+        """
+        Spectra stored back-to-back. See :meth:`from_arrays`.
+
+        Returns
+        -------
+        abscissa, ordinates, offsets : `~numpy.ndarray`, ndim 1
+        """
+        return self._abscissa, self._ordinates, self._offsets
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def nbytes(self):
+        """ Memory used by spectra, in bytes """
+        return self._abscissa.nbytes + self._ordinates.nbytes
+
+    def spectrum(self, index):
+        """
+        Spectrum of the session.
+
+        Parameters
+        ----------
+        index : int
+            Index of the spectrum.
+
+        Returns
+        -------
+        x, y : `~numpy.ndarray`, ndim 1
+            Read-only views of the abscissa and ordinates.
+        """
+        if not (0 <= index < len(self)):
+            raise IndexError(
+                "Spectrum index {} out of range for {} spectra".format(index, len(self))
+            )
+        span = slice(self._offsets[index], self._offsets[index + 1])
+        x, y = self._abscissa[span], self._ordinates[span]
+        x.flags.writeable = y.flags.writeable = False
+        return x, y
+
+    def neighbours(self, index, count):
+        """
+        Indices of spectra near a spectrum, from nearest to farthest. Following
+        spectra come before preceding spectra at equal distance.
+
+        Parameters
+        ----------
+        index : int
+            Index of the spectrum.
+        count : int
+            Maximum distance from the spectrum.
+
+        Returns
+        -------
+        indices : list of int
+        """
+        indices = list()
+        for distance in range(1, count + 1):
+            for neighbour in (index + distance, index - distance):
+                if 0 <= neighbour < len(self):
+                    indices.append(neighbour)
+        return indices
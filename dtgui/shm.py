@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+Transport of arrays between processes via shared memory. Rather than pickling
+arrays, which copies them twice, arrays are placed in shared memory segments, and
+only lightweight handles are sent to other processes. This module does not depend
+on Qt.
+
+Segments are owned by the process which creates them (see :class:`SharedArrays`),
+and other processes only attach to them (see :meth:`SharedArray.attach`). Owners
+release segments once they are done, including when work is cancelled or fails.
+If an owner crashes, its segments are released by the resource tracker of
+:mod:`multiprocessing`, which outlives it.
+"""
+import sys
+import threading
+from contextlib import contextmanager
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+# Before Python 3.13, attaching to a segment registers it with the resource tracker
+# of the attaching process, as if that process owned it. The segment would then be
+# released when the attaching process exits, or reported as leaked.
+TRACK_ARGUMENT = sys.version_info >= (3, 13)
+
+# Size of arrays, in bytes, below which pickling arrays is faster than allocating
+# shared memory for them. See benchmarks/bench_shm.py
+SHARED_MEMORY_THRESHOLD = 2 ** 18
+
+# Creating and attaching to segments is serialized, since attaching temporarily
+# disables the registration of segments with the resource tracker.
+_tracker_lock = threading.Lock()
+
+# Segments which could not be closed because arrays still refer to them. Closing
+# them is attempted again whenever segments are attached or released.
+_unclosed = list()
+_unclosed_lock = threading.Lock()
+
+
+def _attach(name):
+    """ Attach to an existing segment, without registering it for release """
+    _close_unused()
+    if TRACK_ARGUMENT:
+        return SharedMemory(name=name, track=False)
+
+    with _tracker_lock:
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+def _create(size):
+    """ Create a segment, registered for release if this process crashes """
+    with _tracker_lock:
+        # Segments cannot be empty
+        return SharedMemory(create=True, size=max(1, size))
+
+
+class SharedArray:
+    """
+    Handle to an array in shared memory. Handles are cheap to pickle: only the name
+    of the segment, the shape and the data-type of the array are sent.
+
+    Parameters
+    ----------
+    name : str
+        Name of the shared memory segment.
+    shape : tuple of ints
+        Shape of the array.
+    dtype : dtype
+        Data-type of the array.
+    """
+
+    __slots__ = ("name", "shape", "dtype")
+
+    def __init__(self, name, shape, dtype):
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+
+    def __getstate__(self):
+        return self.name, self.shape, self.dtype.str
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def __repr__(self):
+        return "<SharedArray {} of shape {} and dtype {}>".format(
+            self.name, self.shape, self.dtype
+        )
+
+    @property
+    def nbytes(self):
+        """ Size of the array in bytes """
+        return int(np.prod(self.shape, dtype=np.int64)) * self.dtype.itemsize
+
+    @contextmanager
+    def attach(self):
+        """
+        Access the array from a process which does not own it. This is a context
+        manager, which yields the array. The array is backed by shared memory, and
+        writing to it is visible to all processes. It must not be used afterwards.
+
+        Raises
+        ------
+        FileNotFoundError : if the segment has been released by its owner.
+        """
+        segment = _attach(self.name)
+        array = np.ndarray(self.shape, dtype=self.dtype, buffer=segment.buf)
+        try:
+            yield array
+        finally:
+            del array
+            _close(segment)
+
+
+def _close(segment):
+    """ Close a segment, or defer closing it if arrays still refer to it """
+    try:
+        segment.close()
+    except BufferError:
+        with _unclosed_lock:
+            _unclosed.append(segment)
+
+
+def _close_unused():
+    """ Close segments which arrays do not refer to anymore """
+    with _unclosed_lock:
+        segments = list(_unclosed)
+        _unclosed.clear()
+    for segment in segments:
+        _close(segment)
+
+
+class SharedArrays:
+    """
+    Arrays in shared memory owned by this process. Segments are released when
+    :meth:`release` is called, or once the collection is closed. Collections are
+    context managers, which are closed on exit, including if an exception is raised.
+
+    Methods can be called from any thread.
+    """
+
+    def __init__(self):
+        self._segments = dict()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self._segments)
+
+    def empty(self, shape, dtype=float):
+        """
+        Allocate an array in shared memory.
+
+        Parameters
+        ----------
+        shape : int or tuple of ints
+            Shape of the array.
+        dtype : dtype, optional
+            Data-type of the array.
+
+        Returns
+        -------
+        handle : `SharedArray`
+            Handle to send to other processes.
+        array : `~numpy.ndarray`
+            The array itself, to be used by this process.
+        """
+        if np.ndim(shape) == 0:
+            shape = (shape,)
+        handle = SharedArray(None, shape, dtype)
+        segment = _create(handle.nbytes)
+        handle.name = segment.name
+        array = np.ndarray(handle.shape, dtype=handle.dtype, buffer=segment.buf)
+        with self._lock:
+            self._segments[handle.name] = (segment, array)
+        return handle, array
+
+    def put(self, array):
+        """
+        Copy an array into shared memory.
+
+        Parameters
+        ----------
+        array : array_like
+
+        Returns
+        -------
+        handle : `SharedArray`
+        """
+        array = np.asarray(array)
+        handle, shared = self.empty(array.shape, array.dtype)
+        shared[...] = array
+        return handle
+
+    def array(self, handle):
+        """ Array of a handle created by this collection. It must not be used once
+        the handle is released. """
+        with self._lock:
+            return self._segments[handle.name][1]
+
+    def release(self, handle):
+        """ Release the segment of an array. Releasing a handle more than once
+        has no effect. """
+        with self._lock:
+            segment, _ = self._segments.pop(handle.name, (None, None))
+        if segment is not None:
+            _close_unused()
+            _close(segment)
+            segment.unlink()
+
+    def close(self):
+        """ Release all segments """
+        with self._lock:
+            names = list(self._segments)
+        for name in names:
+            self.release(SharedArray(name, (), np.uint8))
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+from PyQt5 import QtCore, QtWidgets
+
+from .error_aware import ErrorAware
+from .instrumentation import timings
+
+# Interval between refreshes of the displayed statistics
+REFRESH_INTERVAL_MS = 500
+
+COLUMNS = ("Operation", "Calls", "Total (s)", "Mean (ms)", "Max (ms)")
+
+
+class StatsPanel(QtWidgets.QWidget, metaclass=ErrorAware):
+    """ Widget displaying timing statistics, with controls to export them and
+    to profile the controller """
+
+    start_profiling_signal = QtCore.pyqtSignal()
+    stop_profiling_signal = QtCore.pyqtSignal(str)
+    error_message_signal = QtCore.pyqtSignal(str)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.table = QtWidgets.QTableWidget(0, len(COLUMNS), parent=self)
+        self.table.setHorizontalHeaderLabels(COLUMNS)
+        self.table.verticalHeader().hide()
+        self.table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(
+            QtWidgets.QHeaderView.ResizeToContents
+        )
+
+        export_btn = QtWidgets.QPushButton("Export timings", parent=self)
+        export_btn.clicked.connect(self.export_timings)
+
+        reset_btn = QtWidgets.QPushButton("Reset", parent=self)
+        reset_btn.clicked.connect(self.reset)
+
+        self.profile_btn = QtWidgets.QPushButton("Start profiling", parent=self)
+        self.profile_btn.setCheckable(True)
+        self.profile_btn.setToolTip(
+            "Profile the computations of the controller, "
+            "and save the results in a pstats file."
+        )
+        self.profile_btn.toggled.connect(self.toggle_profiling)
+
+        # Statistics are only refreshed while the panel is visible
+        self._refresh_timer = QtCore.QTimer(parent=self)
+        self._refresh_timer.setInterval(REFRESH_INTERVAL_MS)
+        self._refresh_timer.timeout.connect(self.refresh)
+
+        btns = QtWidgets.QHBoxLayout()
+        btns.addWidget(export_btn)
+        btns.addWidget(reset_btn)
+        btns.addWidget(self.profile_btn)
+
+        layout = QtWidgets.QVBoxLayout()
+        layout.addWidget(self.table)
+        layout.addLayout(btns)
+        self.setLayout(layout)
+
+    def showEvent(self, event):
+        self.refresh()
+        self._refresh_timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self._refresh_timer.stop()
+        super().hideEvent(event)
+
+    @QtCore.pyqtSlot()
+    def refresh(self):
+        """ Display the most recent timing statistics """
+        summary = timings.summary()
+        self.table.setRowCount(len(summary))
+        for row, (name, stats) in enumerate(summary.items()):
+            values = (
+                name,
+                str(stats["count"]),
+                "{:.3f}".format(stats["total"]),
+                "{:.2f}".format(1e3 * stats["mean"]),
+                "{:.2f}".format(1e3 * stats["max"]),
+            )
+            for column, value in enumerate(values):
+                self.table.setItem(row, column, QtWidgets.QTableWidgetItem(value))
+
+    @QtCore.pyqtSlot()
+    def reset(self):
+        timings.clear()
+        self.refresh()
+
+    @QtCore.pyqtSlot()
+    def export_timings(self):
+        fname = QtWidgets.QFileDialog.getSaveFileName(
+            parent=self, caption="Export timings", filter="JSON (*.json)"
+        )[0]
+        if fname:
+            timings.dump_json(fname)
+
+    @QtCore.pyqtSlot(bool)
+    def toggle_profiling(self, toggle):
+        if toggle:
+            self.profile_btn.setText("Stop profiling")
+            self.start_profiling_signal.emit()
+            return
+
+        self.profile_btn.setText("Start profiling")
+        fname = QtWidgets.QFileDialog.getSaveFileName(
+            parent=self, caption="Save profile", filter="Profile (*.prof *.pstats)"
+        )[0]
+        # Profiling stops even if no file is selected, in which case the
+        # profile is discarded
+        self.stop_profiling_signal.emit(fname)
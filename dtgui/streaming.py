@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming baseline-removal of spectra which are too large to fit in memory.
+This module does not depend on Qt.
+
+Spectra are processed in overlapping windows. The baseline at a point only depends on
+data within a finite distance, which grows with the decomposition level and number of
+iterations. Windows overlap by at least this distance, so that the baseline is the same
+as if the spectrum had been processed all at once.
+"""
+import os
+import os.path
+from contextlib import contextmanager
+
+import numpy as np
+
+from .baseline import baseline, precision_dtype
+from .fileio import _remove, extension, temporary_filename
+from .reconstruction import reconstruction_radius
+
+# Default number of points of spectra kept after processing every window,
+# excluding the overlap on each side
+DEFAULT_WINDOW = 2 ** 20
+
+# Input and output file formats supported by streaming. Other formats
+# cannot be read or written in parts.
+STREAM_EXTENSIONS = (".npy", ".h5", ".hdf5")
+
+
+def overlap_size(max_iter, level, first_stage="sym6", wavelet="qshift1", mode="constant"):
+    """
+    Number of points by which windows must overlap on each side, so that baselines
+    computed in windows are the same as baselines computed all at once.
+
+    Parameters
+    ----------
+    max_iter : int
+        Maximum number of iterations of the baseline algorithm.
+    level : int
+        Decomposition level.
+    first_stage, wavelet, mode : str, optional
+        Baseline parameters. See :func:`dtgui.baseline.iter_baseline`.
+
+    Returns
+    -------
+    overlap : int
+        Overlap size, which is a multiple of the decimation period of the
+        wavelet transform.
+    """
+    if level == 0 or max_iter == 0:
+        return 0
+
+    # Every iteration propagates the influence of a point by the reconstruction radius
+    radius = reconstruction_radius(first_stage, wavelet, mode, level)
+    overlap = max_iter * radius
+    period = 2 ** (level + 1)
+    return period * int(np.ceil(overlap / period))
+
+
+def windows(size, window, overlap):
+    """
+    Split a spectrum into overlapping windows.
+
+    Parameters
+    ----------
+    size : int
+        Number of points of the spectrum.
+    window : int
+        Number of points kept from every window.
+    overlap : int
+        Number of points by which windows overlap on each side.
+
+    Yields
+    ------
+    segment : slice
+        Points of the spectrum which are processed together.
+    keep : slice
+        Points of the spectrum which are kept from the processing of this segment.
+    """
+    for start in range(0, size, window):
+        stop = min(start + window, size)
+        yield slice(max(0, start - overlap), min(size, stop + overlap)), slice(
+            start, stop
+        )
+
+
+@contextmanager
+def open_spectrum(fname):
+    """
+    Open a spectrum without loading it into memory.
+
+    Parameters
+    ----------
+    fname : str
+        Path to a NumPy array (.npy) or HDF5 file (.h5, .hdf5), as written by
+        :func:`dtgui.fileio.save_columns`.
+
+    Yields
+    ------
+    x, y : array_like
+        Abscissa and ordinates, which can be sliced to load parts into memory.
+
+    Raises
+    ------
+    ValueError : if the file format does not support partial reading.
+    """
+    ext = extension(fname)
+    if ext == ".npy":
+        data = np.load(fname, mmap_mode="r")
+        # Files can store columnar arrays (2, N) or (N, 2)
+        if data.shape[0] != 2 and data.ndim == 2 and data.shape[1] == 2:
+            data = data.T
+        yield data[0], data[1]
+    elif ext in (".h5", ".hdf5"):
+        import h5py
+
+        with h5py.File(fname, mode="r") as f:
+            ordinates = "ordinates" if "ordinates" in f else "processed"
+            yield f["abscissa"], f[ordinates]
+    else:
+        raise ValueError(
+            "Spectra can only be streamed from the following formats: {}".format(
+                ", ".join(STREAM_EXTENSIONS)
+            )
+        )
+
+
+class _StreamWriter:
+    """ Incremental writing of the abscissa and processed ordinates of a spectrum.
+    Data is written into a temporary file, which replaces the destination once closed. """
+
+    def __init__(self, fname, size, dtype=float, compression=None):
+        self.fname = fname
+        self.format = extension(fname)
+        self._file = None
+        self._temporary = temporary_filename(fname)
+        if self.format == ".npy":
+            self._columns = np.lib.format.open_memmap(
+                self._temporary, mode="w+", dtype=dtype, shape=(2, size)
+            )
+            self.abscissa, self.processed = self._columns
+        elif self.format in (".h5", ".hdf5"):
+            import h5py
+
+            self._file = h5py.File(self._temporary, mode="w")
+            self.abscissa, self.processed = (
+                self._file.create_dataset(
+                    name, shape=(size,), dtype=dtype, chunks=True, compression=compression
+                )
+                for name in ("abscissa", "processed")
+            )
+        else:
+            raise ValueError(
+                "Spectra can only be streamed into the following formats: {}".format(
+                    ", ".join(STREAM_EXTENSIONS)
+                )
+            )
+
+    def write(self, keep, abscissa, processed):
+        self.abscissa[keep] = abscissa
+        self.processed[keep] = processed
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        else:
+            self._columns.flush()
+            del self._columns, self.abscissa, self.processed
+        os.replace(self._temporary, self.fname)
+
+    def discard(self):
+        if self._file is not None:
+            self._file.close()
+        else:
+            del self._columns, self.abscissa, self.processed
+        _remove(self._temporary)
+
+
+def stream_baseline(fname, output, params, window=DEFAULT_WINDOW, compression=None):
+    """
+    Remove the baseline of a spectrum which might not fit in memory, by processing
+    it in overlapping windows. The processed spectrum is written incrementally.
+    This is a generator, which yields progress after every window.
+
+    Memory usage is proportional to the size of windows and their overlap. The processed
+    spectrum only replaces `output` once complete.
+
+    Parameters
+    ----------
+    fname : str
+        Path to the spectrum, either a NumPy array (.npy) or an HDF5 file (.h5, .hdf5).
+    output : str
+        Path to the processed spectrum, either a NumPy array (.npy) or an
+        HDF5 file (.h5, .hdf5).
+    params : dict
+        Dictionary of baseline parameters. The decomposition level must be specified.
+        The tolerance ``tol``, if any, applies to every window independently.
+    window : int, optional
+        Number of points kept from every window. Larger windows are faster, but
+        require more memory.
+    compression : str or None, optional
+        Compression filter for HDF5 output, e.g. 'gzip'.
+
+    Yields
+    ------
+    processed, total : int
+        Number of points processed so far, and total number of points.
+
+    Raises
+    ------
+    ValueError : if the file formats do not support streaming, or if the
+        decomposition level is not specified.
+    """
+    params = dict(params)
+    if params.get("level") is None:
+        raise ValueError("The decomposition level must be specified for streaming")
+    if params.pop("background_regions", None):
+        raise ValueError("Background regions are not supported for streaming")
+    if os.path.abspath(fname) == os.path.abspath(output):
+        raise ValueError("Spectra cannot be processed in-place")
+
+    overlap = overlap_size(
+        params["max_iter"],
+        params["level"],
+        first_stage=params.get("first_stage", "sym6"),
+        wavelet=params.get("wavelet", "qshift1"),
+        mode=params.get("mode", "constant"),
+    )
+    # Windows are aligned on the decimation period of the wavelet transform,
+    # to which the wavelet transform is sensitive
+    period = 2 ** (params["level"] + 1)
+    window = max(period, period * (window // period))
+
+    # The processed spectrum is written in the precision of computations
+    dtype = precision_dtype(params.get("precision", "double"))
+
+    with open_spectrum(fname) as (x, y):
+        size = len(y)
+        writer = _StreamWriter(output, size, dtype=dtype, compression=compression)
+        try:
+            for segment, keep in windows(size, window, overlap):
+                ordinates = np.asarray(y[segment], dtype=dtype)
+                background = baseline(ordinates, **params)
+
+                # Indices of the points kept, relative to the segment
+                kept = slice(keep.start - segment.start, keep.stop - segment.start)
+                writer.write(
+                    keep, x[keep], ordinates[kept] - background[kept],
+                )
+                yield keep.stop, size
+        except BaseException:
+            # Includes the generator being closed before completion
+            writer.discard()
+            raise
+        writer.close()
@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""
+Parameter sweeps, where the baseline of a spectrum is computed for every combination
+of baseline parameters in a pool of worker processes. This module does not depend
+on Qt, so that it can be used from worker processes.
+"""
+import itertools
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from .baseline import iter_baseline
+from .shm import SharedArrays
+
+# Parameters which can be swept
+SWEEP_PARAMETERS = ("first_stage", "wavelet", "mode", "level", "max_iter")
+
+# Spectrum evaluated by a worker process. It is sent once to every worker process,
+# rather than once per evaluation.
+_spectrum = None
+
+
+def parse_integers(text):
+    """
+    Parse a set of integers, e.g. '1, 2, 5-8'. Ranges include both ends.
+
+    Parameters
+    ----------
+    text : str
+        Comma-separated integers or ranges of integers.
+
+    Returns
+    -------
+    values : list of int
+        Sorted unique integers.
+
+    Raises
+    ------
+    ValueError : if the text cannot be parsed.
+    """
+    values = set()
+    for item in text.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        start, _, stop = item.partition("-")
+        try:
+            start = int(start)
+            stop = int(stop) if stop else start
+        except ValueError:
+            raise ValueError("Invalid integer or range of integers: {}".format(item))
+        if stop < start:
+            raise ValueError("Invalid range of integers: {}".format(item))
+        values.update(range(start, stop + 1))
+    return sorted(values)
+
+
+def parameter_grid(values, fixed=None):
+    """
+    Every combination of baseline parameters.
+
+    Parameters
+    ----------
+    values : dict
+        Dictionary of parameter names to iterables of values, e.g.
+        ``{"level": [1, 2], "max_iter": [10, 100]}``.
+    fixed : dict or None, optional
+        Parameters shared by all combinations, e.g. background regions.
+        Values in ``values`` take precedence.
+
+    Returns
+    -------
+    grid : list of dict
+        Dictionaries of parameters. The last parameter of ``values`` varies fastest.
+
+    Raises
+    ------
+    ValueError : if a parameter has no values.
+    """
+    values = {name: list(vals) for name, vals in values.items()}
+    for name, vals in values.items():
+        if not vals:
+            raise ValueError("No values for parameter {}".format(name))
+
+    fixed = dict(fixed or dict())
+    return [
+        dict(fixed, **dict(zip(values, combination)))
+        for combination in itertools.product(*values.values())
+    ]
+
+
+def residual(data, baseline, background_regions=None):
+    """
+    Root-mean-square of the baseline-subtracted data. If background regions are
+    known, only these regions are considered, where baseline-subtracted data
+    should vanish. Otherwise, all points are considered, which favors baselines
+    reproducing the data: residuals are then not suited to compare baselines.
+
+    Parameters
+    ----------
+    data, baseline : `~numpy.ndarray`, ndim 1
+        Data and its baseline.
+    background_regions : iterable or None, optional
+        Indices of the data values that are known to be purely background, e.g.
+        ``[0, 7, slice(534, 1000)]``.
+
+    Returns
+    -------
+    residual : float
+    """
+    corrected = np.asarray(data, dtype=float) - baseline
+    if background_regions:
+        is_background = np.zeros(corrected.shape, dtype=bool)
+        for index in background_regions:
+            is_background[index] = True
+        corrected = corrected[is_background]
+    return float(np.sqrt(np.mean(np.square(corrected))))
+
+
+def evaluate(data, grid, dtype=float):
+    """
+    Compute the baseline of a spectrum for parameters which only differ
+    by the number of iterations. Iterations are performed once, and baselines
+    are kept after every requested number of iterations.
+
+    Parameters
+    ----------
+    data : `~numpy.ndarray`, ndim 1
+        Data with background.
+    grid : list of dict
+        Dictionaries of parameters, as passed to :func:`dtgui.baseline.iter_baseline`,
+        which only differ by ``max_iter``.
+    dtype : dtype, optional
+        Data-type of the returned baselines. Residuals are computed beforehand.
+
+    Returns
+    -------
+    results : list of 2-tuples
+        Baseline and residual (see :func:`residual`) for every dictionary of parameters.
+    """
+    params = dict(grid[0])
+    del params["max_iter"]
+    targets = sorted(set(p["max_iter"] for p in grid))
+
+    # Iterations might stop before the largest number of iterations, if converged
+    iterations = iter_baseline(data, max_iter=targets[-1], **params)
+    performed, baseline = 0, np.zeros(np.shape(data), dtype=float)
+    results = dict()
+    for target in targets:
+        while performed < target:
+            step = next(iterations, None)
+            if step is None:
+                break
+            performed, baseline = step
+        results[target] = (
+            baseline.astype(dtype),
+            residual(data, baseline, params.get("background_regions")),
+        )
+    return [results[p["max_iter"]] for p in grid]
+
+
+def _groups(grid):
+    """ Group the indices of parameters which only differ by the number of
+    iterations, from the most to the least expensive group. """
+    groups = dict()
+    for index, params in enumerate(grid):
+        key = repr(sorted((k, v) for k, v in params.items() if k != "max_iter"))
+        groups.setdefault(key, list()).append(index)
+    return sorted(
+        groups.values(), key=lambda group: max(grid[i]["max_iter"] for i in group),
+        reverse=True,
+    )
+
+
+def _init_worker(spectrum, initializer=None):
+    """ Store the spectrum to evaluate in a worker process """
+    global _spectrum
+    _spectrum = spectrum
+    if initializer is not None:
+        initializer()
+
+
+def _evaluate_spectrum(grid, out, rows):
+    """ Evaluate the spectrum of this worker process (see :func:`evaluate`). Baselines
+    are written into rows ``rows`` of the array ``out`` in shared memory, rather than
+    being sent back, and residuals are returned. """
+    results = evaluate(_spectrum, grid, dtype=out.dtype)
+    with out.attach() as baselines:
+        for row, (baseline, _) in zip(rows, results):
+            baselines[row] = baseline
+    return [res for _, res in results]
+
+
+class ParameterSweep:
+    """
+    Baselines of a spectrum for every combination of baseline parameters, computed
+    in a pool of worker processes. Baselines are stored in a single array.
+
+    Parameters
+    ----------
+    data : `~numpy.ndarray`, ndim 1
+        Data with background.
+    values : dict
+        Dictionary of parameter names to iterables of values. See :func:`parameter_grid`.
+    params : dict or None, optional
+        Parameters shared by all combinations, e.g. background regions. The number of
+        iterations ``max_iter`` must be specified in either ``values`` or ``params``.
+    workers : int or None, optional
+        Number of worker processes. If None (default), the number of CPUs is used.
+    initializer : callable or None, optional
+        Callable run at the start of every worker process.
+    dtype : dtype, optional
+        Data-type in which baselines are stored. Default is single-precision, which
+        halves memory usage compared to double-precision.
+
+    Raises
+    ------
+    ValueError : if the number of iterations is not specified.
+    """
+
+    def __init__(
+        self, data, values, params=None, workers=None, initializer=None, dtype=np.float32
+    ):
+        self.data = np.asarray(data, dtype=float)
+        self.grid = parameter_grid(values, fixed=params)
+        if any("max_iter" not in p for p in self.grid):
+            raise ValueError("The number of iterations must be specified")
+
+        self.workers = workers or os.cpu_count() or 1
+        self.initializer = initializer
+        self.baselines = np.zeros((len(self.grid), self.data.size), dtype=dtype)
+        self.residuals = np.full(len(self.grid), np.nan)
+        self._cancelled = False
+
+    def __len__(self):
+        return len(self.grid)
+
+    def cancel(self):
+        """ Cancel the current run. Parameters currently being evaluated are completed,
+        but pending parameters are not evaluated. """
+        self._cancelled = True
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def run(self):
+        """
+        Evaluate every combination of parameters in parallel. This is a generator,
+        which yields the index of every combination of parameters as soon as its
+        baseline is stored in :attr:`baselines`, and its residual in :attr:`residuals`.
+
+        Yields
+        ------
+        index : int
+            Index of the parameters in :attr:`grid`.
+        """
+        self._cancelled = False
+        groups = _groups(self.grid)
+        # Baselines are written by worker processes into shared memory, which is
+        # released once worker processes are done with it
+        with SharedArrays() as arrays, ProcessPoolExecutor(
+            max_workers=min(self.workers, len(groups)),
+            initializer=_init_worker,
+            initargs=(self.data, self.initializer),
+        ) as executor:
+            out, _ = arrays.empty(self.baselines.shape, self.baselines.dtype)
+            # Combinations differing only by the number of iterations are evaluated
+            # together, since they share the same iterations
+            pending = {
+                executor.submit(
+                    _evaluate_spectrum,
+                    [self.grid[index] for index in group],
+                    out,
+                    group,
+                ): group
+                for group in groups
+            }
+            try:
+                while pending:
+                    done, _ = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        group = pending.pop(future)
+                        for index, res in zip(group, future.result()):
+                            self.baselines[index] = arrays.array(out)[index]
+                            self.residuals[index] = res
+                            yield index
+
+                    if self._cancelled:
+                        break
+            finally:
+                # Pending work is dropped on cancellation, or if an error occurred
+                for future in pending:
+                    future.cancel()
+
+    @property
+    def ranked(self):
+        """ Whether combinations of parameters can be ranked by their residual, which
+        requires background regions (see :func:`residual`). """
+        return all(p.get("background_regions") for p in self.grid)
+
+    def ranking(self):
+        """
+        Indices of combinations of parameters, from the smallest to the largest
+        residual. Without background regions, combinations are in the order of
+        :attr:`grid` instead (see :attr:`ranked`). Combinations which were not
+        evaluated come last.
+
+        Returns
+        -------
+        indices : `~numpy.ndarray`
+        """
+        if not self.ranked:
+            return np.argsort(np.isnan(self.residuals), kind="stable")
+        return np.argsort(self.residuals, kind="stable")
+
+    def save(self, fname):
+        """
+        Save baselines, residuals and parameters into a NumPy archive (.npz).
+        Parameters are stored as a JSON string.
+
+        Parameters
+        ----------
+        fname : str
+            Path to the archive.
+        """
+        np.savez(
+            fname,
+            ordinates=self.data,
+            baselines=self.baselines,
+            residuals=self.residuals,
+            parameters=json.dumps(self.grid, default=str),
+        )
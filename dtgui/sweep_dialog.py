@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+import math
+import os
+
+import numpy as np
+import pyqtgraph as pg
+from PyQt5 import QtCore, QtWidgets
+
+from .error_aware import ErrorAware
+from .sweep import ParameterSweep, parse_integers
+
+EXPLANATION = """Select values of baseline parameters. Baselines are computed for every
+combination of values in parallel, and ranked by their residual: the root-mean-square
+of the baseline-subtracted data within background markers. Without background markers,
+baselines are shown in the order they were requested, to be compared
+visually.""".replace(
+    "\n", " "
+)
+
+UNRANKED_TOOLTIP = "Place background markers to rank baselines and select parameters"
+
+# Maximum number of baselines displayed as small multiples, from the smallest residual
+MAX_MULTIPLES = 36
+
+COLUMNS = ("First stage", "Wavelet", "Mode", "Level", "Iterations", "Residual")
+
+
+class SweepWorker(QtCore.QObject, metaclass=ErrorAware):
+    """ Runs a parameter sweep in a separate thread, reporting progress via signals. """
+
+    progress_signal = QtCore.pyqtSignal(int)
+    finished_signal = QtCore.pyqtSignal(bool)
+    error_message_signal = QtCore.pyqtSignal(str)
+
+    def __init__(self, sweep, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sweep = sweep
+
+    @QtCore.pyqtSlot()
+    def run(self):
+        """ Evaluate all parameters. The signal `finished_signal` is emitted with `True`
+        if all parameters were evaluated, and `False` otherwise. """
+        completed = 0
+        try:
+            for _ in self.sweep.run():
+                completed += 1
+                self.progress_signal.emit(completed)
+        finally:
+            self.finished_signal.emit(completed == len(self.sweep))
+
+
+class SweepDialog(QtWidgets.QDialog, metaclass=ErrorAware):
+    """ Dialog to sweep baseline parameters, and compare the resulting baselines. """
+
+    parameters_selected_signal = QtCore.pyqtSignal(dict)
+    error_message_signal = QtCore.pyqtSignal(str)
+
+    def __init__(self, abscissa, data, params, choices, background_regions=None, **kwargs):
+        """
+        Parameters
+        ----------
+        abscissa, data : `~numpy.ndarray`, ndim 1
+            Spectrum for which baselines are computed.
+        params : dict
+            Current baseline parameters, which are selected initially.
+        choices : dict
+            Names of wavelets available for the first stage ('first_stage') and for
+            other stages ('wavelet'), and of signal extension modes ('mode').
+        background_regions : iterable or None, optional
+            Indices of the data values that are known to be purely background.
+        """
+        super().__init__(**kwargs)
+        self.setWindowTitle("Parameter sweep")
+
+        self.abscissa = abscissa
+        self.data = data
+        self.params = dict(params)
+        self.background_regions = list(background_regions or [])
+
+        self._sweep = None
+        self._worker = None
+        self._worker_thread = None
+
+        explanation = QtWidgets.QLabel(EXPLANATION, parent=self)
+        explanation.setWordWrap(True)
+
+        # Multiple values of wavelets and modes can be selected
+        self.choice_widgets = dict()
+        for key in ("first_stage", "wavelet", "mode"):
+            widget = QtWidgets.QListWidget(parent=self)
+            widget.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
+            widget.addItems(choices.get(key, [params[key]]))
+            for item in widget.findItems(params[key], QtCore.Qt.MatchExactly):
+                item.setSelected(True)
+            self.choice_widgets[key] = widget
+
+        self.level_widget = QtWidgets.QLineEdit(str(params["level"]), parent=self)
+        self.max_iter_widget = QtWidgets.QLineEdit(str(params["max_iter"]), parent=self)
+        for widget in (self.level_widget, self.max_iter_widget):
+            widget.setToolTip("Comma-separated values or ranges, e.g. 1, 2, 5-8")
+
+        self.workers_widget = QtWidgets.QSpinBox(parent=self)
+        self.workers_widget.setRange(1, os.cpu_count() or 1)
+        self.workers_widget.setValue(os.cpu_count() or 1)
+
+        form = QtWidgets.QFormLayout()
+        form.addRow("First stage wavelets: ", self.choice_widgets["first_stage"])
+        form.addRow("Dual-tree wavelets: ", self.choice_widgets["wavelet"])
+        form.addRow("Extension modes: ", self.choice_widgets["mode"])
+        form.addRow("Decomposition levels: ", self.level_widget)
+        form.addRow("Iterations: ", self.max_iter_widget)
+        form.addRow("Worker processes: ", self.workers_widget)
+
+        self.progress_bar = QtWidgets.QProgressBar(parent=self)
+        self.progress_bar.setValue(0)
+
+        self.run_btn = QtWidgets.QPushButton("Run sweep", parent=self)
+        self.run_btn.clicked.connect(self.run_sweep)
+
+        self.save_btn = QtWidgets.QPushButton("Save results", parent=self)
+        self.save_btn.clicked.connect(self.save_results)
+        self.save_btn.setEnabled(False)
+
+        self.use_btn = QtWidgets.QPushButton("Use selected parameters", parent=self)
+        self.use_btn.clicked.connect(self.use_selected_parameters)
+        self.use_btn.setEnabled(False)
+        if not self.background_regions:
+            self.use_btn.setToolTip(UNRANKED_TOOLTIP)
+
+        close_btn = QtWidgets.QPushButton("Close", parent=self)
+        close_btn.clicked.connect(self.reject)
+
+        # Results are shown as small multiples, or overlaid
+        self.multiples_widget = pg.GraphicsLayoutWidget(parent=self)
+        self.overlay_widget = pg.PlotWidget(
+            parent=self, labels={"left": "Ordinate", "bottom": "Abscissa"}
+        )
+        self._prepare_plot(self.overlay_widget.getPlotItem())
+        self._overlay_items = dict()
+
+        views = QtWidgets.QTabWidget(parent=self)
+        views.addTab(self.multiples_widget, "Grid")
+        views.addTab(self.overlay_widget, "Overlay")
+
+        self.results_table = QtWidgets.QTableWidget(0, len(COLUMNS), parent=self)
+        self.results_table.setHorizontalHeaderLabels(COLUMNS)
+        self.results_table.verticalHeader().hide()
+        self.results_table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.results_table.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self.results_table.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+        self.results_table.itemSelectionChanged.connect(self._highlight_selection)
+
+        controls = QtWidgets.QVBoxLayout()
+        controls.addWidget(explanation)
+        controls.addLayout(form)
+        controls.addWidget(self.progress_bar)
+        controls.addWidget(self.run_btn)
+
+        results = QtWidgets.QSplitter(QtCore.Qt.Vertical, parent=self)
+        results.addWidget(views)
+        results.addWidget(self.results_table)
+
+        btns = QtWidgets.QHBoxLayout()
+        btns.addStretch(1)
+        btns.addWidget(self.save_btn)
+        btns.addWidget(self.use_btn)
+        btns.addWidget(close_btn)
+
+        top = QtWidgets.QHBoxLayout()
+        top.addLayout(controls)
+        top.addWidget(results, stretch=1)
+
+        layout = QtWidgets.QVBoxLayout()
+        layout.addLayout(top)
+        layout.addLayout(btns)
+        self.setLayout(layout)
+        self.resize(1200, 800)
+
+    @staticmethod
+    def _prepare_plot(plot_item):
+        """ Plots of large spectra are decimated, see DataViewer """
+        plot_item.setClipToView(True)
+        plot_item.setDownsampling(auto=True, mode="peak")
+
+    def sweep_values(self):
+        """ Returns a dictionary of parameter names to lists of values """
+        values = {
+            key: [item.text() for item in widget.selectedItems()]
+            for key, widget in self.choice_widgets.items()
+        }
+        values["level"] = parse_integers(self.level_widget.text())
+        values["max_iter"] = parse_integers(self.max_iter_widget.text())
+        return values
+
+    @QtCore.pyqtSlot()
+    def run_sweep(self):
+        if self._worker_thread is not None:
+            return
+
+        fixed = dict(self.params, background_regions=self.background_regions)
+        self._sweep = ParameterSweep(
+            self.data,
+            self.sweep_values(),
+            params=fixed,
+            workers=self.workers_widget.value(),
+        )
+
+        self.progress_bar.setRange(0, len(self._sweep))
+        self.progress_bar.setValue(0)
+        self.run_btn.setEnabled(False)
+        self.save_btn.setEnabled(False)
+        self.use_btn.setEnabled(False)
+
+        # The sweep is run in a separate thread so that the dialog stays responsive.
+        # The worker thread itself dispatches parameters to a pool of processes
+        self._worker = SweepWorker(self._sweep)
+        self._worker_thread = QtCore.QThread(parent=self)
+        self._worker.moveToThread(self._worker_thread)
+
+        self._worker.progress_signal.connect(self.progress_bar.setValue)
+        self._worker.error_message_signal.connect(self.error_message_signal)
+        self._worker.finished_signal.connect(self._sweep_finished)
+        self._worker_thread.started.connect(self._worker.run)
+        self._worker_thread.start()
+
+    @QtCore.pyqtSlot()
+    def reject(self):
+        # If a sweep is underway, the first click on 'Close' stops it.
+        if self._worker_thread is not None:
+            self._sweep.cancel()
+            return
+        super().reject()
+
+    @QtCore.pyqtSlot(bool)
+    def _sweep_finished(self, completed):
+        self._worker_thread.quit()
+        self._worker_thread.wait()
+        self._worker_thread = None
+        self._worker = None
+
+        self.run_btn.setEnabled(True)
+        self.save_btn.setEnabled(True)
+        self.show_results()
+
+    def show_results(self):
+        """ Display baselines of the sweep, and their residuals. Without background
+        regions, residuals are not shown, since they do not rank baselines. """
+        sweep = self._sweep
+        ranking = [i for i in sweep.ranking() if np.isfinite(sweep.residuals[i])]
+        residuals = {
+            index: "{:.4g}".format(sweep.residuals[index]) if sweep.ranked else "-"
+            for index in ranking
+        }
+
+        self.results_table.setRowCount(len(ranking))
+        for row, index in enumerate(ranking):
+            params = sweep.grid[index]
+            values = [
+                params["first_stage"],
+                params["wavelet"],
+                params["mode"],
+                str(params["level"]),
+                str(params["max_iter"]),
+                residuals[index],
+            ]
+            for column, value in enumerate(values):
+                item = QtWidgets.QTableWidgetItem(value)
+                item.setData(QtCore.Qt.UserRole, int(index))
+                self.results_table.setItem(row, column, item)
+
+        # Small multiples of the best (or first) baselines share the same axes
+        self.multiples_widget.clear()
+        shown = ranking[:MAX_MULTIPLES]
+        columns = max(1, math.ceil(math.sqrt(len(shown))))
+        first = None
+        for position, index in enumerate(shown):
+            params = sweep.grid[index]
+            plot_item = self.multiples_widget.addPlot(
+                row=position // columns,
+                col=position % columns,
+                title="{}/{} {} L{} N{}: {}".format(
+                    params["first_stage"],
+                    params["wavelet"],
+                    params["mode"],
+                    params["level"],
+                    params["max_iter"],
+                    residuals[index],
+                ),
+            )
+            self._prepare_plot(plot_item)
+            plot_item.hideAxis("left")
+            plot_item.hideAxis("bottom")
+            plot_item.plot(self.abscissa, self.data, pen=pg.mkPen(0.5))
+            plot_item.plot(self.abscissa, sweep.baselines[index], pen=pg.mkPen("r"))
+            if first is None:
+                first = plot_item
+            else:
+                plot_item.setXLink(first)
+                plot_item.setYLink(first)
+
+        # Overlaid baselines are colored from the smallest to the largest residual,
+        # or in the order they were requested
+        overlay = self.overlay_widget.getPlotItem()
+        overlay.clear()
+        overlay.plot(self.abscissa, self.data, pen=pg.mkPen(0.5))
+        self._overlay_items = dict()
+        for rank, index in enumerate(ranking):
+            self._overlay_items[index] = overlay.plot(
+                self.abscissa,
+                sweep.baselines[index],
+                pen=pg.mkPen(pg.intColor(rank, hues=max(len(ranking), 1))),
+            )
+
+        # Without background regions, no baseline is selected by default
+        if ranking and sweep.ranked:
+            self.results_table.selectRow(0)
+
+    @QtCore.pyqtSlot()
+    def _highlight_selection(self):
+        selected = self._selected_index()
+        for index, item in self._overlay_items.items():
+            pen = item.opts["pen"]
+            pen = pg.mkPen(pen.color(), width=3 if index == selected else 1)
+            item.setPen(pen)
+            item.setZValue(1 if index == selected else 0)
+        ranked = self._sweep is not None and self._sweep.ranked
+        self.use_btn.setEnabled(ranked and selected is not None)
+
+    def _selected_index(self):
+        """ Index in the sweep grid of the selected result, if any """
+        items = self.results_table.selectedItems()
+        if not items:
+            return None
+        return items[0].data(QtCore.Qt.UserRole)
+
+    @QtCore.pyqtSlot()
+    def use_selected_parameters(self):
+        index = self._selected_index()
+        if index is None:
+            return
+        params = dict(self._sweep.grid[index])
+        params.pop("background_regions", None)
+        self.parameters_selected_signal.emit(params)
+        self.accept()
+
+    @QtCore.pyqtSlot()
+    def save_results(self):
+        fname = QtWidgets.QFileDialog.getSaveFileName(
+            parent=self, caption="Save sweep results", filter="NumPy archive (*.npz)"
+        )[0]
+        if fname:
+            self._sweep.save(fname)
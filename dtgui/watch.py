@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+Watch folders, where spectra are processed as they are written into a directory,
+e.g. by an instrument. This module does not depend on Qt.
+
+Directories are polled, which works on every platform and file system, including
+network shares on which file system notifications are unreliable.
+"""
+import os
+import os.path
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from fnmatch import fnmatch
+
+from . import instrumentation
+from .engine import _timed_call, _warm_up, process_files, processed_filename
+from .manifest import Manifest, parameters_digest
+
+# Interval between polls of watched directories, in seconds
+POLL_INTERVAL = 0.2
+
+# Minimum interval between writes of the manifest, in seconds
+MANIFEST_SAVE_INTERVAL = 5
+
+
+class DirectoryWatcher:
+    """
+    Detection of new or modified files in a directory. Files are only reported once
+    their size and modification time have not changed for some time, so that files
+    which are being written are not reported. Hidden files, such as temporary
+    files, are ignored.
+
+    Parameters
+    ----------
+    directory : str
+        Directory to watch. Subdirectories are not watched.
+    pattern : str, optional
+        Shell-style pattern of filenames to report, e.g. '*.csv'.
+    settle : float, optional
+        Time during which files must not change before they are reported, in seconds.
+    """
+
+    def __init__(self, directory, pattern="*.csv", settle=POLL_INTERVAL):
+        self.directory = directory
+        self.pattern = pattern
+        self.settle = settle
+        # Files which have not been reported yet, with their size and modification
+        # time as of the last poll, and the time since which they are unchanged
+        self._candidates = dict()
+        # Files which have been reported, with their size and modification time
+        # when reported
+        self._reported = dict()
+
+    def poll(self):
+        """
+        Files which are new, or were modified since they were reported, and which have
+        not changed for at least `settle` seconds, as observed by previous polls.
+
+        Returns
+        -------
+        fnames : list of str
+            Paths to the files, from the least to the most recently modified.
+        """
+        current = dict()
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.startswith(".") or not fnmatch(entry.name, self.pattern):
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                except OSError:
+                    # File removed since the directory was scanned
+                    continue
+                current[entry.path] = (stat.st_size, stat.st_mtime_ns)
+
+        now = time.monotonic()
+        ready, candidates = list(), dict()
+        for fname, signature in current.items():
+            if self._reported.get(fname) == signature:
+                continue
+            previous, since = self._candidates.get(fname, (None, now))
+            if previous != signature:
+                since = now
+            if (previous == signature) and (now - since >= self.settle):
+                ready.append(fname)
+                self._reported[fname] = signature
+            else:
+                candidates[fname] = (signature, since)
+
+        self._candidates = candidates
+        # Files which are removed, then written again, are reported again
+        self._reported = {
+            fname: signature
+            for fname, signature in self._reported.items()
+            if fname in current
+        }
+        return sorted(ready, key=lambda fname: current[fname][1])
+
+
+class WatchFolder:
+    """
+    Baseline-removal of spectra as they are written into a directory, in a pool of
+    worker processes. Files are processed one by one, as soon as they are complete.
+
+    Processed files are recorded in the manifest of the output directory (see
+    :class:`dtgui.manifest.Manifest`). Files which are already in the watched
+    directory are processed as well, unless they are up-to-date.
+
+    Parameters
+    ----------
+    directory : str
+        Directory to watch.
+    output : str
+        Directory in which to save the processed files. It must differ from
+        the watched directory.
+    params : dict
+        Dictionary of parameters passed to baseline_dt.
+    pattern : str, optional
+        Shell-style pattern of filenames to process. Default is '*.csv'.
+    workers : int or None, optional
+        Number of worker processes. If None (default), the number of CPUs is used.
+    initializer : callable or None, optional
+        Callable run at the start of every worker process.
+    extension : str, optional
+        Extension of the processed files, which determines the file format.
+        Default is '.csv'.
+    compression : str or None, optional
+        Compression filter for the file formats that support it, e.g. 'gzip' for HDF5.
+    interval : float, optional
+        Interval between polls of the watched directory, in seconds.
+    timings : `~dtgui.instrumentation.Timings` or None, optional
+        Collection in which the processing time of every file is recorded, as
+        'watch file' spans. If None (default), timings of the current process are used.
+
+    Raises
+    ------
+    ValueError : if processed files would be written into the watched directory.
+    """
+
+    def __init__(
+        self,
+        directory,
+        output,
+        params,
+        pattern="*.csv",
+        workers=None,
+        initializer=None,
+        extension=".csv",
+        compression=None,
+        interval=POLL_INTERVAL,
+        timings=None,
+    ):
+        if os.path.abspath(directory) == os.path.abspath(output):
+            raise ValueError(
+                "Processed files cannot be written into the watched directory"
+            )
+        self.watcher = DirectoryWatcher(directory, pattern=pattern)
+        self.output = output
+        self.params = dict(params)
+        self.workers = workers or os.cpu_count() or 1
+        self.initializer = initializer
+        self.extension = extension
+        self.compression = compression
+        self.interval = interval
+        if timings is None:
+            timings = instrumentation.timings
+        self.timings = timings
+        self._stopped = False
+
+    def stop(self):
+        """ Stop watching. Files currently being processed are completed, but
+        pending files are not processed. This method can be called from any thread. """
+        self._stopped = True
+
+    @property
+    def stopped(self):
+        return self._stopped
+
+    def run(self):
+        """
+        Watch the directory, and process files as they are written, until
+        :meth:`stop` is called. This is a generator, which yields after every poll.
+
+        Yields
+        ------
+        completed : list of 2-tuples of str
+            Path of the input file and of the processed file of every file
+            completed since the previous poll.
+        failed : list of 2-tuples of str
+            Path of the input file and error message of every file which could not
+            be processed since the previous poll. Failed files are processed again
+            if they are modified.
+        """
+        self._stopped = False
+        manifest = Manifest(self.output)
+        params = dict(self.params, compression=self.compression)
+        digest = parameters_digest(params)
+        last_saved = time.perf_counter()
+
+        # Dependencies are imported before worker processes are started
+        _warm_up()
+
+        with ProcessPoolExecutor(
+            max_workers=self.workers, initializer=self.initializer
+        ) as executor:
+            # Workers are started right away, rather than when the first file arrives
+            for _ in range(self.workers):
+                executor.submit(_warm_up)
+
+            pending = dict()
+            next_poll = time.monotonic()
+            try:
+                while not self._stopped:
+                    # Files are submitted one by one, as soon as they are complete,
+                    # which minimizes the latency between writing and processing
+                    if time.monotonic() >= next_poll:
+                        next_poll = time.monotonic() + self.interval
+                        for fname in self.watcher.poll():
+                            output = processed_filename(
+                                fname, self.output, self.extension
+                            )
+                            # Files might be renamed or removed since they were
+                            # reported, e.g. temporary files of some instruments
+                            try:
+                                stat = os.stat(fname)
+                                if manifest.is_current(output, digest, [fname]):
+                                    continue
+                            except OSError:
+                                continue
+                            future = executor.submit(
+                                _timed_call,
+                                process_files,
+                                [fname],
+                                self.output,
+                                self.params,
+                                self.extension,
+                                self.compression,
+                            )
+                            pending[future] = (fname, stat)
+
+                    # Completed files are collected until the next poll
+                    timeout = max(0, next_poll - time.monotonic())
+                    if pending:
+                        done, _ = wait(
+                            pending, timeout=timeout, return_when=FIRST_COMPLETED
+                        )
+                    else:
+                        time.sleep(timeout)
+                        done = set()
+
+                    completed, failed = list(), list()
+                    for future in done:
+                        fname, stat = pending.pop(future)
+                        try:
+                            (processed_fname,), elapsed = future.result()
+                        except Exception as e:
+                            failed.append((fname, str(e)))
+                            continue
+                        self.timings.record("watch file", elapsed)
+                        manifest.record(
+                            processed_fname, params, [fname], stats={fname: stat}
+                        )
+                        completed.append((fname, processed_fname))
+
+                    if time.perf_counter() - last_saved > MANIFEST_SAVE_INTERVAL:
+                        manifest.save()
+                        last_saved = time.perf_counter()
+
+                    yield completed, failed
+            finally:
+                for future in pending:
+                    future.cancel()
+                manifest.save()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import os.path
+import time
+
+from PyQt5 import QtCore
+
+from .error_aware import ErrorAware
+
+# Minimum interval between displays of the latest processed spectrum, in seconds.
+# Files may be processed faster than they can be plotted.
+DISPLAY_INTERVAL = 0.5
+
+
+class WatchWorker(QtCore.QObject, metaclass=ErrorAware):
+    """
+    Runs a watch folder in a separate thread, reporting processed files via signals.
+    Only the latest processed file is reported for display, at most every
+    `DISPLAY_INTERVAL` seconds.
+    """
+
+    file_processed_signal = QtCore.pyqtSignal(str, str)
+    display_signal = QtCore.pyqtSignal(str, str)
+    status_message_signal = QtCore.pyqtSignal(str)
+    finished_signal = QtCore.pyqtSignal()
+    error_message_signal = QtCore.pyqtSignal(str)
+
+    def __init__(self, folder, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.folder = folder
+
+    def stop(self):
+        """ Stop watching. This method can be called from any thread. """
+        self.folder.stop()
+
+    @QtCore.pyqtSlot()
+    def run(self):
+        """ Watch the folder until :meth:`stop` is called. The signal `finished_signal`
+        is emitted once files being processed are completed. """
+        processed = 0
+        latest, last_displayed = None, 0
+        try:
+            for completed, failed in self.folder.run():
+                for fname, message in failed:
+                    self.error_message_signal.emit(
+                        "{} could not be processed: {}".format(fname, message)
+                    )
+
+                for fname, processed_fname in completed:
+                    self.file_processed_signal.emit(fname, processed_fname)
+                if completed:
+                    processed += len(completed)
+                    latest = completed[-1]
+                    self.status_message_signal.emit(
+                        "Watching {}: {} files processed, latest is {}".format(
+                            self.folder.watcher.directory,
+                            processed,
+                            os.path.basename(latest[0]),
+                        )
+                    )
+
+                # Intermediate files are not displayed if files arrive quickly
+                now = time.perf_counter()
+                if (latest is not None) and (now - last_displayed >= DISPLAY_INTERVAL):
+                    self.display_signal.emit(*latest)
+                    latest, last_displayed = None, now
+        finally:
+            self.finished_signal.emit()
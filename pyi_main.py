@@ -1,4 +1,8 @@
+from multiprocessing import freeze_support
+
 from dtgui.gui import run
 
 if __name__ == "__main__":
+    # Required for batch processing in worker processes from a frozen executable
+    freeze_support()
     run()
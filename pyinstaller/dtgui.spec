@@ -27,13 +27,16 @@ a = Analysis([os.path.join(basepath, 'pyi_main.py'), ],
 
 pyz = PYZ(a.pure, a.zipped_data, cipher=None)
 
+# The executable is built as a directory (see COLLECT below) rather than as a single file,
+# which would be unpacked into a temporary directory at every launch.
+# The debug bootloader is not used, since it slows down startup.
 exe = EXE(pyz,
           a.scripts,
           a.binaries,
           a.zipfiles,
           a.datas,
           name='dtgui',
-          debug=True,
+          debug=False,
           strip=False,
           upx=False,
           console=True,
@@ -44,6 +44,7 @@ if __name__ == "__main__":
         author_email=AUTHOR_EMAIL,
         maintainer=AUTHOR,
         maintainer_email=AUTHOR_EMAIL,
+        python_requires=">=3.8",
         install_requires=REQUIREMENTS,
         keywords=["dtgui"],
         packages=PACKAGES,
@@ -58,7 +59,6 @@ if __name__ == "__main__":
             "Natural Language :: English",
             "Operating System :: OS Independent",
             "Programming Language :: Python",
-            "Programming Language :: Python :: 3.5",
-            "Programming Language :: Python :: 3.6",
+            "Programming Language :: Python :: 3.8",
         ],
     )